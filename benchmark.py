@@ -0,0 +1,408 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+
+import roman
+import requests
+import pandas as pd
+
+import dart_api
+import dart_parser
+import metadata_store
+import synthetic
+from section_index import decode_section, iter_sections
+from tables import tables_frame
+
+DATASET_DIR = dart_parser.DATASET_DIR
+RESULTS_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'benchmarks', 'results.jsonl')
+
+
+SECTIONS_PER_FILING = 50
+
+
+def synthetic_metadata(n_rows: int, raw_filings_folder: str):
+    """
+    FILINGS_METADATA-like rows (one per sub-document) for n_rows / 50 filings,
+    with an empty raw file created for every other filing
+    """
+    n_filings = max(1, n_rows // SECTIONS_PER_FILING)
+    rcept_nos = [f'2023{i:010d}' for i in range(n_filings)]
+    filenames = [f'000000_A001_2023_{r}_20230301.html' for r in rcept_nos]
+    for filename in filenames[::2]:
+        open(os.path.join(raw_filings_folder, filename), 'w').close()
+
+    metadata = pd.DataFrame({
+        'title': ['section'] * n_filings * SECTIONS_PER_FILING,
+        'url': ['http://dart.fss.or.kr/report/viewer.do'] * n_filings * SECTIONS_PER_FILING,
+        'rcept_no': [r for r in rcept_nos for _ in range(SECTIONS_PER_FILING)],
+        'filename': [f for f in filenames for _ in range(SECTIONS_PER_FILING)],
+    })
+    # 절반은 이미 받은 공시, 나머지 절반은 새 공시
+    indices = pd.DataFrame({'rcept_no': rcept_nos + [f'2024{i:010d}' for i in range(n_filings)]})
+    return metadata, indices
+
+
+def verify_extracted() -> bool:
+    """
+    Re-extracts the sample RAW_FILINGS and checks the items are identical to
+    the stored EXTRACTED_FILINGS json files
+    """
+    raw_filings_folder = os.path.join(DATASET_DIR, 'RAW_FILINGS')
+    extracted_filings_folder = os.path.join(DATASET_DIR, 'EXTRACTED_FILINGS')
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        store = metadata_store.MetadataStore(os.path.join(tmp_dir, 'METADATA.sqlite'))
+        store.import_legacy(os.path.join(DATASET_DIR, 'FILINGS_METADATA.csv'), os.path.join(DATASET_DIR, 'companies_info.json'))
+        filings = store.filings()
+        store.close()
+
+        identical = True
+        for _, filing in filings.iterrows():
+            json_filepath = os.path.join(extracted_filings_folder, f'{filing["filename"].split(".")[0]}.json')
+            if not os.path.exists(os.path.join(raw_filings_folder, filing['filename'])) or not os.path.exists(json_filepath):
+                continue
+            with open(json_filepath, encoding='utf-8') as f:
+                expected = json.load(f)
+            extraction = dart_parser.ExtractItems(
+                remove_tables=True,
+                items_to_extract=[roman.fromRoman(key[5:]) for key in expected if key.startswith('item_')],
+                raw_files_folder=raw_filings_folder,
+                extracted_files_folder=tmp_dir,
+                skip_extracted_filings=False,
+                metadata_db_path=os.path.join(tmp_dir, 'METADATA.sqlite'),
+            )
+            json_content = extraction.extract_items(filing)
+            different = [key for key in expected if json_content.get(key) != expected[key]]
+            print(f'  {filing["filename"]}: {"identical" if not different else f"DIFFERENT {different}"}')
+            identical &= not different
+        return identical
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def bench_scaling(repeat=8):
+    """
+    process_filing over the sample RAW_FILINGS (each filing `repeat` times)
+    with 1, 2, 4, ... worker processes
+    """
+    raw_filings_folder = os.path.join(DATASET_DIR, 'RAW_FILINGS')
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        store = metadata_store.MetadataStore(os.path.join(tmp_dir, 'METADATA.sqlite'))
+        store.import_legacy(os.path.join(DATASET_DIR, 'FILINGS_METADATA.csv'), os.path.join(DATASET_DIR, 'companies_info.json'))
+        filings = store.filings()
+        store.close()
+        filings = filings[filings['filename'].map(lambda f: os.path.exists(os.path.join(raw_filings_folder, f)))]
+        filings = pd.concat([filings.where(filings.notna(), None)] * repeat, ignore_index=True)
+        extraction_kwargs = dict(
+            remove_tables=True,
+            items_to_extract=['1', '2', '4'],
+            raw_files_folder=raw_filings_folder,
+            extracted_files_folder=tmp_dir,
+            skip_extracted_filings=False,
+            metadata_db_path=os.path.join(tmp_dir, 'METADATA.sqlite'),
+        )
+
+        cpus = os.cpu_count() or 1
+        workers = sorted({1, cpus} | {2 ** i for i in range(1, 8) if 2 ** i < cpus})
+        print(f'extraction of {len(filings)} filings on {cpus} cpus (workers -> seconds, speedup)')
+        baseline = None
+        for n in workers:
+            start = time.perf_counter()
+            dart_parser.extract_filings(filings, extraction_kwargs, workers=n, ordered=False)
+            elapsed = time.perf_counter() - start
+            baseline = baseline or elapsed
+            print(f'  {n:>8}: {elapsed:.2f}s, x{baseline / elapsed:.2f}')
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+BENCHMARKS = {}
+
+
+def benchmark(name: str, unit: str):
+    """
+    Registers a benchmark. The function gets the shared Context and returns
+    (fn, amount): fn is timed, `amount` of `unit` is processed per call
+    """
+    def register(setup):
+        BENCHMARKS[name] = (setup, unit)
+        return setup
+    return register
+
+
+class Context:
+    """
+    Synthetic data shared by the benchmarks, generated once per run
+    """
+
+    def __init__(self, size: int, n_sections: int, n_filings: int):
+        self.params = {'size': size, 'n_sections': n_sections, 'n_filings': n_filings}
+        self.tmp_dir = tempfile.mkdtemp()
+        # close() 에서 호출 (benchmark 가 연 store 등)
+        self.cleanup = []
+        self.raw_filings_folder = os.path.join(self.tmp_dir, 'RAW_FILINGS')
+        self.extracted_filings_folder = os.path.join(self.tmp_dir, 'EXTRACTED_FILINGS')
+        os.makedirs(self.raw_filings_folder)
+        os.makedirs(self.extracted_filings_folder)
+
+        self.filenames = synthetic.write_filings(self.raw_filings_folder, n_filings, size=size, n_sections=n_sections)
+        with open(os.path.join(self.raw_filings_folder, self.filenames[0]), 'rb') as f:
+            self.filing = f.read()
+        self.sections = [decode_section(self.filing[start:end]) for _, start, end in iter_sections(self.filing)]
+
+        self.metadata_db_path = os.path.join(self.tmp_dir, 'METADATA.sqlite')
+        store = metadata_store.MetadataStore(self.metadata_db_path)
+        for filename in self.filenames:
+            stock_code, _, _, rcept_no, rcept_dt = filename.split('.')[0].split('_')
+            store.upsert_filing(pd.DataFrame([{
+                'rcept_no': rcept_no, 'corp_code': f'00{stock_code}', 'corp_name': f'회사{stock_code}',
+                'stock_code': stock_code, 'rcept_dt': rcept_dt, 'year': '2023', 'filing_types': 'A001',
+                'filename': filename, 'title': 'I. 회사의 개요', 'url': 'http://dart.fss.or.kr/report/viewer.do',
+            }]))
+            store.upsert_company(f'00{stock_code}', {'company_name': f'회사{stock_code}'})
+        self.filings = store.filings().where(lambda df: df.notna(), None)
+        store.close()
+
+    def extraction(self, **kwargs) -> dart_parser.ExtractItems:
+        return dart_parser.ExtractItems(**{
+            'remove_tables': True,
+            'items_to_extract': ['1', '2', '4'],
+            'raw_files_folder': self.raw_filings_folder,
+            'extracted_files_folder': self.extracted_filings_folder,
+            'skip_extracted_filings': False,
+            'metadata_db_path': self.metadata_db_path,
+            **kwargs,
+        })
+
+    def close(self):
+        for fn in self.cleanup:
+            fn()
+        shutil.rmtree(self.tmp_dir)
+
+
+@benchmark('split_sections', 'MB')
+def bench_split_sections(ctx):
+    return lambda: list(iter_sections(ctx.filing)), len(ctx.filing) / 1e6
+
+
+def _section_stage(ctx, fn):
+    size = sum(len(section.encode()) for section in ctx.sections) / 1e6
+    return lambda: [fn(section) for section in ctx.sections], size
+
+
+@benchmark('strip_html', 'MB')
+def bench_strip_html(ctx):
+    return _section_stage(ctx, dart_parser.ExtractItems.strip_html)
+
+
+@benchmark('clean_text', 'MB')
+def bench_clean_text(ctx):
+    texts = [dart_parser.ExtractItems.strip_html(section) for section in ctx.sections]
+    size = sum(len(text.encode()) for text in texts) / 1e6
+    return lambda: [dart_parser.ExtractItems.clean_text(text) for text in texts], size
+
+
+@benchmark('remove_multiple_lines', 'MB')
+def bench_remove_multiple_lines(ctx):
+    texts = [dart_parser.ExtractItems.clean_text(dart_parser.ExtractItems.strip_html(s)) for s in ctx.sections]
+    size = sum(len(text.encode()) for text in texts) / 1e6
+    return lambda: [dart_parser.ExtractItems.remove_multiple_lines(text) for text in texts], size
+
+
+@benchmark('remove_tables', 'MB')
+def bench_remove_tables(ctx):
+    return _section_stage(ctx, lambda section: dart_parser.HtmlTextExtractor(remove_tables=True).strip_tags(section))
+
+
+@benchmark('extract_tables', 'MB')
+def bench_extract_tables(ctx):
+    def parse(section):
+        parser = dart_parser.HtmlTextExtractor(remove_tables=False, collect_tables=True)
+        parser.strip_tags(section)
+        return tables_frame(parser.tables, '0', 'I')
+    return _section_stage(ctx, parse)
+
+
+@benchmark('process_filing', 'filings')
+def bench_process_filing(ctx):
+    extraction = ctx.extraction()
+    filings = [filing for _, filing in ctx.filings.iterrows()]
+    return lambda: [extraction.process_filing(filing) for filing in filings], len(filings)
+
+
+@benchmark('plan_extraction', 'filings')
+def bench_plan_extraction(ctx):
+    # 이미 추출된 상태에서 다시 추출할 공시를 고르는 비용 (dart_parser.main)
+    extraction = ctx.extraction(skip_extracted_filings=True)
+    for _, filing in ctx.filings.iterrows():
+        extraction.process_filing(filing)
+    return lambda: dart_parser.plan_extraction(ctx.filings, extraction), len(ctx.filings)
+
+
+def bench_plan_downloads(n_rows: int):
+    """
+    Picking the filings to download in dart_crawler.main, against `n_rows`
+    metadata rows (registered for several sizes to see how it scales)
+    """
+    def setup(ctx):
+        tmp_dir = os.path.join(ctx.tmp_dir, f'plan_downloads_{n_rows}')
+        os.makedirs(tmp_dir)
+        metadata, indices = synthetic_metadata(n_rows, tmp_dir)
+        store = metadata_store.MetadataStore(os.path.join(tmp_dir, 'METADATA.sqlite'))
+        ctx.cleanup.append(store.close)
+        for _, filing in metadata.groupby('rcept_no', sort=False):
+            store.upsert_filing(filing)
+        return lambda: metadata_store.plan_downloads(indices, store, tmp_dir), n_rows
+    return setup
+
+
+for _n_rows in (10_000, 200_000):
+    benchmark(f'plan_downloads_{_n_rows // 1000}k', 'rows')(bench_plan_downloads(_n_rows))
+
+
+@benchmark('download_corp_document', 'pages')
+def bench_download_corp_document(ctx, total_page=20, latency=0.02):
+    """
+    list.json pagination against an in-process stub answering every page
+    after `latency` seconds
+    """
+    def stub(url, params=None, headers=None):
+        time.sleep(latency)
+        page_no = (params or {}).get('page_no', 1)
+        r = requests.Response()
+        r.status_code = 200
+        r._content = json.dumps({
+            'status': '000', 'message': '정상', 'page_no': page_no, 'total_page': total_page,
+            'list': [{'rcept_no': f'{page_no:04d}{i:010d}', 'corp_code': '00126380'} for i in range(100)],
+        }).encode()
+        return r
+
+    def run():
+        make_api_call = dart_api.make_api_call
+        dart_api.make_api_call = stub
+        try:
+            return dart_api.download_corp_document({'page_count': 100})
+        finally:
+            dart_api.make_api_call = make_api_call
+    return run, total_page
+
+
+def run_benchmarks(ctx, names=None, repeat=3):
+    """
+    :return: name -> {'seconds': best of `repeat`, 'rate': amount per second, 'unit'}
+    """
+    results = {}
+    for name, (setup, unit) in BENCHMARKS.items():
+        if names and not any(pattern in name for pattern in names):
+            continue
+        fn, amount = setup(ctx)
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - start)
+        best = min(timings)
+        results[name] = {'seconds': best, 'rate': amount / best, 'unit': unit}
+        print(f'  {name:>24}: {best:.3f}s, {amount / best:,.1f} {unit}/s')
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.realpath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def load_results(params):
+    """
+    Earlier runs with the same synthetic data parameters, oldest first
+    """
+    if not os.path.exists(RESULTS_FILE):
+        return []
+    with open(RESULTS_FILE, encoding='utf-8') as f:
+        runs = [json.loads(line) for line in f if line.strip()]
+    return [run for run in runs if run['params'] == params]
+
+
+def save_results(params, results):
+    os.makedirs(os.path.dirname(RESULTS_FILE), exist_ok=True)
+    run = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'params': params,
+        'results': results,
+    }
+    with open(RESULTS_FILE, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(run) + '\n')
+
+
+def compare(previous, results, threshold):
+    """
+    Prints the change against the previous run
+
+    :return: names of the benchmarks slower by more than `threshold` (0.1 = 10%)
+    """
+    print(f"compared with {previous['commit'] or 'unknown commit'} ({previous['timestamp']})")
+    regressions = []
+    for name, result in results.items():
+        if name not in previous['results']:
+            continue
+        change = result['seconds'] / previous['results'][name]['seconds'] - 1
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print(f'  {name:>24}: {change:+.1%}{flag}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks of the crawl and extraction hot paths')
+    parser.add_argument('names', nargs='*', help='run only the benchmarks whose name contains one of these')
+    parser.add_argument('--size', type=int, default=3_500_000, help='bytes per synthetic filing')
+    parser.add_argument('--sections', type=int, default=40, help='sections per synthetic filing')
+    parser.add_argument('--filings', type=int, default=4, help='number of synthetic filings')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--threshold', type=float, default=0.1, help='slowdown reported as a regression')
+    parser.add_argument('--no-save', action='store_true', help='do not append the results to ' + RESULTS_FILE)
+    parser.add_argument('--verify', action='store_true', help='check the extraction of the sample RAW_FILINGS first')
+    parser.add_argument('--scaling', action='store_true', help='also time extraction with 1, 2, 4, ... processes')
+    args = parser.parse_args()
+
+    if args.verify:
+        print('verify extracted filings')
+        if not verify_extracted():
+            print('Extraction output changed, benchmark results are not comparable')
+            sys.exit(1)
+
+    ctx = Context(args.size, args.sections, args.filings)
+    try:
+        print(f'benchmarks on {args.filings} synthetic filings of {args.size / 1e6:.1f} MB, {args.sections} sections')
+        results = run_benchmarks(ctx, args.names, args.repeat)
+    finally:
+        ctx.close()
+
+    if args.scaling:
+        bench_scaling()
+
+    previous = load_results(ctx.params)
+    regressions = compare(previous[-1], results, args.threshold) if previous else []
+    if not args.no_save:
+        save_results(ctx.params, results)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
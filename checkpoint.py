@@ -0,0 +1,107 @@
+import os
+import json
+import shutil
+from urllib.parse import urlparse, parse_qs
+
+from typing import List, Optional, Tuple
+
+from compression import COMPRESSION_SUFFIXES, compress
+from section_index import META_CHARSET_RE, declared_charset, is_utf8
+
+
+def response_encoding(response) -> str:
+    """
+    Charset of a sub-document: the Content-Type header, else the <meta>
+    charset, else utf-8 (requests' ISO-8859-1 default for text/* is not used)
+    """
+    content_type = response.headers.get('Content-Type', '')
+    if 'charset=' in content_type.lower():
+        return response.encoding
+    return declared_charset(response.content) or 'utf-8'
+
+
+def to_utf8(content: bytes, encoding: str) -> bytes:
+    """
+    Sub-document re-encoded as utf-8 (with its <meta> charset updated), so
+    an assembled filing has a single charset; utf-8 content is kept as is
+    """
+    if is_utf8(encoding):
+        return content
+    text = content.decode(encoding, errors='replace')
+    return META_CHARSET_RE.sub(lambda m: m.group(0)[:m.start(1) - m.start(0)] + b'utf-8',
+                               text.encode('utf-8'), count=1)
+
+
+class SectionCheckpoint:
+    """
+    Per-filing download state. Each finished sub-document is stored in
+    `<raw_filings_folder>/.partial/<rcept_no>/` as received (bytes and
+    charset) and recorded in manifest.json by its dcmNo/eleId, so a retry
+    only fetches the missing sections. The final filing is assembled into a
+    temp file and renamed into place
+    """
+
+    def __init__(self, raw_filings_folder: str, rcept_no: str):
+        self.raw_filings_folder = raw_filings_folder
+        self.rcept_no = rcept_no
+        self.partial_dir = os.path.join(raw_filings_folder, '.partial', rcept_no)
+        self.manifest_path = os.path.join(self.partial_dir, 'manifest.json')
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, encoding='utf-8') as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = {'rcept_no': rcept_no, 'sections': {}}
+
+    @staticmethod
+    def section_key(url: str) -> str:
+        query = parse_qs(urlparse(url).query)
+        return f"{query.get('dcmNo', [''])[0]}/{query.get('eleId', [''])[0]}"
+
+    def is_done(self, url: str) -> bool:
+        entry = self.manifest['sections'].get(self.section_key(url))
+        return entry is not None and os.path.exists(os.path.join(self.partial_dir, entry['file']))
+
+    def save(self, url: str, title: str, content: bytes, encoding: str = 'utf-8') -> None:
+        os.makedirs(self.partial_dir, exist_ok=True)
+        key = self.section_key(url)
+        filename = key.replace('/', '_') + '.html'
+        with open(os.path.join(self.partial_dir, filename), 'wb') as f:
+            f.write(content)
+        self.manifest['sections'][key] = {'title': title, 'file': filename, 'encoding': encoding}
+        self._write_manifest()
+
+    def _write_manifest(self) -> None:
+        tmp = self.manifest_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, indent=4, ensure_ascii=False)
+        os.replace(tmp, self.manifest_path)
+
+    def assemble(self, sections: List[Tuple[str, str]], filename: str, compression: Optional[str] = None) -> str:
+        """
+        Concatenates the saved sections in the given (title, url) order and
+        atomically moves the result to `<raw_filings_folder>/<filename>`.
+        Sections served in another charset are transcoded to utf-8 (see to_utf8)
+
+        :param compression: 'gzip' or 'zstd' to store `<filename>.gz` / `.zst`,
+                            every section (with its delimiter line) compressed
+                            as its own gzip member / zstd frame
+        :return: path of the assembled filing
+        """
+        path = os.path.join(self.raw_filings_folder, filename + COMPRESSION_SUFFIXES[compression])
+        tmp = os.path.join(self.partial_dir, filename + '.tmp')
+        with open(tmp, 'wb') as of:
+            for title, url in sections:
+                entry = self.manifest['sections'][self.section_key(url)]
+                with open(os.path.join(self.partial_dir, entry['file']), 'rb') as f:
+                    content = to_utf8(f.read(), entry.get('encoding', 'utf-8'))
+                data = f"<!-- File: {os.path.basename(title)} -->\n".encode() + content
+                of.write(compress(data, compression))
+        os.replace(tmp, path)
+        # 다른 형식으로 저장된 예전 파일과 그 index 는 지움
+        for suffix in COMPRESSION_SUFFIXES.values():
+            other = os.path.join(self.raw_filings_folder, filename + suffix)
+            for stale in (other, other + '.idx.json'):
+                if other != path and os.path.exists(stale):
+                    os.remove(stale)
+        shutil.rmtree(self.partial_dir, ignore_errors=True)
+        return path
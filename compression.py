@@ -0,0 +1,69 @@
+import io
+import gzip
+import zlib
+import importlib.util
+
+from typing import Optional
+
+
+COMPRESSION_SUFFIXES = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+
+
+def compression_available(compression: Optional[str]) -> bool:
+    return compression != 'zstd' or importlib.util.find_spec('zstandard') is not None
+
+
+def compression_of(path: str) -> Optional[str]:
+    for compression, suffix in COMPRESSION_SUFFIXES.items():
+        if suffix and path.endswith(suffix):
+            return compression
+    return None
+
+
+def compress(data: bytes, compression: Optional[str]) -> bytes:
+    """
+    One gzip member / zstd frame. Concatenated members (frames) are still a
+    valid gzip (zstd) stream, which decompresses to the concatenated data
+    """
+    if compression == 'zstd':
+        import zstandard
+        return zstandard.ZstdCompressor(level=9).compress(data)
+    if compression == 'gzip':
+        return gzip.compress(data, compresslevel=6, mtime=0)
+    return data
+
+
+def decompress(data: bytes, compression: Optional[str]) -> bytes:
+    """
+    Decompresses all the members / frames of `data`
+    """
+    if compression == 'zstd':
+        import zstandard
+        with zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data), read_across_frames=True) as reader:
+            return reader.read()
+    if compression == 'gzip':
+        return gzip.decompress(data)
+    return data
+
+
+def iter_frames(buf, compression: str, chunk_size: int = 1 << 16):
+    """
+    Streams the gzip members / zstd frames of a compressed buffer
+
+    :return: generator of (start, end, decompressed data) with the compressed byte range of every frame
+    """
+    pos = 0
+    while pos < len(buf):
+        if compression == 'zstd':
+            import zstandard
+            decompressor = zstandard.ZstdDecompressor().decompressobj()
+        else:
+            decompressor = zlib.decompressobj(wbits=31)
+        start = pos
+        parts = []
+        while not decompressor.eof and pos < len(buf):
+            chunk = buf[pos:pos + chunk_size]
+            parts.append(decompressor.decompress(chunk))
+            pos += len(chunk)
+        pos -= len(decompressor.unused_data)
+        yield start, pos, b''.join(parts)
@@ -0,0 +1,136 @@
+import re
+import bisect
+import unicodedata
+from collections import Counter
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+
+# 회사 형태 표기는 이름 비교에서 제외 ('㈜' 는 NFKC 정규화로 '(주)' 가 됨)
+CORP_FORM_RE = re.compile(r'\(주\)|\(유\)|\(사\)|주식회사|유한회사|\s+')
+
+
+def normalize_name(name: str) -> str:
+    """
+    '㈜ 삼성 전자', '삼성전자 주식회사' -> '삼성전자'
+    """
+    return CORP_FORM_RE.sub('', unicodedata.normalize('NFKC', name or '')).lower()
+
+
+def bigrams(text: str) -> List[str]:
+    return [text[i:i + 2] for i in range(len(text) - 1)] or [text]
+
+
+class CorpCodeIndex:
+    """
+    Lookup index over the corp code master (dart_api.corp_code_list):
+    exact corp_code / stock_code / normalised name keys resolve in O(1),
+    names can also be searched by prefix or by character bigram similarity.
+
+        index = CorpCodeIndex(corp_codes)
+        index.resolve_many(['005930', '00126380', 'LG에너지솔루션'])
+    """
+
+    def __init__(self, corp_codes: pd.DataFrame):
+        self.corp_code = corp_codes['corp_code'].astype(str).str.strip().tolist()
+        self.corp_name = corp_codes['corp_name'].astype(object).fillna('').astype(str).tolist()
+        self.stock_code = corp_codes['stock_code'].astype(object).fillna('').astype(str).str.strip().tolist()
+        modify_date = corp_codes['modify_date'].astype(object).fillna('').astype(str).tolist() \
+            if 'modify_date' in corp_codes else [''] * len(self.corp_code)
+
+        self.by_corp_code = {code: i for i, code in enumerate(self.corp_code)}
+        self.by_stock_code = {code: i for i, code in enumerate(self.stock_code) if code}
+
+        # 같은 이름의 회사가 여럿이면 상장사, 그 다음 최근에 변경된 회사를 우선
+        self.names = [normalize_name(name) for name in self.corp_name]
+        self.by_name = {}
+        for i in sorted(range(len(self.names)), key=lambda i: (bool(self.stock_code[i]), modify_date[i])):
+            if self.names[i]:
+                self.by_name[self.names[i]] = i
+
+        self.sorted_names = sorted((name, i) for name, i in self.by_name.items())
+        self.name_keys = [name for name, _ in self.sorted_names]
+        self._bigrams = None
+
+    def __len__(self):
+        return len(self.corp_code)
+
+    def _lookup(self, key: str) -> Optional[int]:
+        key = str(key).strip()
+        if key in self.by_corp_code:
+            return self.by_corp_code[key]
+        if key in self.by_stock_code:
+            return self.by_stock_code[key]
+        return self.by_name.get(normalize_name(key))
+
+    def resolve(self, key: str) -> Optional[str]:
+        """
+        corp_code of a corp_code, stock_code or company name (exact match
+        after normalisation)
+        """
+        i = self._lookup(key)
+        return None if i is None else self.corp_code[i]
+
+    def resolve_many(self, keys: Iterable[str], fuzzy: float = None) -> Dict[str, Optional[str]]:
+        """
+        Resolves a batch of keys that may mix corp codes, stock codes and names
+
+        :param fuzzy: if given, names without an exact match resolve to the
+                      most similar name scoring at least `fuzzy` (0..1)
+        :return: key -> corp_code (None if unresolved)
+        """
+        resolved = {}
+        for key in keys:
+            corp_code = self.resolve(key)
+            if corp_code is None and fuzzy is not None:
+                matches = self.fuzzy(key, limit=1, min_score=fuzzy)
+                corp_code = matches[0][0] if matches else None
+            resolved[key] = corp_code
+        return resolved
+
+    def record(self, corp_code: str) -> Optional[Dict]:
+        i = self.by_corp_code.get(corp_code)
+        if i is None:
+            return None
+        return {'corp_code': self.corp_code[i], 'corp_name': self.corp_name[i], 'stock_code': self.stock_code[i]}
+
+    def prefix(self, prefix: str, limit: int = 20) -> List[Tuple[str, str]]:
+        """
+        (corp_code, corp_name) of the companies whose normalised name starts with `prefix`
+        """
+        prefix = normalize_name(prefix)
+        start = bisect.bisect_left(self.name_keys, prefix)
+        matches = []
+        for name, i in self.sorted_names[start:start + limit]:
+            if not name.startswith(prefix):
+                break
+            matches.append((self.corp_code[i], self.corp_name[i]))
+        return matches
+
+    def fuzzy(self, name: str, limit: int = 5, min_score: float = 0.5) -> List[Tuple[str, str, float]]:
+        """
+        Companies with a similar name (Dice coefficient of character bigrams,
+        which works for Korean names without a tokenizer)
+
+        :return: (corp_code, corp_name, score) by decreasing score
+        """
+        if self._bigrams is None:
+            self._bigrams = {}
+            for name_key, i in self.by_name.items():
+                for gram in set(bigrams(name_key)):
+                    self._bigrams.setdefault(gram, []).append(i)
+
+        query = set(bigrams(normalize_name(name)))
+        shared = Counter()
+        for gram in query:
+            shared.update(self._bigrams.get(gram, ()))
+
+        scored = []
+        for i, count in shared.items():
+            score = 2 * count / (len(query) + len(set(bigrams(self.names[i]))))
+            if score >= min_score:
+                scored.append((score, i))
+        scored.sort(key=lambda match: (-match[0], self.names[match[1]]))
+        return [(self.corp_code[i], self.corp_name[i], score) for score, i in scored[:limit]]
@@ -3,47 +3,74 @@ import os
 import re
 import glob
 import json
+import time
 import xml.etree.ElementTree as ET
 import zipfile
 import requests
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 
 import pandas as pd
 
 from typing import Dict, Any
+from metrics import timed
 from utils import make_api_call
 
 USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/113.0.0.0 Safari/537.36'
 
 
+CORP_CODE_URL = 'https://opendart.fss.or.kr/api/corpCode.xml'
+CORP_CODE_FIELDS = ['corp_code', 'corp_name', 'corp_eng_name', 'stock_code', 'modify_date']
+
+
+def parse_corp_codes(xml_file) -> pd.DataFrame:
+    """
+    Streams CORPCODE.xml into a compact table: one list per column while
+    parsing (each <list> element is freed once read), stock_code and
+    modify_date as categoricals, unlisted companies with stock_code None
+
+    :param xml_file: path or binary file object of CORPCODE.xml
+    """
+    columns = {field: [] for field in CORP_CODE_FIELDS}
+    for _, element in ET.iterparse(xml_file, events=('end',)):
+        if element.tag != 'list':
+            continue
+        record = {child.tag: child.text for child in element}
+        for field, values in columns.items():
+            value = record.get(field)
+            values.append(value.strip() or None if value is not None else None)
+        element.clear()
+
+    df = pd.DataFrame(columns)
+    if df['corp_eng_name'].isna().all():
+        df = df.drop(columns='corp_eng_name')
+    return df.astype({'stock_code': 'category', 'modify_date': 'category'})
+
+
 def get_corp_code_list(api_key: str) -> pd.DataFrame:
-    url = 'https://opendart.fss.or.kr/api/corpCode.xml'
-    params = { 'crtfc_key': api_key, }
+    """
+    Downloads the corp code master
+    """
+    df, _ = _fetch_corp_codes(api_key)
+    return df
 
-    r = make_api_call(url, params)
-    try:
-        tree = ET.XML(r.content)
-        status = tree.find('status').text
-        message = tree.find('message').text
-        if status != '000':
-            raise ValueError({'status': status, 'message': message})
-    except ET.ParseError as e:
-        pass
 
-    zf = zipfile.ZipFile(io.BytesIO(r.content))
-    xml_data = zf.read('CORPCODE.xml')
+def _fetch_corp_codes(api_key: str, headers: Dict = None):
+    """
+    :param headers: conditional request headers (If-None-Match / If-Modified-Since)
+    :return: (DataFrame or None if the server answered 304 Not Modified, response headers)
+    """
+    params = { 'crtfc_key': api_key, }
 
-    # XML to DataFrame
-    tree = ET.XML(xml_data)
-    all_records = []
+    r = make_api_call(CORP_CODE_URL, params, headers=headers)
+    if r.status_code == 304:
+        return None, r.headers
+    # 오류는 zip 이 아닌 XML 로 반환됨
+    if not r.content.startswith(b'PK'):
+        tree = ET.XML(r.content)
+        raise ValueError({'status': tree.findtext('status'), 'message': tree.findtext('message')})
 
-    element = tree.findall('list')
-    for _, child in enumerate(element):
-        record = {}
-        for _, subchild in enumerate(child):
-            record[subchild.tag] = subchild.text
-        all_records.append(record)
-    return pd.DataFrame(all_records)
+    with zipfile.ZipFile(io.BytesIO(r.content)) as zf, zf.open('CORPCODE.xml') as xml_file:
+        return parse_corp_codes(xml_file), r.headers
 
 def company_info(api_key: str, corp_code: str) -> Dict:
     url = 'https://opendart.fss.or.kr/api/company.json'
@@ -77,57 +104,76 @@ def company_info(api_key: str, corp_code: str) -> Dict:
         
 
 
-def corp_code_list(api_key: str) -> pd.DataFrame:
-    docs_cache_dir = 'docs_cache'
-    if not os.path.exists(docs_cache_dir):
-        os.makedirs(docs_cache_dir)
-
-    # read and return document if exists
-    fn = 'opendartreader_corp_codes_{}.pkl'.format(datetime.today().strftime('%Y%m%d'))
-    fn_cache = os.path.join(docs_cache_dir, fn)
-    for fn_rm in glob.glob(os.path.join(docs_cache_dir, 'opendartreader_corp_codes_*')):
-        if fn_rm == fn_cache:
-            continue
-        os.remove(fn_rm)
-    if not os.path.exists(fn_cache):
-        df = get_corp_code_list(api_key)
-        df.to_pickle(fn_cache)
-
-    corp_codes = pd.read_pickle(fn_cache)
-
-    return corp_codes
+def corp_code_list(api_key: str, max_age: float = 7 * 24 * 60 * 60, cache_dir: str = 'docs_cache') -> pd.DataFrame:
+    """
+    Corp code master, cached in `cache_dir`. The cache is used as is for
+    `max_age` seconds; after that the master is requested again with the
+    ETag / Last-Modified of the cached copy and only re-parsed if it changed
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    fn_cache = os.path.join(cache_dir, 'corp_codes.pkl')
+    fn_meta = os.path.join(cache_dir, 'corp_codes.json')
+
+    meta = {}
+    if os.path.exists(fn_cache) and os.path.exists(fn_meta):
+        with open(fn_meta) as f:
+            meta = json.load(f)
+        if time.time() - meta.get('fetched', 0) < max_age:
+            return pd.read_pickle(fn_cache)
+
+    headers = {}
+    if meta.get('etag'):
+        headers['If-None-Match'] = meta['etag']
+    if meta.get('last_modified'):
+        headers['If-Modified-Since'] = meta['last_modified']
+
+    df, response_headers = _fetch_corp_codes(api_key, headers or None)
+    if df is None:
+        df = pd.read_pickle(fn_cache)
+    else:
+        df.to_pickle(fn_cache + '.tmp')
+        os.replace(fn_cache + '.tmp', fn_cache)
+        meta = {'etag': response_headers.get('ETag'), 'last_modified': response_headers.get('Last-Modified')}
+        # 날짜별로 저장하던 예전 캐시 정리
+        for fn_rm in glob.glob(os.path.join(cache_dir, 'opendartreader_corp_codes_*')):
+            os.remove(fn_rm)
+
+    meta['fetched'] = time.time()
+    with open(fn_meta, 'w') as f:
+        json.dump(meta, f)
+    return df
 
 
-def download_corp_document(params: dict) -> pd.DataFrame:
+@timed('download_corp_document')
+def download_corp_document(params: dict, max_workers: int = 4) -> pd.DataFrame:
     url = 'https://opendart.fss.or.kr/api/list.json'
 
     r = make_api_call(url, params)
-    try:
-        tree = ET.XML(r.content)
-        status = tree.find('status').text
-        message = tree.find('message').text
-        if status != '000':
-            raise ValueError({'status': status, 'message': message})
-    except ET.ParseError as e:
-        jo = r.json()
-        if jo['status'] != '000':
-            print(ValueError(r.text))
-
     jo = r.json()
+    # 013: 조회된 데이터 없음. 그 밖의 오류는 빈 결과로 저장되지 않도록 raise
+    if jo['status'] == '013':
+        return pd.DataFrame()
+    if jo['status'] != '000':
+        raise ValueError({'status': jo['status'], 'message': jo.get('message')})
     if 'list' not in jo:
         return pd.DataFrame()
-    df = pd.DataFrame(jo['list'])
 
-    for page in range(2, jo['total_page']+1):
-        params['page_no'] = page
-        r = make_api_call(url, params)
-        jo = r.json()
-        df = pd.concat([df, pd.DataFrame(jo['list'])])
-        df = df.reset_index(drop=True)
+    # 2 페이지부터는 동시에 요청 (요청 속도는 rate_limiter 가 제한)
+    def fetch_page(page):
+        page_jo = make_api_call(url, {**params, 'page_no': page}).json()
+        if page_jo['status'] != '000':
+            raise ValueError({'status': page_jo['status'], 'message': page_jo['message'], 'page_no': page})
+        return page_jo['list']
 
-    return df
+    pages = [jo['list']]
+    if jo['total_page'] > 1:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pages.extend(executor.map(fetch_page, range(2, jo['total_page'] + 1)))
+
+    return pd.DataFrame([row for page in pages for row in page])
 
 
+@timed('sub_docs')
 def sub_docs(rcp_no: str) -> pd.DataFrame:
     if rcp_no.isdecimal():
         r = make_api_call(f'http://dart.fss.or.kr/dsaf001/main.do?rcpNo={rcp_no}')
@@ -1,9 +1,9 @@
 import os
 import re
-import math
 import json
 import time
 import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from tqdm import tqdm
 
@@ -11,14 +11,23 @@ from typing import List, Optional
 
 import numpy as np
 import pandas as pd
-from bs4 import BeautifulSoup
 
 import dart_api
+import metadata_store
+import rate_limiter
+import section_index
 import utils
 
-from utils import make_api_call
+from metrics import incr, metrics, timed, timer
+from checkpoint import SectionCheckpoint, response_encoding
+from corp_index import CorpCodeIndex
+from compression import COMPRESSION_SUFFIXES, compression_available
+from downloader import SubDocDownloader
 
 DATASET_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'datasets')
+
+# list.json 의 항목 + year; 공시가 없는 분기도 이 열로 저장
+INDEX_COLUMNS = ['corp_code', 'corp_name', 'stock_code', 'corp_cls', 'report_nm', 'rcept_no', 'flr_nm', 'rcept_dt', 'rm', 'year']
 if not os.path.exists(DATASET_DIR):
 	os.mkdir(DATASET_DIR)
         
@@ -26,24 +35,67 @@ with open("config.json") as fin:
     config = json.load(fin)['dart_crawler']
 
 api_key = config['api_key']
-corp_codes = dart_api.corp_code_list(api_key)
+rate_limiter.configure(config['rate_limits'])
+utils.configure_session(**config['http'])
+utils.configure_cache(**config['cache'])
+utils.configure_base_urls(config.get('base_urls'))
+utils.configure_recorder(config.get('record_fixtures'))
   
 
+_corp_codes = None
+_corp_index = None
+
+
+def get_corp_codes() -> pd.DataFrame:
+    """
+    Corp code master, loaded on first use (importing this module does not
+    download or parse it)
+    """
+    global _corp_codes
+    if _corp_codes is None:
+        _corp_codes = dart_api.corp_code_list(api_key, max_age=config.get('corp_codes_max_age_days', 7) * 24 * 60 * 60)
+    return _corp_codes
+
+
+def __getattr__(name):
+    # dart_crawler.corp_codes 도 처음 접근할 때 불러옴
+    if name == 'corp_codes':
+        return get_corp_codes()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def corp_index() -> CorpCodeIndex:
+    """
+    Lookup index over the corp code master, built on first use
+    """
+    global _corp_index
+    if _corp_index is None:
+        _corp_index = CorpCodeIndex(get_corp_codes())
+    return _corp_index
+
+
 def find_corp_code(corp: str) -> Optional[str]:
-    if not corp.isdigit():
-        df = corp_codes[corp_codes['corp_name'] == corp]
-    elif corp.isdigit() and len(corp) == 6:
-        df = corp_codes[corp_codes['stock_code'] == corp]
-    else:
-        df = corp_codes[corp_codes['corp_code'] == corp]
-    return None if df.empty else df.iloc[0]['corp_code']
-        
+    """
+    corp_code of a corp_code, stock_code or company name
+    """
+    return corp_index().resolve(corp)
+
+
+def raw_compression_available() -> bool:
+    raw_compression = config.get('raw_compression')
+    if raw_compression not in COMPRESSION_SUFFIXES:
+        print(f'Unknown raw_compression "{raw_compression}", expected null, "gzip" or "zstd"')
+        return False
+    if not compression_available(raw_compression):
+        print(f'raw_compression "{raw_compression}" needs the zstandard package')
+        return False
+    return True
+
 
 def main():
 
     raw_filings_folder = os.path.join(DATASET_DIR, config['raw_filings_folder'])
     indices_folder = os.path.join(DATASET_DIR, config['indices_folder'])
-    filings_metadata_filepath = os.path.join(DATASET_DIR, config['filings_metadata_file'])
     
 
     if len(config['filing_types']) == 0:
@@ -54,15 +106,67 @@ def main():
         print("Please get api key from dart")
         exit()
 
+    if not raw_compression_available():
+        exit()
+
     if not os.path.isdir(indices_folder):
         os.mkdir(indices_folder)
     if not os.path.isdir(raw_filings_folder):
         os.mkdir(raw_filings_folder)
 
-    if not os.path.isfile(os.path.join(DATASET_DIR, 'companies_info.json')):
-        with open(os.path.join(DATASET_DIR, 'companies_info.json'), 'w') as f:
-            json.dump(obj={}, fp=f)
+    store = metadata_store.open_store(DATASET_DIR, config['metadata_db_file'], config['filings_metadata_file'])
+
+    df = pending_filings(store, indices_folder, raw_filings_folder)
+    if len(df) == 0:
+        print(f'\nThere are no more filings to download for the given years, quarters and companies')
+        exit()
+
+    list_of_series = [series for _, series in df.iterrows()]
 
+    print(f"\nDownloading {len(df)} filings...\n")
+
+    downloader = SubDocDownloader(max_workers=config['download_workers'])
+    downloaded = 0
+    with ThreadPoolExecutor(max_workers=config['filing_workers']) as executor:
+        futures = [
+            executor.submit(
+                crawl,
+                series=series,
+                filing_types=config['filing_types'],
+                raw_filings_folder=raw_filings_folder,
+                api_key=api_key,
+                user_agent=config['user_agent'],
+                downloader=downloader,
+                store=store,
+                raw_compression=config.get('raw_compression'),
+            )
+            for series in list_of_series
+        ]
+        for future in tqdm(as_completed(futures), total=len(futures), ncols=100):
+            try:
+                series = future.result()
+            except Exception as e:
+                print(e)
+                continue
+            if series is not None:
+                store.upsert_filing(series)
+                downloaded += 1
+    downloader.shutdown()
+
+    print(f"\n{downloader.stats}")
+    print(rate_limiter.format_stats())
+    print(utils.call_timings)
+    metrics.report('crawl')
+    if downloaded < len(list_of_series):
+        print(f"\nDownloaded {downloaded} / {len(list_of_series)} filings.")
+        print(f'Rerun the script to retry downloading the failed filings.')
+
+
+def pending_filings(store: metadata_store.MetadataStore, indices_folder: str, raw_filings_folder: str) -> pd.DataFrame:
+    """
+    Updates the quarter indices and returns the filings of the configured
+    companies that are not downloaded yet
+    """
     download_indices(
 		start_year=config['start_year'],
 		end_year=config['end_year'],
@@ -70,6 +174,10 @@ def main():
 		indices_folder=indices_folder,
         filing_types=config['filing_types'],
 		api_key=api_key,
+        max_workers=config['index_workers'],
+        retries=config['index_retries'],
+        incremental=config['incremental_indices'],
+        store=store,
 	)
     
     csv_filenames = []
@@ -85,101 +193,73 @@ def main():
 		filing_types=config['filing_types'],
 		cik_tickers=config['cik_tickers'],
 	)
-    old_df = []
-    if os.path.exists(filings_metadata_filepath):
-        old_df = []
-        series_to_download = []
-        print(f'\nReading filings metadata...\n')
-
-        for _, series in pd.read_csv(filings_metadata_filepath, dtype=str).iterrows():
-            #filename 정해야 함
-            if os.path.exists(os.path.join(raw_filings_folder, series['filename'])):
-                old_df.append((series.to_frame()).T)
-
-        if len(old_df) == 1:
-            old_df = old_df[0]
-        elif len(old_df) > 1:
-            old_df = pd.concat(old_df)
-
-        #column 수정해야 함
-        for _, series in tqdm(df.iterrows(), total=len(df), ncols=100):
-            if len(old_df) == 0 or len(old_df[old_df['rcept_no']== series['rcept_no']]) == 0:
-                series_to_download.append((series.to_frame()).T)
-
-        if len(series_to_download) == 0:
-            print(f'\nThere are no more filings to download for the given years, quarters and companies')
-            exit()
-
-        df = pd.concat(series_to_download) if (len(series_to_download) > 1) else series_to_download[0]
-
-    list_of_series = []
-    for i in range(len(df)):
-        list_of_series.append(df.iloc[i])
-
-    print(f"\nDownloading {len(df)} filings...\n")
-
-    final_series = []
-    for series in tqdm(list_of_series, ncols=100):
-        series = crawl(
-			series=series,
-			filing_types=config['filing_types'],
-            raw_filings_folder=raw_filings_folder,
-            api_key=api_key,
-            user_agent=config['user_agent']
-        )
-        if series is not None:
-            final_series.extend([series.iloc[i].to_frame().T for i in range(len(series))])
-            final_df = pd.concat(final_series) if (len(final_series) > 1) else final_series[0]
-            if len(old_df) > 0:
-                final_df = pd.concat([old_df, final_df])
-            final_df.to_csv(filings_metadata_filepath, index=False, header=True)
-
-    if len(final_series) < len(list_of_series):
-        print(f"\nDownloaded {len(final_series)} / {len(list_of_series)} filings.")
-        print(f'Rerun the script to retry downloading the failed filings.')
+    print(f'\nReading filings metadata...\n')
+    return metadata_store.plan_downloads(df, store, raw_filings_folder)
 
 
+@timed('crawl')
 def crawl(
 		series: pd.Series,
         filing_types: str,
         raw_filings_folder: str,
         user_agent: str,
         api_key: str,
+        store: metadata_store.MetadataStore,
+        downloader: Optional[SubDocDownloader] = None,
+        raw_compression: Optional[str] = None,
 ) -> pd.DataFrame:
+    """
+    Downloads the sub-documents of a filing and stores them as received,
+    concatenated into one raw file (compressed with `raw_compression`)
+    """
     rcp_no = series['rcept_no']
 
     df = dart_api.sub_docs(rcp_no)
-    time.sleep(1)
 
     for col in series.to_frame().T:
         df[col] = np.vstack([series[col]]*len(df))
 
     df['filing_types'] = filing_types
     
-    with open(os.path.join(DATASET_DIR, 'companies_info.json'), encoding="utf-8") as f:
-        company_info_dict = json.load(fp=f)
     corp_code = series['corp_code']
-    if corp_code not in company_info_dict:
-        c_info = dart_api.company_info(api_key, corp_code)
-        time.sleep(1)
-        company_info_dict[corp_code] = c_info
-
-        with open(os.path.join(DATASET_DIR, 'companies_info.json'), 'w') as f:
-            json.dump(obj=company_info_dict, fp=f, indent=4, ensure_ascii=False)
+    if store.get_company(corp_code) is None:
+        store.upsert_company(corp_code, dart_api.company_info(api_key, corp_code))
 
     filename = f'{series["stock_code"]}_{filing_types}_{df["year"].unique()[0]}_{series["rcept_no"]}_{series["rcept_dt"]}.html'
     df['filename'] = filename
-    with open(os.path.join(raw_filings_folder, filename), 'w') as of:
-        for _, row in df.iterrows():
-            of.write(f"<!-- File: {os.path.basename(row['title'])} -->\n")
-            r = make_api_call(row['url'])
-            time.sleep(2)
-            if r.status_code==200:
-                soup = BeautifulSoup(r.text, 'lxml')
-                of.write(str(soup))
-            else:
-                print(f"Crawling Error...{series['stock_code']}")
-                return None
+
+    # 이미 받아 둔 하위 문서는 건너뛰고 빠진 것만 받음
+    checkpoint = SectionCheckpoint(raw_filings_folder, rcp_no)
+    sections = list(zip(df['title'], df['url']))
+    missing = [(title, url) for title, url in sections if not checkpoint.is_done(url)]
+
+    # downloader 를 넘겨받지 않았으면 이 공시에서만 쓰고 닫음
+    owned = downloader is None
+    if owned:
+        downloader = SubDocDownloader(max_workers=1)
+    failed = False
+    try:
+        for i, r in downloader.fetch_iter([url for _, url in missing]):
+            if isinstance(r, Exception) or r.status_code != 200:
+                failed = True
+                continue
+            title, url = missing[i]
+            with timer('checkpoint_save'):
+                checkpoint.save(url, title, r.content, response_encoding(r))
+            incr('sections_downloaded')
+            incr('section_bytes_downloaded', len(r.content))
+    finally:
+        if owned:
+            downloader.shutdown()
+
+    if failed:
+        print(f"Crawling Error...{series['stock_code']}")
+        return None
+
+    # 하위 문서는 sub_docs() 순서대로 이어 붙임
+    with timer('assemble'):
+        path = checkpoint.assemble(sections, filename, raw_compression)
+        section_index.build_index(path, [section_index.section_ids(url) for url in df['url']])
     return df
 
         
@@ -189,62 +269,117 @@ def download_indices(
         quarters: List,
         indices_folder: str,
         filing_types: str,
-        api_key: str
+        api_key: str,
+        max_workers: int = 4,
+        retries: int = 3,
+        incremental: bool = False,
+        store: Optional[metadata_store.MetadataStore] = None,
 ) -> None:
+    """
+    Downloads {year}_QTR{quarter}.csv index files. With `incremental`, the
+    quarter in progress is included and quarters that are not complete yet
+    are refreshed from their rcept_dt watermark (kept in `store`) instead of
+    being skipped or downloaded from scratch. Without `store` the watermark
+    is read from the index file itself
+    """
     for quarter in quarters:
         if quarter not in [1, 2, 3, 4]:
             raise Exception(f'Invalid quarter "{quarter}"')
-        
 
-    first_iteration = True
-    while True:
+    today = datetime.now().strftime('%Y%m%d')
+    tasks = {}
+    for year in range(start_year, end_year + 1):
+        for quarter in quarters:
+            bgn_de = utils.get_quarter_start_date(year, quarter)
+            nxt_quarter = (quarter % 4) + 1
+            nxt_year = year + 1 if nxt_quarter < quarter else year
+            end_de = utils.get_quarter_start_date(nxt_year, nxt_quarter)
+            if bgn_de > today:
+                break
+            in_progress = end_de > today
+            if in_progress and not incremental:
+                break
+
+            index_filename = f'{year}_QTR{quarter}.csv'
+            if os.path.exists(os.path.join(indices_folder, index_filename)):
+                if not incremental:
+                    print(f"Skipping {index_filename}")
+                    continue
+                watermark = store.get_watermark(index_filename) if store is not None else None
+                if watermark is None:
+                    watermark = watermark_from_index(os.path.join(indices_folder, index_filename), end_de <= today)
+                if watermark['complete']:
+                    print(f"Skipping {index_filename}")
+                    continue
+                # 마지막으로 받은 접수일부터 (같은 날 접수분이 더 있을 수 있으므로 포함) 다시 조회
+                bgn_de = watermark['rcept_dt'] or bgn_de
+
+            tasks[index_filename] = (year, in_progress, {
+                'crtfc_key': api_key,
+                'bgn_de': bgn_de,
+                'end_de': today if in_progress else end_de,
+                'last_reprt_at': 'Y', # 최종보고서 여부
+                'corp_cls': 'Y',
+                'pblntf_detail_ty': filing_types,
+                'page_no': 1,
+                'page_count': 100,
+            })
+
+    def download(index_filename, year, in_progress, params):
+        index_filepath = os.path.join(indices_folder, index_filename)
+        indices = dart_api.download_corp_document(params, max_workers=max_workers)
+        if len(indices) > 0:
+            indices['year'] = indices['report_nm'].apply(utils.parsing_date)
+            indices = indices[indices['year'] == year]
+        elif in_progress and not os.path.exists(index_filepath):
+            # 아직 접수된 공시가 없는 분기: 빈 파일을 남기면 다음 실행에서 건너뛰게 됨
+            return
+        else:
+            indices = pd.DataFrame(columns=INDEX_COLUMNS)
+        if incremental and os.path.exists(index_filepath):
+            indices = pd.concat([pd.read_csv(index_filepath, index_col=0, dtype=str), indices.astype(str)])
+            indices = indices.drop_duplicates(subset=['rcept_no'], keep='last').reset_index(drop=True)
+        indices.to_csv(index_filepath)
+        if incremental and store is not None:
+            store.set_watermark(
+                index_filename,
+                rcept_no=indices['rcept_no'].max() if len(indices) else None,
+                rcept_dt=indices['rcept_dt'].max() if len(indices) else None,
+                complete=not in_progress,
+            )
+
+    # 분기별로 동시에 받고, 실패한 분기는 대기 후 자동으로 재시도
+    for attempt in range(retries + 1):
         failed_indices = []
-        for year in range(start_year, end_year + 1):
-            for quarter in quarters:
-                bgn_de = utils.get_quarter_start_date(year, quarter)
-                nxt_quarter = (quarter % 4) + 1
-                nxt_year = year + 1 if nxt_quarter < quarter else year
-                if nxt_year == datetime.now().year and nxt_quarter > math.ceil(datetime.now().month / 3):
-                    break
-                end_de = utils.get_quarter_start_date(nxt_year, nxt_quarter)
-
-                index_filename = f'{year}_QTR{quarter}.csv'
-                if os.path.exists(os.path.join(indices_folder, index_filename)):
-                    if first_iteration:
-                        print(f"Skipping {index_filename}")
-                        continue
-
-                params = {
-                    'crtfc_key': api_key,
-                    'bgn_de': bgn_de,
-                    'end_de': end_de,
-                    'last_reprt_at': 'Y', # 최종보고서 여부
-                    'corp_cls': 'Y',
-                    'pblntf_detail_ty': filing_types,
-                    'page_no': 1,
-                    'page_count': 100,
-                }
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(download, name, *task): name for name, task in tasks.items()}
+            for future in as_completed(futures):
                 try:
-                    indices = dart_api.download_corp_document(params)
-                    indices['year'] = indices['report_nm'].apply(utils.parsing_date)
-                    indices = indices[indices['year'] == int(bgn_de[:4])]
-                    indices.to_csv(os.path.join(indices_folder, index_filename))
+                    future.result()
                 except Exception as e:
                     print(e)
-                    failed_indices.append(index_filename)
-                    continue
+                    failed_indices.append(futures[future])
 
-        first_iteration = False
-        if len(failed_indices) > 0:
-            print(f'Could not download the following indices:\n{failed_indices}')
-            user_input = input('Retry (Y/N): ')
-            if user_input in ['Y', 'y', 'yes']:
-                print(f'Retry downloading failed indices')
-                print(params)
-            else:
-                break
-        else:
+        if len(failed_indices) == 0:
             break
+        tasks = {name: tasks[name] for name in failed_indices}
+        if attempt < retries:
+            print(f'Retry downloading failed indices: {failed_indices}')
+            time.sleep(2 ** attempt)
+    else:
+        print(f'Could not download the following indices:\n{failed_indices}')
+
+
+def watermark_from_index(index_filepath: str, complete: bool) -> dict:
+    """
+    Watermark of an index file downloaded before watermarks were recorded
+    """
+    indices = pd.read_csv(index_filepath, index_col=0, dtype=str)
+    return {
+        'rcept_no': indices['rcept_no'].max() if len(indices) else None,
+        'rcept_dt': indices['rcept_dt'].max() if len(indices) else None,
+        'complete': complete,
+    }
 
 
 def get_specific_indices(
@@ -252,14 +387,27 @@ def get_specific_indices(
     filing_types: str,
     cik_tickers: List =None,
 ) -> pd.DataFrame:
-    total = pd.DataFrame()
+    frames = []
     for csv_filename in csv_filenames:
-        tmp = pd.read_csv(csv_filename, index_col=0, dtype=str)
-        total = pd.concat([total, tmp], ignore_index=True)
+        try:
+            tmp = pd.read_csv(csv_filename, index_col=0, dtype=str)
+        except pd.errors.EmptyDataError:
+            continue
+        # 공시가 없는 분기 (예전 버전이 열 없이 저장한 빈 파일 포함)
+        if len(tmp) > 0 and 'rcept_no' in tmp.columns:
+            frames.append(tmp)
+    if not frames:
+        return pd.DataFrame(columns=INDEX_COLUMNS)
+    total = pd.concat(frames, ignore_index=True)
     
-    #cik_tickers를 stock_code, corp_name, corp_code 중 어떤 것으로 사용할지는 고려해야함
-    #만약 corp_name이나 corp_code인 경우 추가 작업 필요
-    total = total[total['stock_code'].isin(cik_tickers)]
+    # cik_tickers 에는 stock_code, corp_code, 회사명을 섞어 쓸 수 있음
+    if cik_tickers:
+        resolved = corp_index().resolve_many(cik_tickers)
+        unresolved = [ticker for ticker, corp_code in resolved.items() if corp_code is None]
+        if unresolved:
+            print(f'Unknown companies in cik_tickers: {unresolved}')
+        total = total[total['corp_code'].isin({c for c in resolved.values() if c is not None})
+                      | total['stock_code'].isin(unresolved)]
 
     return total
 
@@ -1,25 +1,37 @@
 import re
 import os
 import json
+import shutil
+import hashlib
+import tempfile
 from html.parser import HTMLParser
+from multiprocessing import Pool
+from multiprocessing.util import Finalize
 
 import numpy as np
 import pandas as pd
-from bs4 import BeautifulSoup
-
-from pathos.pools import ProcessPool
 
 import roman
 
 from tqdm import tqdm
 from typing import List
 
+import metadata_store
+import search_index
+import section_index
+from metrics import incr, metrics, profiled, timer
+from section_index import (RawFiling, decode_section, iter_sections, mmap_file, raw_filepath,
+                           read_raw, section_bytes)
+from compression import compression_available, compression_of
+from sinks import open_sink
+from tables import UNIT_RE, load_tables, parquet_available, tables_frame, write_tables
 from utils import check_roman_numerals
 
 
 DATASET_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'datasets')
 
-delimiter = "<!-- File:"
+# 정제 규칙이 바뀌면 올려서 기존에 추출한 JSON 을 다시 추출하도록 함
+EXTRACTOR_VERSION = 1
 
 regex_flags = re.IGNORECASE | re.DOTALL | re.MULTILINE
 
@@ -30,6 +42,66 @@ if not os.path.exists(DATASET_DIR):
 with open('config.json') as fin:
     config = json.load(fin)['extract_items']
 
+# clean_text 의 한 글자 치환들은 하나의 문자 클래스로 한 번에 처리
+# (str.translate 는 한글처럼 non-ASCII 문자열에서 글자마다 dict 를 조회해 10배 가까이 느림)
+CHAR_MAP = {
+    '\xa0': ' ', '\u200b': ' ',
+    '\x91': '‘', '\x92': '’', '\x93': '“', '\x94': '”', '\x95': '•',
+    '\x96': '-', '\x97': '-', '\x98': '˜', '\x99': '™',
+    '\u2010': '-', '\u2011': '-', '\u2012': '-', '\u2013': '-', '\u2014': '-', '\u2015': '-',
+}
+SPECIAL_CHAR_RE = re.compile('[' + ''.join(CHAR_MAP) + ']')
+
+# "P A R T 1" / "I T E M 1" 처럼 깨진 header 를 한 번에 찾음 (뒤의 번호는 lookahead 로만 확인)
+BROKEN_HEADER_RE = re.compile(
+    r'(\n[^\S\r\n]*)'
+    r'(P[^\S\r\n]*A[^\S\r\n]*R[^\S\r\n]*T(?=[^\S\r\n]+(?:\d{1,2}|[IV]{1,2}))'
+    r'|I[^\S\r\n]*T[^\S\r\n]*E[^\S\r\n]*M(?=[^\S\r\n]+\d{1,2}))',
+    re.IGNORECASE)
+WHITESPACE_RE = re.compile(r'[^\S\r\n]')
+HEADER_SEPARATOR_RE = re.compile(r'(ITEM|PART)(\s+\d{1,2}[AB]?)([\-•])', re.IGNORECASE)
+UNNECESSARY_HEADER_RE = re.compile(
+    r'\n[^\S\r\n]*'
+    r'(TABLE\s+OF\s+CONTENTS|INDEX\s+TO\s+FINANCIAL\s+STATEMENTS|BACK\s+TO\s+CONTENTS|QUICKLINKS)'
+    r'[^\S\r\n]*\n',
+    regex_flags)
+PAGE_NUMBER_RE = re.compile(r'\n[^\S\r\n]*[-‒–—]*\d+[-‒–—]*[^\S\r\n]*\n', regex_flags)
+BARE_NUMBER_RE = re.compile(r'\n[^\S\r\n]*\d+[^\S\r\n]*\n', regex_flags)
+FINANCIAL_PAGE_RE = re.compile(r'[\n\s]F[-‒–—]*\d+', regex_flags)
+PAGE_HEADER_RE = re.compile(r'\n[^\S\r\n]*Page\s[\d*]+[^\S\r\n]*\n', regex_flags)
+
+# 블록 태그 뒤 줄바꿈 / 셀 태그 뒤 공백 (HtmlTextExtractor)
+BLOCK_END_TAGS = {'div', 'tr', 'p', 'li'}
+CELL_END_TAGS = {'th', 'td'}
+BR_TAG_RE = re.compile(r'<br\s*/?>')
+
+# 빈 줄이 포함된 줄바꿈 묶음(또는 '#NEWLINE')은 줄바꿈 하나로, 나머지 공백/줄바꿈 묶음은 공백 하나로
+MULTIPLE_LINES_RE = re.compile(r'((?:(?: *\n *){2,}|#NEWLINE)+)|[ \n]{2,}|\n')
+
+
+def _map_char(match):
+    return CHAR_MAP[match[0]]
+
+
+def _join_header(match):
+    return match[1] + WHITESPACE_RE.sub('', match[2])
+
+
+def _sha256(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def _span(value):
+    try:
+        return max(1, int(value))
+    except (TypeError, ValueError):
+        return 1
+
+
+def _replace_lines(match):
+    return '\n' if match[1] is not None else ' '
+
+
 class HtmlStripper(HTMLParser):
     """
     Strips HTML tags
@@ -51,7 +123,97 @@ class HtmlStripper(HTMLParser):
     def strip_tags(self, html):
         self.feed(html)
         return self.get_data()
-    
+
+
+class HtmlTextExtractor(HtmlStripper):
+    """
+    Single pass html -> text: strips tags like HtmlStripper while adding the
+    line breaks / cell padding of ExtractItems.strip_html, and optionally
+    drops everything inside <table> elements, so a section is parsed once.
+    With `collect_tables` the cells of every table are also kept in
+    `self.tables` (see tables.tables_frame)
+    """
+
+    def __init__(self, remove_tables: bool, collect_tables: bool = False):
+        super().__init__()
+        self.remove_tables = remove_tables
+        self.collect_tables = collect_tables
+        self.table_depth = 0
+        self.tables = []
+        self.open_tables = []
+        self.unit = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'table':
+            if self.remove_tables:
+                self.table_depth += 1
+            if self.collect_tables:
+                table = {'rows': [], 'cell': None, 'thead': False, 'unit': self.unit, 'own_unit': False}
+                self.tables.append(table)
+                self.open_tables.append(table)
+        elif tag == 'br' and BR_TAG_RE.fullmatch(self.get_starttag_text()):
+            self._emit('\n\n')
+            if self.open_tables and self.open_tables[-1]['cell'] is not None:
+                self.open_tables[-1]['cell']['text'].append(' ')
+        elif self.open_tables:
+            self._table_starttag(self.open_tables[-1], tag, attrs)
+
+    def _table_starttag(self, table, tag, attrs):
+        if tag == 'tr':
+            table['rows'].append([])
+        elif tag in CELL_END_TAGS:
+            if not table['rows']:
+                table['rows'].append([])
+            attrs = dict(attrs)
+            table['cell'] = {
+                'text': [],
+                'header': tag == 'th' or table['thead'],
+                'rowspan': _span(attrs.get('rowspan')),
+                'colspan': _span(attrs.get('colspan')),
+            }
+            table['rows'][-1].append(table['cell'])
+        elif tag == 'thead':
+            table['thead'] = True
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag == 'table':
+            if self.table_depth:
+                self.table_depth -= 1
+            if self.open_tables:
+                self.open_tables.pop()
+        elif tag in BLOCK_END_TAGS:
+            self._emit('\n\n')
+        elif tag in CELL_END_TAGS:
+            self._emit('  ')
+            if self.open_tables:
+                self.open_tables[-1]['cell'] = None
+        elif tag == 'thead' and self.open_tables:
+            self.open_tables[-1]['thead'] = False
+
+    def handle_data(self, d):
+        if self.collect_tables:
+            self._table_data(d)
+        self._emit(d)
+
+    def _table_data(self, d):
+        unit = UNIT_RE.search(d)
+        if unit is not None:
+            self.unit = unit[1]
+            # 표 안에 단위가 적혀 있으면 그 표부터 적용
+            if self.open_tables and not self.open_tables[-1]['own_unit']:
+                self.open_tables[-1]['unit'] = self.unit
+                self.open_tables[-1]['own_unit'] = True
+        if self.open_tables and self.open_tables[-1]['cell'] is not None:
+            self.open_tables[-1]['cell']['text'].append(d)
+
+    def _emit(self, text):
+        if not self.table_depth:
+            self.fed.append(text)
+
 
 class ExtractItems:
     def __init__(
@@ -61,6 +223,12 @@ class ExtractItems:
             raw_files_folder: str,
             extracted_files_folder: str,
             skip_extracted_filings: bool,
+            metadata_db_path: str,
+            extract_tables: bool = False,
+            extracted_tables_folder: str = None,
+            output_format: str = 'json',
+            output_compression: str = None,
+            shard_size: int = 1000,
     ):
         self.remove_tables = remove_tables
         self.items_list = [i for i in range(1, 13)]
@@ -68,6 +236,53 @@ class ExtractItems:
         self.raw_files_folder = raw_files_folder
         self.extracted_files_folder = extracted_files_folder
         self.skip_extracted_filings = skip_extracted_filings
+        self.wanted_items = {f'item_{roman.toRoman(int(i))}' for i in self.items_to_extract}
+        self.metadata_db_path = metadata_db_path
+        self.extract_tables = extract_tables
+        self.extracted_tables_folder = extracted_tables_folder
+        self.output_format = output_format
+        self.output_compression = output_compression
+        self.shard_size = shard_size
+        self._companies = None
+        self._sink = None
+
+    def __getstate__(self):
+        # 회사 정보와 출력 sink 는 worker 프로세스마다 처음 쓸 때 만듦
+        state = self.__dict__.copy()
+        state['_companies'] = None
+        state['_sink'] = None
+        return state
+
+    @property
+    def companies(self):
+        if self._companies is None:
+            store = metadata_store.MetadataStore(self.metadata_db_path, read_only=True)
+            self._companies = store.companies()
+            store.close()
+        return self._companies
+
+    @property
+    def sink(self):
+        if self._sink is None:
+            self._sink = open_sink(self.extracted_files_folder, self.output_format,
+                                   self.output_compression, self.shard_size)
+        return self._sink
+
+    def company(self, corp_code):
+        """
+        Company info; reloaded once if the company was added to the store
+        after it was loaded (e.g. by the crawler in pipeline.py)
+        """
+        if corp_code not in self.companies:
+            self._companies = None
+        return self.companies[corp_code]
+
+    def close(self):
+        """
+        Flushes the output sink (the last shard of a sharded output format)
+        """
+        if self._sink is not None:
+            self._sink.close()
 
     @staticmethod
     def remove_multiple_lines(text):
@@ -78,21 +293,13 @@ class ExtractItems:
         :return: String without multiple newlines
         """
 
-        text = re.sub(r'(( )*\n( )*){2,}', '#NEWLINE', text)
-        text = re.sub(r'\n', ' ', text)
-        text = re.sub(r'(#NEWLINE)+', '\n', text).strip()
-        text = re.sub(r'[ ]{2,}', ' ', text)
+        text = MULTIPLE_LINES_RE.sub(_replace_lines, text)
 
-        return text
+        return text.strip()
 
     @staticmethod
     def strip_html(html_content):
-        html_content = re.sub(r'(<\s*/\s*(div|tr|p|li|)\s*>)', r'\1\n\n', html_content)
-        html_content = re.sub(r'(<br\s*>|<br\s*/>)', r'\1\n\n', html_content)
-        html_content = re.sub(r'(<\s*/\s*(th|td)\s*>)', r' \1 ', html_content)
-        html_content = HtmlStripper().strip_tags(html_content)
-
-        return html_content
+        return HtmlTextExtractor(remove_tables=False).strip_tags(html_content)
     
     @staticmethod
     def clean_text(text):
@@ -104,93 +311,126 @@ class ExtractItems:
         :return: String containing normalized, clean text
         """
 
-        text = re.sub(r'[\xa0]', ' ', text)
-        text = re.sub(r'[\u200b]', ' ', text)
-
-        text = re.sub(r'[\x91]', '‘', text)
-        text = re.sub(r'[\x92]', '’', text)
-        text = re.sub(r'[\x93]', '“', text)
-        text = re.sub(r'[\x94]', '”', text)
-        text = re.sub(r'[\x95]', '•', text)
-        text = re.sub(r'[\x96]', '-', text)
-        text = re.sub(r'[\x97]', '-', text)
-        text = re.sub(r'[\x98]', '˜', text)
-        text = re.sub(r'[\x99]', '™', text)
-
-        text = re.sub(r'[\u2010\u2011\u2012\u2013\u2014\u2015]', '-', text)
-
-        def remove_whitespace(match):
-            ws = r'[^\S\r\n]'
-            return f'{match[1]}{re.sub(ws, r"", match[2])}{match[3]}{match[4]}'
+        text = SPECIAL_CHAR_RE.sub(_map_char, text)
 
         # Fix broken section headers
-        text = re.sub(r'(\n[^\S\r\n]*)(P[^\S\r\n]*A[^\S\r\n]*R[^\S\r\n]*T)([^\S\r\n]+)((\d{1,2}|[IV]{1,2})[AB]?)',
-                        remove_whitespace, text, flags=re.IGNORECASE)
-        text = re.sub(r'(\n[^\S\r\n]*)(I[^\S\r\n]*T[^\S\r\n]*E[^\S\r\n]*M)([^\S\r\n]+)(\d{1,2}[AB]?)',
-                        remove_whitespace, text, flags=re.IGNORECASE)
-
-        text = re.sub(r'(ITEM|PART)(\s+\d{1,2}[AB]?)([\-•])', r'\1\2 \3 ', text, flags=re.IGNORECASE)
+        text = BROKEN_HEADER_RE.sub(_join_header, text)
+        text = HEADER_SEPARATOR_RE.sub(r'\1\2 \3 ', text)
 
         # Remove unnecessary headers
-        text = re.sub(r'\n[^\S\r\n]*'
-                        r'(TABLE\s+OF\s+CONTENTS|INDEX\s+TO\s+FINANCIAL\s+STATEMENTS|BACK\s+TO\s+CONTENTS|QUICKLINKS)'
-                        r'[^\S\r\n]*\n',
-                        '\n', text, flags=regex_flags)
+        text = UNNECESSARY_HEADER_RE.sub('\n', text)
 
         # Remove page numbers and headers
-        text = re.sub(r'\n[^\S\r\n]*[-‒–—]*\d+[-‒–—]*[^\S\r\n]*\n', '\n', text, flags=regex_flags)
-        text = re.sub(r'\n[^\S\r\n]*\d+[^\S\r\n]*\n', '\n', text, flags=regex_flags)
+        # (두 패턴은 연속된 쪽 번호 줄을 번갈아 지우므로 하나로 합치면 결과가 달라짐)
+        text = PAGE_NUMBER_RE.sub('\n', text)
+        text = BARE_NUMBER_RE.sub('\n', text)
 
-        text = re.sub(r'[\n\s]F[-‒–—]*\d+', '', text, flags=regex_flags)
-        text = re.sub(r'\n[^\S\r\n]*Page\s[\d*]+[^\S\r\n]*\n', '', text, flags=regex_flags)
+        text = FINANCIAL_PAGE_RE.sub('', text)
+        text = PAGE_HEADER_RE.sub('', text)
 
         return text
 
-    def remove_html_tables(self, html_files):
-        for key, value in html_files.items():
-            soup = BeautifulSoup(value, 'lxml')
-            tables = soup.find_all('table')
-            if len(tables):
-                for table in tables:
-                    table.extract()
-            html_files[key] = soup
-        
-        return html_files
+    @staticmethod
+    def normalize(html_content, remove_tables=False):
+        """
+        strip_html (without tables if `remove_tables`) -> clean_text -> remove_multiple_lines
+        """
+        text = HtmlTextExtractor(remove_tables).strip_tags(html_content)
+        return ExtractItems.remove_multiple_lines(ExtractItems.clean_text(text))
 
-    def extract_items(self, filing_metadata):
+    @staticmethod
+    def item_key(section_title):
+        return f"item_{section_title.strip().split('.')[0]}"
+
+    def settings_hash(self):
+        """
+        Hash of the extractor version and of the settings that change the
+        text of every item (items_to_extract is tracked per item)
+        """
+        settings = {'version': EXTRACTOR_VERSION, 'remove_tables': self.remove_tables}
+        return hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:16]
+
+    def tables_filepath(self, filing_metadata):
+        return os.path.join(self.extracted_tables_folder, f'{filing_metadata["filename"].split(".")[0]}.parquet')
+
+    def plan(self, filing_metadata):
+        """
+        Decides what process_filing has to do for a filing, from the raw file
+        hash, extractor settings and per-item hashes kept in its output
+
+        :return: None if the extracted JSON is up to date (or there is no raw
+                 file to extract from), otherwise the previous JSON content
+                 whose unchanged items can be reused ({} if everything has
+                 to be extracted)
+        """
+        path = raw_filepath(self.raw_files_folder, filing_metadata['filename'])
+        if not os.path.exists(path):
+            # 원본 파일이 없으면 추출할 수 없으므로 기존 결과를 그대로 둠
+            return None
+        if not self.skip_extracted_filings:
+            return {}
+        previous = self.sink.previous(filing_metadata['filename'])
+        if previous is None:
+            return {}
+
+        info = previous.get('_extraction')
+        # 버전 정보가 없는 예전 JSON 이나 설정이 바뀐 경우 전부 다시 추출
+        if not info or info.get('settings') != self.settings_hash():
+            return {}
+        if self.extract_tables and not os.path.exists(self.tables_filepath(filing_metadata)):
+            return {}
+
+        stat = os.stat(path)
+        if stat.st_size == info.get('raw_size') and stat.st_mtime == info.get('raw_mtime'):
+            raw_sha256 = info.get('raw_sha256')
+        else:
+            with open(path, 'rb') as file, mmap_file(file) as buf:
+                raw_sha256 = hashlib.sha256(buf).hexdigest()
+
+        if raw_sha256 == info.get('raw_sha256') and set(info.get('items', {})) == self.wanted_items:
+            return None
+        return previous
+
+    def extract_items(self, filing_metadata, tables=None, previous=None):
         """
         Extracts all items/sections for a A001 file and writes it to a json file
 
         :param filing_metadata: a pandas series containing all filings metadata
+        :param tables: if a dict is given, the tables of every extracted item
+                       are parsed in the same pass and stored in it by item
+                       (long format DataFrames, see tables.tables_frame)
+        :param previous: JSON content of an earlier extraction (see plan());
+                         items whose section is unchanged are copied from it
         """
-        absolute_filename = os.path.join(self.raw_files_folder, filing_metadata['filename'])
+        previous_items = previous['_extraction']['items'] if previous else {}
+        absolute_filename = raw_filepath(self.raw_files_folder, filing_metadata['filename'])
+        compression = compression_of(absolute_filename)
         html_files = {}
-        with open(absolute_filename, 'r', errors='backslashreplace') as file:
-            lines  = file.readlines()
-            current_html = ""
-            current_filename = None
-
-            for line in lines:
-                if delimiter in line:
-                    if current_filename is not None:
-                        if check_roman_numerals(current_filename):
-                            html_files[current_filename.strip()] = current_html
-
-                    current_filename = line.split(delimiter)[1].strip().rstrip("-->")
-                    current_html = ""
-                else:
-                    current_html += line
-            if current_filename is not None and check_roman_numerals(current_filename):
-                html_files[current_filename.strip()] = current_html
-
-        if self.remove_tables:
-            html_files = self.remove_html_tables(html_files)
+        encodings = {}
+        index = section_index.load_index(absolute_filename)
+        with timer('read_sections'), open(absolute_filename, 'rb') as file, mmap_file(file) as buf:
+            # sidecar index 가 있으면 파일을 다시 훑지 않고 바로 섹션 위치를 사용
+            # (압축된 파일은 추출할 섹션의 frame 만 풂)
+            if index is not None:
+                sections = [(s['title'], s) for s in index['sections']]
+                data = buf
+            else:
+                data = read_raw(buf, compression)
+                sections = [(title, {'offset': start, 'length': end - start}) for title, start, end in iter_sections(data)]
+                compression = None
+            for title, section in sections:
+                # 추출 대상 항목이 아닌 섹션은 decode 하지 않음
+                if not check_roman_numerals(title) or self.item_key(title) not in self.wanted_items:
+                    continue
+                html_files[title.strip()] = section_bytes(
+                    lambda offset, length: data[offset:offset + length], section, compression)
+                encodings[title.strip()] = section.get('encoding')
+            raw_sha256 = hashlib.sha256(buf).hexdigest()
+            stat = os.fstat(file.fileno())
+
         ##need 회사 정보 및 metadata?
         #if need -> pasrsing companies_info and add filing_metadata
-        with open(os.path.join(DATASET_DIR, 'companies_info.json'), encoding="utf-8") as f:
-            company_info_dict = json.load(fp=f)
-
-        company_info = company_info_dict[filing_metadata['corp_code']]
+        company_info = self.company(filing_metadata['corp_code'])
 
         json_content = {
             "corp_code": filing_metadata['corp_code'],
@@ -208,74 +448,273 @@ class ExtractItems:
             item_index = roman.toRoman(int(item_index))
             json_content[f'item_{item_index}'] = ''
 
-        for key, value in html_files.items():
-            value = ExtractItems.strip_html(str(value))
-            value = ExtractItems.clean_text(value)
-            value = ExtractItems.remove_multiple_lines(value)
-            item_idx = key.split('.')[0]
-            if json_content.get(f'item_{item_idx}', False)!=False:
-                json_content[f'item_{item_idx}'] = value
-
+        # 같은 항목의 섹션이 여러 개면 마지막에 처리되는 섹션의 내용이 남음
+        item_sections = {}
+        for key in html_files:
+            item_sections[ExtractItems.item_key(key)] = key
+
+        items = {key: {'section': None, 'text': _sha256('')} for key in self.wanted_items}
+        for item, key in item_sections.items():
+            data = html_files[key]
+            section_hash = hashlib.sha256(data).hexdigest()
+            if previous_items.get(item, {}).get('section') == section_hash and item in previous:
+                value = previous[item]
+                incr('items_reused')
+            else:
+                parser = HtmlTextExtractor(self.remove_tables, collect_tables=tables is not None)
+                try:
+                    html = decode_section(data, encodings[key])
+                except ValueError as e:
+                    # 인코딩을 알 수 없는 섹션은 추측해서 읽지 않음
+                    print(f"Skipping {filing_metadata['filename']}, {key}: {e}")
+                    return None
+                with timer('strip_html', remove_tables=self.remove_tables):
+                    text = parser.strip_tags(html)
+                with timer('clean_text'):
+                    text = ExtractItems.clean_text(text)
+                with timer('remove_multiple_lines'):
+                    value = ExtractItems.remove_multiple_lines(text)
+                if tables is not None:
+                    roman_item = key.strip().split('.')[0]
+                    with timer('tables_frame'):
+                        tables[roman_item] = tables_frame(parser.tables, filing_metadata['rcept_no'], roman_item)
+                incr('items_extracted')
+                incr('section_bytes', len(data))
+            json_content[item] = value
+            items[item] = {'section': section_hash, 'text': _sha256(value)}
+
+        json_content['_extraction'] = {
+            'version': EXTRACTOR_VERSION,
+            'settings': self.settings_hash(),
+            'raw_sha256': raw_sha256,
+            'raw_size': stat.st_size,
+            'raw_mtime': stat.st_mtime,
+            'items': items,
+        }
         return json_content
 
 
     def process_filing(self, filing_metadata):
-        json_filename = f'{filing_metadata["filename"].split(".")[0]}.json'
-        absolute_json_filename = os.path.join(self.extracted_files_folder, json_filename)
-        if self.skip_extracted_filings and os.path.exists(absolute_json_filename):
+        with profiled(filing_metadata['rcept_no']), timer('process_filing'):
+            return self._process_filing(filing_metadata)
+
+    def _process_filing(self, filing_metadata):
+        if 'reuse' in filing_metadata:
+            # plan_extraction 에서 이미 추출 대상으로 정해진 공시는 다시 확인하지 않음
+            previous = (self.sink.previous(filing_metadata['filename']) or {}) if filing_metadata['reuse'] else {}
+        else:
+            with timer('plan'):
+                previous = self.plan(filing_metadata)
+        if previous is None:
+            incr('filings_up_to_date')
             return 0
-        
-        json_content = self.extract_items(filing_metadata)
 
-        if json_content is not None:
-            with open(absolute_json_filename, 'w') as filepath:
-                json.dump(json_content, filepath, indent=4, ensure_ascii=False)
+        tables = {} if self.extract_tables else None
+        json_content = self.extract_items(filing_metadata, tables, previous)
 
+        if json_content is not None:
+            with timer('sink_write', output_format=self.output_format):
+                self.sink.write(filing_metadata['filename'], json_content)
+            if tables is not None:
+                frames = list(tables.values())
+                tables_filepath = self.tables_filepath(filing_metadata)
+                if previous and os.path.exists(tables_filepath):
+                    # 다시 추출하지 않은 항목의 표는 기존 파일에서 가져옴
+                    kept = {key[5:] for key in self.wanted_items} - set(tables)
+                    frames.insert(0, load_tables(tables_filepath, items=sorted(kept)))
+                df = pd.concat(frames, ignore_index=True) if frames else tables_frame([], None, None)
+                with timer('write_tables'):
+                    write_tables(df, tables_filepath)
+
+        incr('filings_extracted')
         return 1
 
-def main():
 
-    filings_metadata_filepath = os.path.join(DATASET_DIR, config['filings_metadata_file'])
-    if os.path.exists(filings_metadata_filepath):
-        filings_metadata_df = pd.read_csv(filings_metadata_filepath, dtype=str)
-        filings_metadata_df = filings_metadata_df.drop_duplicates(subset=['filename']).reset_index(drop=True)
-        filings_metadata_df = filings_metadata_df.replace({np.nan: None})
-    else:
-        print(f'No such file "{filings_metadata_filepath}"')
-        return
-    
+def plan_extraction(filings_metadata_df, extraction):
+    """
+    Filings whose extracted JSON is missing or outdated
+
+    :param extraction: ExtractItems whose settings the JSON files are checked against
+    :return: the outdated filings with a `reuse` column, True if items of the
+             previous JSON can be reused (passed on to process_filing so the
+             workers don't plan them again)
+    """
+    plans = [extraction.plan(filing) for _, filing in filings_metadata_df.iterrows()]
+    outdated = filings_metadata_df[[previous is not None for previous in plans]].copy()
+    outdated['reuse'] = [bool(previous) for previous in plans if previous is not None]
+    return outdated
+
+
+# ExtractItems 로 넘길 공시 정보 (worker 에 Series 대신 dict 로 전달)
+TASK_FIELDS = ['filename', 'rcept_no', 'corp_code', 'corp_name', 'stock_code', 'filing_types', 'rcept_dt']
+
+_worker_extraction = None
+
+
+def init_worker(extraction_kwargs, metrics_dir=None):
+    """
+    Builds the ExtractItems of a worker process once, with its company info
+
+    :param metrics_dir: folder the worker dumps its metrics to when it exits
+                        (collected by the parent with metrics.collect); None
+                        when extracting in the parent process
+    """
+    global _worker_extraction
+    if metrics_dir is not None:
+        # fork 된 worker 는 부모의 metrics 를 물려받으므로 비우고 시작 (안 그러면 collect 에서 중복 합산)
+        metrics.reset()
+    _worker_extraction = ExtractItems(**extraction_kwargs)
+    _worker_extraction.companies
+    # worker 가 끝날 때 마지막 shard 를 닫음 (pool 을 terminate 하지 않고 close/join 해야 실행됨)
+    Finalize(_worker_extraction, _worker_extraction.close, exitpriority=10)
+    if metrics_dir is not None:
+        Finalize(None, metrics.dump, args=(metrics_dir,), exitpriority=5)
+
+
+def process_task(task):
+    return _worker_extraction.process_filing(task)
+
+
+def extract_filings(filings_metadata_df, extraction_kwargs, workers=None, chunksize=None, ordered=True):
+    """
+    Runs ExtractItems.process_filing over the filings on `workers` processes
+
+    :param filings_metadata_df: filings metadata, one row per filing
+    :param extraction_kwargs: ExtractItems arguments, each worker builds its own
+    :param workers: number of processes (default os.cpu_count()), 1 runs in this process
+    :param chunksize: tasks sent to a worker at a time (default ~4 chunks per worker)
+    :param ordered: if False results are returned as they complete
+    :return: process_filing results
+    """
+    fields = TASK_FIELDS + [field for field in ['reuse'] if field in filings_metadata_df]
+    tasks = filings_metadata_df[fields].to_dict('records')
+    workers = max(1, min(workers or os.cpu_count() or 1, len(tasks)))
+    if chunksize is None:
+        chunksize = max(1, len(tasks) // (workers * 4))
+
+    if workers == 1:
+        init_worker(extraction_kwargs)
+        try:
+            return list(tqdm(map(process_task, tasks), total=len(tasks), ncols=100))
+        finally:
+            _worker_extraction.close()
+
+    metrics_dir = tempfile.mkdtemp(prefix='metrics-')
+    try:
+        with Pool(processes=workers, initializer=init_worker, initargs=(extraction_kwargs, metrics_dir)) as pool:
+            imap = pool.imap if ordered else pool.imap_unordered
+            processed = list(tqdm(imap(process_task, tasks, chunksize), total=len(tasks), ncols=100))
+            pool.close()
+            pool.join()
+        metrics.collect(metrics_dir)
+    finally:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+    return processed
+
+
+def open_filing(filename: str, raw_files_folder: str = None) -> RawFiling:
+    """
+    Opens a raw filing for random access to its sections
+
+        with open_filing('005930_A001_2023_..._20230307.html') as filing:
+            item_2 = filing.read_item('II')
+    """
+    if raw_files_folder is None:
+        raw_files_folder = os.path.join(DATASET_DIR, config['raw_filings_folder'])
+    return RawFiling(raw_filepath(raw_files_folder, filename))
+
+
+def extraction_settings(metadata_db_path):
+    """
+    ExtractItems arguments from config.json, creating the output folders
+
+    :return: None (after printing why) if the configuration can't be used
+    """
     raw_filings_folder = os.path.join(DATASET_DIR, config['raw_filings_folder'])
     if not os.path.isdir(raw_filings_folder):
         print(f'No such directory: "{raw_filings_folder}')
-        return
+        return None
     
     extracted_filings_folder = os.path.join(DATASET_DIR, config['extracted_filings_folder'])
 
     if not os.path.isdir(extracted_filings_folder):
         os.mkdir(extracted_filings_folder)
 
-    extraction = ExtractItems(
+    extract_tables = config.get('extract_tables', False)
+    extracted_tables_folder = os.path.join(DATASET_DIR, config.get('extracted_tables_folder', 'EXTRACTED_TABLES'))
+    if extract_tables:
+        if not parquet_available():
+            print('extract_tables needs pyarrow or fastparquet to write Parquet files')
+            return None
+        os.makedirs(extracted_tables_folder, exist_ok=True)
+
+    output_format = config.get('output_format', 'json')
+    output_compression = config.get('output_compression')
+    if output_format == 'parquet' and not parquet_available():
+        print('output_format "parquet" needs pyarrow or fastparquet')
+        return None
+    if not compression_available(output_compression):
+        print(f'output_compression "{output_compression}" needs the zstandard package')
+        return None
+
+    return dict(
         remove_tables=config['remove_tables'],
         items_to_extract=config['items_to_extract'],
         raw_files_folder=raw_filings_folder,
         extracted_files_folder=extracted_filings_folder,
-        skip_extracted_filings=config['skip_extracted_filings']
+        skip_extracted_filings=config['skip_extracted_filings'],
+        metadata_db_path=metadata_db_path,
+        extract_tables=extract_tables,
+        extracted_tables_folder=extracted_tables_folder,
+        output_format=output_format,
+        output_compression=output_compression,
+        shard_size=config.get('shard_size', 1000),
     )
 
-    print("Starting extraction...\n")
 
-    list_of_series = list(zip(*filings_metadata_df.iterrows()))[1]
+def main():
 
-    with ProcessPool(processes=1) as pool:
-        processed = list(tqdm(
-            pool.imap(extraction.process_filing, list_of_series),
-            total=len(list_of_series),
-            ncols=100
-        ))
+    metadata_db_path = os.path.join(DATASET_DIR, config['metadata_db_file'])
+    if os.path.exists(metadata_db_path) or os.path.exists(os.path.join(DATASET_DIR, config['filings_metadata_file'])):
+        store = metadata_store.open_store(DATASET_DIR, config['metadata_db_file'], config['filings_metadata_file'])
+        filings_metadata_df = store.filings().drop_duplicates(subset=['filename']).reset_index(drop=True)
+        filings_metadata_df = filings_metadata_df.replace({np.nan: None})
+        # 아직 받지 않은 공시 (filename 없음) 는 제외, 원본이 없는 공시는 plan 에서 건너뜀
+        filings_metadata_df = filings_metadata_df[filings_metadata_df['filename'].notna()]
+        store.close()
+    else:
+        print(f'No such file "{metadata_db_path}"')
+        return
+    
+    extraction_kwargs = extraction_settings(metadata_db_path)
+    if extraction_kwargs is None:
+        return
+    extracted_filings_folder = extraction_kwargs['extracted_files_folder']
+    extracted_tables_folder = extraction_kwargs['extracted_tables_folder']
+
+    with timer('plan_extraction'):
+        outdated_df = plan_extraction(filings_metadata_df, ExtractItems(**extraction_kwargs))
+    print(f'{len(filings_metadata_df) - len(outdated_df)} filings are up to date, {len(outdated_df)} to extract')
+
+    print("Starting extraction...\n")
+
+    processed = extract_filings(
+        outdated_df,
+        extraction_kwargs,
+        workers=config.get('workers'),
+        chunksize=config.get('chunksize'),
+        ordered=config.get('ordered', True),
+    )
 
     print(f'\nItem extraction is completed successfully.')
     print(f'{sum(processed)} files were processed.')
     print(f'Extracted filings are saved to: {extracted_filings_folder}')
+    if extraction_kwargs['extract_tables']:
+        print(f'Extracted tables are saved to: {extracted_tables_folder}')
+    if config.get('update_search_index', False):
+        with timer('update_search_index'):
+            search_index.update_index(extracted_filings_folder)
+    metrics.report('extract')
 
     
 
@@ -0,0 +1,96 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from utils import make_api_call
+
+
+class DownloadStats:
+    """
+    Throughput / latency counters shared by all download threads
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.requests = 0
+        self.errors = 0
+        self.bytes = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def record(self, latency: float, status_code: Optional[int], size: int) -> None:
+        """
+        :param status_code: None if the request raised (counted as an error)
+        """
+        with self.lock:
+            self.requests += 1
+            self.bytes += size
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+            if status_code != 200:
+                self.errors += 1
+
+    def summary(self) -> Dict:
+        with self.lock:
+            elapsed = time.monotonic() - self.started
+            return {
+                'requests': self.requests,
+                'errors': self.errors,
+                'bytes': self.bytes,
+                'elapsed': elapsed,
+                'requests_per_sec': self.requests / elapsed if elapsed > 0 else 0.0,
+                'latency_avg': self.latency_total / self.requests if self.requests else 0.0,
+                'latency_max': self.latency_max,
+            }
+
+    def __str__(self):
+        s = self.summary()
+        return (f"{s['requests']} requests ({s['errors']} errors) in {s['elapsed']:.1f}s, "
+                f"{s['requests_per_sec']:.2f} req/s, {s['bytes'] / 1e6:.1f} MB, "
+                f"latency avg {s['latency_avg']:.2f}s / max {s['latency_max']:.2f}s")
+
+
+class SubDocDownloader:
+    """
+    Fetches sub-documents concurrently; the request rate is bounded by the
+    per-host token buckets in rate_limiter, not by the number of workers
+    """
+
+    def __init__(self, max_workers: int = 8):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='subdoc')
+        self.stats = DownloadStats()
+
+    def fetch(self, url: str):
+        start = time.monotonic()
+        try:
+            r = make_api_call(url)
+        except Exception:
+            self.stats.record(time.monotonic() - start, None, 0)
+            raise
+        self.stats.record(time.monotonic() - start, r.status_code, len(r.content))
+        return r
+
+    def fetch_all(self, urls: List[str]) -> List:
+        """
+        :param urls: sub-document urls in sub_docs() order
+        :return: responses in the same order as `urls`
+        """
+        return list(self.executor.map(self.fetch, urls))
+
+    def fetch_iter(self, urls: List[str]) -> Iterator[Tuple[int, object]]:
+        """
+        Yields (index into `urls`, response) as downloads complete; a request
+        that raised yields the exception instead of a response
+        """
+        futures = {self.executor.submit(self.fetch, url): i for i, url in enumerate(urls)}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result()
+            except Exception as e:
+                yield futures[future], e
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,79 @@
+import os
+import json
+import hashlib
+import threading
+from urllib.parse import parse_qsl, urlencode, urlparse
+
+from typing import Dict, Optional
+
+import requests
+
+from http_cache import IGNORED_PARAMS
+
+
+# 재생할 때 필요한 응답 헤더만 저장
+RECORDED_HEADERS = ('content-type', 'content-disposition', 'last-modified', 'etag', 'retry-after')
+
+
+def fixture_key(url: str, params: Optional[Dict] = None) -> str:
+    """
+    Key of a request independent of the host and of where the query is
+    written, so responses recorded from opendart.fss.or.kr / dart.fss.or.kr
+    are found again by the stub server:
+        fixture_key('http://dart.fss.or.kr/dsaf001/main.do?rcpNo=1')
+        == fixture_key('/dsaf001/main.do', {'rcpNo': 1})
+    """
+    parsed = urlparse(url)
+    query = parse_qsl(parsed.query, keep_blank_values=True)
+    query += [(k, str(v)) for k, v in (params or {}).items()]
+    items = sorted((k, v) for k, v in query if k not in IGNORED_PARAMS)
+    return hashlib.sha256(f'{parsed.path}?{urlencode(items)}'.encode()).hexdigest()
+
+
+class FixtureStore:
+    """
+    Recorded responses, one file per request: {key}.json (url, status,
+    headers) next to the raw body {key}.body. Written by make_api_call in
+    record mode (utils.configure_recorder), served by stub_server
+    """
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self.lock = threading.Lock()
+        self.recorded = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.folder, key[:2], key)
+
+    def put(self, url: str, params: Optional[Dict], response: requests.Response) -> None:
+        path = self._path(fixture_key(url, params))
+        meta = {
+            'url': url,
+            'params': {k: str(v) for k, v in (params or {}).items() if k not in IGNORED_PARAMS},
+            'status_code': response.status_code,
+            'encoding': response.encoding,
+            'headers': {k: v for k, v in response.headers.items() if k.lower() in RECORDED_HEADERS},
+        }
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(response.content)
+        os.replace(tmp, path + '.body')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp, path + '.json')
+        with self.lock:
+            self.recorded += 1
+
+    def get(self, url: str, params: Optional[Dict] = None):
+        """
+        :return: (meta, body) of the recorded response, or None
+        """
+        path = self._path(fixture_key(url, params))
+        try:
+            with open(path + '.json', encoding='utf-8') as f:
+                meta = json.load(f)
+            with open(path + '.body', 'rb') as f:
+                return meta, f.read()
+        except (OSError, ValueError):
+            return None
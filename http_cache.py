@@ -0,0 +1,167 @@
+import os
+import re
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+from urllib.parse import urlencode
+
+from typing import Dict, Optional
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+
+# 엔드포인트별 TTL (초). None 이면 만료되지 않음(immutable), 0 이면 캐시하지 않음
+DEFAULT_TTL = {
+    r'/report/viewer\.do': None,  # rcpNo + dcmNo + eleId 로 고정된 하위 문서
+    r'/dsaf001/main\.do': None,  # 제출된 공시의 목차
+    r'/api/list\.json': 24 * 60 * 60,
+    r'/api/company\.json': 30 * 24 * 60 * 60,
+    r'/api/corpCode\.xml': 0,  # dart_api.corp_code_list 가 따로 캐시
+}
+
+# 캐시 키에서 제외할 파라미터 (API 키가 바뀌어도 같은 응답)
+IGNORED_PARAMS = {'crtfc_key'}
+
+
+class ResponseCache:
+    """
+    Persistent response cache. Entries are keyed by URL + params; bodies are
+    stored zlib-compressed and content-addressed by their sha256, so identical
+    responses share one file. The total body size is bounded by evicting the
+    least recently used entries
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int, ttl: Optional[Dict] = None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl = [(re.compile(pattern), seconds) for pattern, seconds in (ttl or DEFAULT_TTL).items()]
+        self.lock = threading.Lock()
+        os.makedirs(os.path.join(cache_dir, 'bodies'), exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(cache_dir, 'index.sqlite'), check_same_thread=False)
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                url TEXT,
+                body_hash TEXT,
+                status_code INTEGER,
+                encoding TEXT,
+                headers TEXT,
+                expires REAL,
+                accessed REAL
+            );
+            CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+            CREATE TABLE IF NOT EXISTS bodies (
+                hash TEXT PRIMARY KEY,
+                size INTEGER
+            );
+        ''')
+        self.db.commit()
+        self.total_bytes = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM bodies').fetchone()[0]
+
+    @staticmethod
+    def key(url: str, params: Optional[Dict] = None) -> str:
+        items = sorted((k, str(v)) for k, v in (params or {}).items() if k not in IGNORED_PARAMS)
+        return hashlib.sha256(f'{url}?{urlencode(items)}'.encode()).hexdigest()
+
+    def ttl_for(self, url: str, params: Optional[Dict] = None):
+        # 오늘까지의 기간 조회(list.json 의 진행 중인 분기)는 새 공시가 계속 추가되므로 캐시하지 않음
+        end_de = str((params or {}).get('end_de', ''))
+        if end_de and end_de >= time.strftime('%Y%m%d'):
+            return 0
+        for pattern, seconds in self.ttl:
+            if pattern.search(url):
+                return seconds
+        return 0
+
+    def _body_path(self, body_hash: str) -> str:
+        return os.path.join(self.cache_dir, 'bodies', body_hash[:2], body_hash + '.z')
+
+    def get(self, url: str, params: Optional[Dict] = None) -> Optional[requests.Response]:
+        if self.ttl_for(url, params) == 0:
+            return None
+        key = self.key(url, params)
+        now = time.time()
+        with self.lock:
+            row = self.db.execute(
+                'SELECT body_hash, status_code, encoding, headers, expires FROM entries WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            body_hash, status_code, encoding, headers, expires = row
+            if expires is not None and expires < now:
+                self.db.execute('DELETE FROM entries WHERE key = ?', (key,))
+                self.db.commit()
+                return None
+            self.db.execute('UPDATE entries SET accessed = ? WHERE key = ?', (now, key))
+            self.db.commit()
+        try:
+            with open(self._body_path(body_hash), 'rb') as f:
+                content = zlib.decompress(f.read())
+        except (OSError, zlib.error):
+            return None
+
+        r = requests.Response()
+        r.status_code = status_code
+        r._content = content
+        r.encoding = encoding
+        r.headers = CaseInsensitiveDict(json.loads(headers))
+        r.url = url
+        return r
+
+    def put(self, url: str, params: Optional[Dict], response: requests.Response) -> None:
+        ttl = self.ttl_for(url, params)
+        if ttl == 0:
+            return
+        content = response.content
+        body_hash = hashlib.sha256(content).hexdigest()
+        path = self._body_path(body_hash)
+        now = time.time()
+        headers = {k: v for k, v in response.headers.items() if k.lower() in ('content-type', 'last-modified', 'etag')}
+
+        with self.lock:
+            if self.db.execute('SELECT 1 FROM bodies WHERE hash = ?', (body_hash,)).fetchone() is None:
+                data = zlib.compress(content, 6)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp = f'{path}.{threading.get_ident()}.tmp'
+                with open(tmp, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp, path)
+                self.db.execute('INSERT INTO bodies (hash, size) VALUES (?, ?)', (body_hash, len(data)))
+                self.total_bytes += len(data)
+            self.db.execute(
+                'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (self.key(url, params), url, body_hash, response.status_code, response.encoding,
+                 json.dumps(headers), None if ttl is None else now + ttl, now)
+            )
+            self._evict()
+            self.db.commit()
+
+    def _evict(self) -> None:
+        if self.total_bytes <= self.max_bytes:
+            return
+        for key, body_hash in self.db.execute('SELECT key, body_hash FROM entries ORDER BY accessed').fetchall():
+            self.db.execute('DELETE FROM entries WHERE key = ?', (key,))
+            if self.db.execute('SELECT 1 FROM entries WHERE body_hash = ?', (body_hash,)).fetchone() is None:
+                size = self.db.execute('SELECT size FROM bodies WHERE hash = ?', (body_hash,)).fetchone()[0]
+                self.db.execute('DELETE FROM bodies WHERE hash = ?', (body_hash,))
+                try:
+                    os.remove(self._body_path(body_hash))
+                except OSError:
+                    pass
+                self.total_bytes -= size
+            if self.total_bytes <= self.max_bytes:
+                break
+
+
+def is_cacheable(response: requests.Response) -> bool:
+    if response.status_code != 200:
+        return False
+    # OpenDART 오류(status != 000, 013: 조회된 데이터 없음)는 저장하지 않음
+    head = response.content[:200].replace(b' ', b'')
+    if head.startswith(b'{'):
+        return b'"status":"000"' in head or b'"status":"013"' in head
+    return True
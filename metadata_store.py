@@ -0,0 +1,189 @@
+import os
+import json
+import sqlite3
+import threading
+from urllib.parse import urlparse, parse_qs
+
+from typing import Dict, Optional, Set
+
+import pandas as pd
+
+from compression import COMPRESSION_SUFFIXES, compression_of
+
+
+FILING_COLUMNS = [
+    'rcept_no', 'corp_code', 'corp_name', 'stock_code', 'corp_cls', 'report_nm',
+    'flr_nm', 'rcept_dt', 'rm', 'year', 'filing_types', 'filename',
+]
+SECTION_COLUMNS = ['rcept_no', 'seq', 'title', 'url', 'dcm_no', 'ele_id']
+COMPANY_COLUMNS = [
+    'corp_code', 'company_name', 'company_name_eng', 'stock_code', 'ceo_name',
+    'address', 'induty_code', 'establish_date',
+]
+
+SCHEMA = f'''
+    CREATE TABLE IF NOT EXISTS filings (
+        {', '.join(c + ' TEXT' for c in FILING_COLUMNS)},
+        PRIMARY KEY (rcept_no)
+    );
+    CREATE INDEX IF NOT EXISTS filings_corp_code ON filings (corp_code);
+    CREATE INDEX IF NOT EXISTS filings_filename ON filings (filename);
+    CREATE TABLE IF NOT EXISTS sections (
+        rcept_no TEXT, seq INTEGER, title TEXT, url TEXT, dcm_no TEXT, ele_id TEXT,
+        PRIMARY KEY (rcept_no, seq)
+    );
+    CREATE TABLE IF NOT EXISTS index_watermarks (
+        index_file TEXT PRIMARY KEY, rcept_no TEXT, rcept_dt TEXT, complete INTEGER, updated TEXT
+    );
+    CREATE TABLE IF NOT EXISTS companies (
+        {', '.join(c + ' TEXT' for c in COMPANY_COLUMNS)},
+        PRIMARY KEY (corp_code)
+    );
+'''
+
+
+class MetadataStore:
+    """
+    SQLite store for filings (one row per rcept_no), their sub-documents
+    (sections) and company info, replacing FILINGS_METADATA.csv and
+    companies_info.json. One connection per process; writes are serialised
+    with a lock so crawler threads can share it
+    """
+
+    def __init__(self, path: str, read_only: bool = False):
+        self.path = path
+        self.lock = threading.Lock()
+        if read_only:
+            self.db = sqlite3.connect(f'file:{path}?mode=ro', uri=True, check_same_thread=False)
+        else:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.executescript(SCHEMA)
+            self.db.commit()
+
+    def _query(self, sql: str, params=()):
+        with self.lock:
+            return self.db.execute(sql, params).fetchall()
+
+    def _query_df(self, sql: str, params=()) -> pd.DataFrame:
+        with self.lock:
+            return pd.read_sql_query(sql, self.db, params=params)
+
+    def is_empty(self) -> bool:
+        return not self._query('SELECT 1 FROM filings LIMIT 1')
+
+    def import_legacy(self, metadata_filepath: str, companies_filepath: str) -> None:
+        """
+        One-off import of FILINGS_METADATA.csv and companies_info.json
+        """
+        if os.path.exists(metadata_filepath):
+            df = pd.read_csv(metadata_filepath, dtype=str)
+            for _, filing in df.groupby('rcept_no', sort=False):
+                self.upsert_filing(filing.drop_duplicates(subset=['url']))
+        if os.path.exists(companies_filepath):
+            with open(companies_filepath, encoding='utf-8') as f:
+                for corp_code, info in json.load(f).items():
+                    self.upsert_company(corp_code, info)
+
+    def upsert_filing(self, df: pd.DataFrame) -> None:
+        """
+        :param df: sub-document rows of one filing as returned by crawl()
+        """
+        df = df.astype(object).where(df.notna(), None)
+        first = df.iloc[0]
+        rcept_no = first['rcept_no']
+        filing = tuple(first.get(c) for c in FILING_COLUMNS)
+        sections = []
+        for seq, (title, url) in enumerate(zip(df['title'], df['url'])):
+            query = parse_qs(urlparse(url).query)
+            sections.append((rcept_no, seq, title, url, query.get('dcmNo', [None])[0], query.get('eleId', [None])[0]))
+
+        with self.lock:
+            self.db.execute(f'INSERT OR REPLACE INTO filings VALUES ({", ".join("?" * len(FILING_COLUMNS))})', filing)
+            self.db.execute('DELETE FROM sections WHERE rcept_no = ?', (rcept_no,))
+            self.db.executemany('INSERT INTO sections VALUES (?, ?, ?, ?, ?, ?)', sections)
+            self.db.commit()
+
+    def upsert_company(self, corp_code: str, info: Dict) -> None:
+        row = (corp_code,) + tuple(info.get(c) for c in COMPANY_COLUMNS[1:])
+        with self.lock:
+            self.db.execute(f'INSERT OR REPLACE INTO companies VALUES ({", ".join("?" * len(COMPANY_COLUMNS))})', row)
+            self.db.commit()
+
+    def get_filing(self, rcept_no: str) -> Optional[Dict]:
+        rows = self._query('SELECT * FROM filings WHERE rcept_no = ?', (rcept_no,))
+        return dict(zip(FILING_COLUMNS, rows[0])) if rows else None
+
+    def get_sections(self, rcept_no: str) -> pd.DataFrame:
+        return self._query_df('SELECT * FROM sections WHERE rcept_no = ? ORDER BY seq', (rcept_no,))
+
+    def get_company(self, corp_code: str) -> Optional[Dict]:
+        rows = self._query('SELECT * FROM companies WHERE corp_code = ?', (corp_code,))
+        return dict(zip(COMPANY_COLUMNS, rows[0])) if rows else None
+
+    def companies(self) -> Dict[str, Dict]:
+        return {row[0]: dict(zip(COMPANY_COLUMNS, row)) for row in self._query('SELECT * FROM companies')}
+
+    def get_watermark(self, index_file: str) -> Optional[Dict]:
+        rows = self._query('SELECT rcept_no, rcept_dt, complete FROM index_watermarks WHERE index_file = ?', (index_file,))
+        if not rows:
+            return None
+        rcept_no, rcept_dt, complete = rows[0]
+        return {'rcept_no': rcept_no, 'rcept_dt': rcept_dt, 'complete': bool(complete)}
+
+    def set_watermark(self, index_file: str, rcept_no: Optional[str], rcept_dt: Optional[str], complete: bool) -> None:
+        """
+        Latest rcept_no / rcept_dt seen in a quarter's index; `complete` once
+        the whole quarter has been downloaded
+        """
+        with self.lock:
+            self.db.execute(
+                'INSERT OR REPLACE INTO index_watermarks VALUES (?, ?, ?, ?, datetime(\'now\'))',
+                (index_file, rcept_no, rcept_dt, int(complete))
+            )
+            self.db.commit()
+
+    def filings(self, corp_code: Optional[str] = None) -> pd.DataFrame:
+        if corp_code is None:
+            return self._query_df('SELECT * FROM filings')
+        return self._query_df('SELECT * FROM filings WHERE corp_code = ?', (corp_code,))
+
+    def downloaded_rcept_nos(self, raw_filings_folder: str) -> Set[str]:
+        existing_files = set()
+        # 압축해 저장한 공시(.html.gz / .html.zst)도 받은 것으로 봄
+        for name in os.listdir(raw_filings_folder):
+            compression = compression_of(name)
+            existing_files.add(name[:-len(COMPRESSION_SUFFIXES[compression])] if compression else name)
+        return {rcept_no for rcept_no, filename in self._query('SELECT rcept_no, filename FROM filings')
+                if filename in existing_files}
+
+    def close(self) -> None:
+        self.db.close()
+
+
+def open_store(dataset_dir: str, db_file: str, metadata_file: str, read_only: bool = False) -> MetadataStore:
+    """
+    Opens DATASET_DIR/db_file, importing the legacy CSV/JSON files the first
+    time the store is created
+    """
+    path = os.path.join(dataset_dir, db_file)
+    if read_only:
+        return MetadataStore(path, read_only=True)
+    store = MetadataStore(path)
+    if store.is_empty():
+        store.import_legacy(os.path.join(dataset_dir, metadata_file), os.path.join(dataset_dir, 'companies_info.json'))
+    return store
+
+
+def plan_downloads(indices: pd.DataFrame, store: MetadataStore, raw_filings_folder: str) -> pd.DataFrame:
+    """
+    Returns the rows of `indices` whose filing is not downloaded yet, i.e. is
+    not in the store or whose raw file is missing. Hash join on rcept_no,
+    O(n) in both inputs
+
+    :param indices: filings from get_specific_indices()
+    :param store: filings metadata
+    :param raw_filings_folder: folder of the downloaded filings
+    """
+    downloaded = store.downloaded_rcept_nos(raw_filings_folder)
+    return indices[~indices['rcept_no'].isin(downloaded)]
@@ -0,0 +1,244 @@
+import os
+import io
+import glob
+import json
+import time
+import pstats
+import cProfile
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+from typing import Dict, Optional
+
+
+DATASET_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'datasets')
+
+_config = None
+
+# Prometheus textfile 의 metric 이름 앞에 붙임
+PREFIX = 'dart'
+
+
+def get_config() -> Dict:
+    """
+    config['metrics'] of ./config.json, read on first use so that importing
+    this module doesn't need one ({} without a config.json)
+    """
+    global _config
+    if _config is None:
+        try:
+            with open('config.json') as fin:
+                _config = json.load(fin).get('metrics', {})
+        except FileNotFoundError:
+            _config = {}
+    return _config
+
+
+def _key(name: str, labels: Dict) -> str:
+    """
+    'make_api_call', {'endpoint': '/api/list.json'} -> 'make_api_call{endpoint="/api/list.json"}'
+    """
+    if not labels:
+        return name
+    return name + '{' + ','.join(f'{k}="{v}"' for k, v in sorted(labels.items())) + '}'
+
+
+def _split_key(key: str):
+    name, _, labels = key.partition('{')
+    return name, '{' + labels if labels else ''
+
+
+class Metrics:
+    """
+    Timers (calls, total and max seconds) and counters of one process. Worker
+    processes dump theirs with `dump`, the parent adds them up with `collect`
+
+        with metrics.timer('clean_text'):
+            ...
+        metrics.incr('items_reused')
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timers = {}
+        self.counters = {}
+        self.started = time.time()
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        key = _key(name, labels)
+        with self.lock:
+            t = self.timers.get(key)
+            if t is None:
+                t = self.timers[key] = {'calls': 0, 'seconds': 0.0, 'max': 0.0}
+            t['calls'] += 1
+            t['seconds'] += seconds
+            t['max'] = max(t['max'], seconds)
+
+    def incr(self, name: str, value: float = 1, **labels) -> None:
+        key = _key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def timed(self, name: str = None):
+        """
+        Decorator timing every call of the function (as `name`, default its qualified name)
+        """
+        def decorate(fn):
+            timer_name = name or fn.__qualname__
+
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.timer(timer_name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            return {
+                'timers': {key: dict(t) for key, t in self.timers.items()},
+                'counters': dict(self.counters),
+            }
+
+    def merge(self, snapshot: Dict) -> None:
+        with self.lock:
+            for key, other in snapshot['timers'].items():
+                t = self.timers.setdefault(key, {'calls': 0, 'seconds': 0.0, 'max': 0.0})
+                t['calls'] += other['calls']
+                t['seconds'] += other['seconds']
+                t['max'] = max(t['max'], other['max'])
+            for key, value in snapshot['counters'].items():
+                self.counters[key] = self.counters.get(key, 0) + value
+
+    def reset(self) -> None:
+        with self.lock:
+            self.timers = {}
+            self.counters = {}
+            self.started = time.time()
+
+    def dump(self, folder: str) -> None:
+        """
+        Writes this process' metrics to `folder` for the parent's `collect`
+        """
+        path = os.path.join(folder, f'worker-{os.getpid()}.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(path + '.tmp', path)
+
+    def collect(self, folder: str) -> int:
+        """
+        Adds the metrics dumped by worker processes into `folder` and removes them
+
+        :return: number of workers collected
+        """
+        paths = glob.glob(os.path.join(folder, 'worker-*.json'))
+        for path in paths:
+            with open(path) as f:
+                self.merge(json.load(f))
+            os.remove(path)
+        return len(paths)
+
+    def summary(self) -> str:
+        s = self.snapshot()
+        lines = [f'{"timer":<48} {"calls":>8} {"total s":>10} {"avg ms":>9} {"max ms":>9}']
+        for key, t in sorted(s['timers'].items(), key=lambda item: -item[1]['seconds']):
+            lines.append(f"{key:<48} {t['calls']:>8} {t['seconds']:>10.2f} "
+                         f"{t['seconds'] / t['calls'] * 1000:>9.1f} {t['max'] * 1000:>9.1f}")
+        for key, value in sorted(s['counters'].items()):
+            lines.append(f'{key:<48} {value:>8g}')
+        return '\n'.join(lines)
+
+    def prometheus(self, run: str) -> str:
+        """
+        Prometheus text exposition format (for node_exporter's textfile collector)
+        """
+        s = self.snapshot()
+        families = {}  # 같은 metric 의 샘플은 TYPE 줄 아래에 모아야 함
+
+        def add(metric, kind, labels, value):
+            labels = labels[:-1] + f',run="{run}"}}' if labels else f'{{run="{run}"}}'
+            families.setdefault(metric, (kind, []))[1].append(f'{metric}{labels} {value}')
+
+        for key, t in sorted(s['timers'].items()):
+            name, labels = _split_key(key)
+            name = f'{PREFIX}_{name.replace(".", "_")}'
+            add(f'{name}_seconds_total', 'counter', labels, t['seconds'])
+            add(f'{name}_calls_total', 'counter', labels, t['calls'])
+            add(f'{name}_seconds_max', 'gauge', labels, t['max'])
+        for key, value in sorted(s['counters'].items()):
+            name, labels = _split_key(key)
+            add(f'{PREFIX}_{name.replace(".", "_")}_total', 'counter', labels, value)
+        add(f'{PREFIX}_last_run_timestamp_seconds', 'gauge', '', time.time())
+
+        lines = []
+        for metric, (kind, samples) in families.items():
+            lines.append(f'# TYPE {metric} {kind}')
+            lines.extend(samples)
+        return '\n'.join(lines) + '\n'
+
+    def report(self, run: str, output_dir: Optional[str] = None, prometheus: bool = None) -> None:
+        """
+        Prints the summary and writes {run}.json (and {run}.prom) to
+        `output_dir` (default config['output_dir'] under datasets/)
+        """
+        print(f'\n{self.summary()}')
+        config = get_config()
+        if output_dir is None:
+            if not config.get('output_dir'):
+                return
+            output_dir = os.path.join(DATASET_DIR, config['output_dir'])
+        if prometheus is None:
+            prometheus = config.get('prometheus', False)
+        os.makedirs(output_dir, exist_ok=True)
+
+        report = {'run': run, 'started': self.started, 'finished': time.time(), **self.snapshot()}
+        path = os.path.join(output_dir, f'{run}.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(report, f, indent=4, ensure_ascii=False)
+        os.replace(path + '.tmp', path)
+        if prometheus:
+            path = os.path.join(output_dir, f'{run}.prom')
+            with open(path + '.tmp', 'w') as f:
+                f.write(self.prometheus(run))
+            os.replace(path + '.tmp', path)
+        print(f'Metrics are saved to: {output_dir}')
+
+
+metrics = Metrics()
+timer = metrics.timer
+timed = metrics.timed
+incr = metrics.incr
+
+
+@contextmanager
+def profiled(rcept_no: str):
+    """
+    Runs the block under cProfile if `rcept_no` is config['profile_filing'];
+    the stats are saved to profile-{rcept_no}.prof and the top functions printed
+    """
+    config = get_config()
+    if not rcept_no or str(rcept_no) != str(config.get('profile_filing')):
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        output_dir = os.path.join(DATASET_DIR, config.get('output_dir') or 'METRICS')
+        os.makedirs(output_dir, exist_ok=True)
+        path = os.path.join(output_dir, f'profile-{rcept_no}.prof')
+        profiler.dump_stats(path)
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(25)
+        print(f'\nProfile of {rcept_no} ({path}):\n{out.getvalue()}')
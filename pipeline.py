@@ -0,0 +1,189 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+from multiprocessing import Pool
+from tqdm import tqdm
+
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+import dart_crawler
+import dart_parser
+import metadata_store
+import rate_limiter
+import search_index
+import section_index
+import utils
+from metrics import metrics, timer
+from downloader import SubDocDownloader
+
+
+with open('config.json') as fin:
+    config = json.load(fin).get('pipeline', {})
+
+
+class ExtractionQueue:
+    """
+    Hands downloaded filings to a pool of extraction processes. At most
+    `max_pending` filings wait for or are in extraction; `put` blocks the
+    crawler thread beyond that, so downloading slows down to the speed of
+    extraction instead of piling up work
+    """
+
+    def __init__(self, extraction_kwargs: Dict, workers: int, max_pending: int):
+        self.metrics_dir = tempfile.mkdtemp(prefix='metrics-')
+        self.pool = Pool(processes=workers, initializer=dart_parser.init_worker,
+                         initargs=(extraction_kwargs, self.metrics_dir))
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.lock = threading.Lock()
+        self.extracted = 0
+        self.skipped = 0
+        self.failed = 0
+        self.latencies = []
+
+    def put(self, filing: Dict, started: float) -> None:
+        """
+        :param filing: filing metadata (dart_parser.TASK_FIELDS)
+        :param started: time.monotonic() when work on the filing started
+        """
+        self.slots.acquire()
+        task = {field: filing[field] for field in dart_parser.TASK_FIELDS}
+        if 'reuse' in filing:
+            task['reuse'] = filing['reuse']
+        self.pool.apply_async(
+            dart_parser.process_task, (task,),
+            callback=partial(self._done, started),
+            error_callback=partial(self._failed, task['filename']),
+        )
+
+    def _done(self, started, processed):
+        with self.lock:
+            if processed:
+                self.extracted += 1
+                self.latencies.append(time.monotonic() - started)
+            else:
+                self.skipped += 1
+        self.slots.release()
+
+    def _failed(self, filename, e):
+        print(f'Extraction Error...{filename}: {e}')
+        with self.lock:
+            self.failed += 1
+        self.slots.release()
+
+    def close(self) -> None:
+        """
+        Waits for the queued filings (the pool is joined, not terminated, so
+        the workers flush their output and metrics)
+        """
+        self.pool.close()
+        self.pool.join()
+        metrics.collect(self.metrics_dir)
+        shutil.rmtree(self.metrics_dir, ignore_errors=True)
+
+    def __str__(self):
+        with self.lock:
+            latency = ''
+            if self.latencies:
+                latency = (f', latency from download start avg {np.mean(self.latencies):.1f}s'
+                           f' / max {np.max(self.latencies):.1f}s')
+            return f'{self.extracted} extracted, {self.skipped} up to date, {self.failed} failed{latency}'
+
+
+def crawl_and_queue(series: pd.Series, queue: ExtractionQueue, store: metadata_store.MetadataStore,
+                    raw_filings_folder: str, downloader: SubDocDownloader) -> bool:
+    started = time.monotonic()
+    df = dart_crawler.crawl(
+        series=series,
+        filing_types=dart_crawler.config['filing_types'],
+        raw_filings_folder=raw_filings_folder,
+        api_key=dart_crawler.api_key,
+        user_agent=dart_crawler.config['user_agent'],
+        downloader=downloader,
+        store=store,
+        raw_compression=dart_crawler.config.get('raw_compression'),
+    )
+    if df is None:
+        return False
+    store.upsert_filing(df)
+    queue.put(store.get_filing(series['rcept_no']), started)
+    return True
+
+
+def main():
+    """
+    Crawls and extracts at the same time: every filing is queued for
+    extraction as soon as it is downloaded
+    """
+    crawler_config = dart_crawler.config
+    raw_filings_folder = os.path.join(dart_crawler.DATASET_DIR, crawler_config['raw_filings_folder'])
+    indices_folder = os.path.join(dart_crawler.DATASET_DIR, crawler_config['indices_folder'])
+    if crawler_config['raw_filings_folder'] != dart_parser.config['raw_filings_folder']:
+        print('dart_crawler and extract_items must use the same raw_filings_folder')
+        return
+    if len(dart_crawler.api_key) == 0:
+        print("Please get api key from dart")
+        return
+    if not dart_crawler.raw_compression_available():
+        return
+    os.makedirs(indices_folder, exist_ok=True)
+    os.makedirs(raw_filings_folder, exist_ok=True)
+
+    store = metadata_store.open_store(
+        dart_crawler.DATASET_DIR, crawler_config['metadata_db_file'], crawler_config['filings_metadata_file'])
+    extraction_kwargs = dart_parser.extraction_settings(store.path)
+    if extraction_kwargs is None:
+        return
+
+    # 이전에 받았지만 아직 추출하지 않은 공시도 함께 처리
+    downloaded = store.filings().drop_duplicates(subset=['filename']).replace({np.nan: None})
+    downloaded = downloaded[downloaded['filename'].map(
+        lambda filename: filename is not None and os.path.exists(section_index.raw_filepath(raw_filings_folder, filename)))]
+    backlog = dart_parser.plan_extraction(downloaded, dart_parser.ExtractItems(**extraction_kwargs))
+
+    df = dart_crawler.pending_filings(store, indices_folder, raw_filings_folder)
+    print(f"\nDownloading {len(df)} filings, extracting {len(backlog)} downloaded filings...\n")
+
+    queue = ExtractionQueue(
+        extraction_kwargs,
+        workers=config.get('extraction_workers') or os.cpu_count() or 1,
+        max_pending=config.get('max_pending', 16),
+    )
+    downloader = SubDocDownloader(max_workers=crawler_config['download_workers'])
+    crawled = 0
+    with ThreadPoolExecutor(max_workers=crawler_config['filing_workers']) as executor:
+        futures = [
+            executor.submit(crawl_and_queue, series, queue, store, raw_filings_folder, downloader)
+            for _, series in df.iterrows()
+        ]
+        for _, filing in backlog.iterrows():
+            queue.put(filing, time.monotonic())
+        for future in tqdm(as_completed(futures), total=len(futures), ncols=100):
+            try:
+                crawled += future.result()
+            except Exception as e:
+                print(e)
+    downloader.shutdown()
+    queue.close()
+    store.close()
+
+    print(f"\n{downloader.stats}")
+    print(rate_limiter.format_stats())
+    print(utils.call_timings)
+    print(f'Downloaded {crawled} / {len(df)} filings')
+    print(f'Extraction: {queue}')
+    if dart_parser.config.get('update_search_index', False):
+        with timer('update_search_index'):
+            search_index.update_index(extraction_kwargs['extracted_files_folder'])
+    metrics.report('pipeline')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+import os
+import json
+import threading
+import time
+from collections import deque
+from urllib.parse import urlparse
+
+from typing import Dict, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+# 호스트 또는 "호스트/경로" 별 기본 요청 한도
+#   rate: requests / second, burst: bucket 크기
+#   kind: 'token_bucket' | 'sliding_window' (window 초 동안 limit 회)
+#   shared: True 이면 lock file 로 여러 프로세스가 같은 한도를 공유
+DEFAULT_LIMITS = {
+    'opendart.fss.or.kr': {'rate': 5.0, 'burst': 5},
+    'dart.fss.or.kr': {'rate': 2.0, 'burst': 2},
+}
+
+LOCK_DIR = os.path.join('docs_cache', 'ratelimit')
+
+# 429 / 5xx / OpenDART status 020 (요청 제한 초과) 에 대한 재시도
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+
+class LimiterStats:
+    """
+    Time spent waiting for the limiter vs. time spent in flight, per key
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.acquired = 0
+        self.wait_seconds = 0.0
+        self.inflight_seconds = 0.0
+        self.backoffs = 0
+        self.backoff_seconds = 0.0
+
+    def as_dict(self) -> Dict:
+        with self.lock:
+            return {
+                'acquired': self.acquired,
+                'wait_seconds': self.wait_seconds,
+                'inflight_seconds': self.inflight_seconds,
+                'backoffs': self.backoffs,
+                'backoff_seconds': self.backoff_seconds,
+            }
+
+
+class Limiter:
+    """
+    Base class: subclasses implement `_reserve`, returning (granted, delay).
+    A granted reservation may still ask the caller to sleep `delay` seconds
+    before sending; a refused one is retried after `delay`
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.blocked_until = 0.0
+        self.stats = LimiterStats()
+
+    def _reserve(self, now: float) -> Tuple[bool, float]:
+        raise NotImplementedError
+
+    def acquire(self) -> float:
+        """
+        Blocks until a request may be sent
+
+        :return: seconds spent waiting
+        """
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.time()
+                granted, delay = False, self.blocked_until - now
+                if delay <= 0:
+                    granted, delay = self._reserve(now)
+            if delay > 0:
+                time.sleep(delay)
+                waited += delay
+            if granted:
+                break
+        with self.stats.lock:
+            self.stats.acquired += 1
+            self.stats.wait_seconds += waited
+        return waited
+
+    def backoff(self, delay: float) -> None:
+        """
+        Pauses every caller of this limiter for `delay` seconds
+        """
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.time() + delay)
+        with self.stats.lock:
+            self.stats.backoffs += 1
+            self.stats.backoff_seconds += delay
+
+
+class TokenBucket(Limiter):
+    def __init__(self, rate: float, burst: int = 1):
+        super().__init__()
+        self.rate = float(rate)
+        self.capacity = max(1, int(burst))
+        self.tokens = float(self.capacity)
+        self.updated = time.time()
+
+    def _reserve(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True, 0.0
+        return False, (1 - self.tokens) / self.rate
+
+
+class SlidingWindow(Limiter):
+    def __init__(self, limit: int, window: float = 1.0):
+        super().__init__()
+        self.limit = max(1, int(limit))
+        self.window = float(window)
+        self.calls = deque()
+
+    def _reserve(self, now):
+        while self.calls and now - self.calls[0] >= self.window:
+            self.calls.popleft()
+        if len(self.calls) < self.limit:
+            self.calls.append(now)
+            return True, 0.0
+        return False, self.window - (now - self.calls[0])
+
+
+class SharedLimiter(Limiter):
+    """
+    Evenly spaces requests across processes: the time the next request may
+    start is kept in a lock file and updated under an exclusive flock
+    """
+
+    def __init__(self, key: str, rate: float):
+        super().__init__()
+        self.interval = 1.0 / float(rate)
+        os.makedirs(LOCK_DIR, exist_ok=True)
+        self.path = os.path.join(LOCK_DIR, key.replace('/', '_') + '.lock')
+
+    def _update(self, update) -> Dict:
+        # 'a+' 모드는 seek 와 무관하게 항상 파일 끝에 쓰므로 O_RDWR 로 연다
+        with open(os.open(self.path, os.O_RDWR | os.O_CREAT), 'r+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                state = json.loads(f.read() or '{}')
+                update(state)
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+                # lock 을 풀기 전에 써야 다른 프로세스가 예전 상태를 읽지 않음
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        return state
+
+    def _reserve(self, now):
+        def take_slot(state):
+            state['slot'] = max(now, state.get('next', 0.0), state.get('blocked_until', 0.0))
+            state['next'] = state['slot'] + self.interval
+
+        slot = self._update(take_slot)['slot']
+        # 슬롯은 이미 확보했으므로 그 시각까지 기다린 뒤 바로 진행
+        return True, slot - now
+
+    def backoff(self, delay):
+        super().backoff(delay)
+
+        def block(state):
+            state['blocked_until'] = max(state.get('blocked_until', 0.0), time.time() + delay)
+
+        self._update(block)
+
+
+def _build(key: str, limit: Dict) -> Limiter:
+    if limit.get('shared'):
+        if fcntl is None:
+            print(f'Shared rate limit is not supported on this platform, "{key}" is limited per process')
+        else:
+            return SharedLimiter(key, limit['rate'])
+    if limit.get('kind') == 'sliding_window':
+        return SlidingWindow(limit['limit'], limit.get('window', 1.0))
+    return TokenBucket(limit['rate'], limit.get('burst', 1))
+
+
+_limiters: Dict[str, Limiter] = {}
+_limits = dict(DEFAULT_LIMITS)
+_registry_lock = threading.Lock()
+
+
+def configure(limits: Optional[Dict]) -> None:
+    """
+    Overrides the per-host/per-endpoint limits, e.g. config['rate_limits']
+    """
+    with _registry_lock:
+        _limits.update(limits or {})
+        _limiters.clear()
+
+
+def _key_for(url: str) -> Optional[str]:
+    parsed = urlparse(url)
+    host = parsed.hostname or ''
+    # 엔드포인트 단위 설정이 있으면 호스트 단위보다 우선
+    endpoint = host + parsed.path
+    if endpoint in _limits:
+        return endpoint
+    return host if host in _limits else None
+
+
+def limiter_for(url: str) -> Optional[Limiter]:
+    with _registry_lock:
+        key = _key_for(url)
+        if key is None:
+            return None
+        if key not in _limiters:
+            _limiters[key] = _build(key, _limits[key])
+        return _limiters[key]
+
+
+def acquire(url: str) -> float:
+    limiter = limiter_for(url)
+    return limiter.acquire() if limiter is not None else 0.0
+
+
+def record_inflight(url: str, seconds: float) -> None:
+    limiter = limiter_for(url)
+    if limiter is not None:
+        with limiter.stats.lock:
+            limiter.stats.inflight_seconds += seconds
+
+
+def backoff(url: str, delay: float) -> None:
+    limiter = limiter_for(url)
+    if limiter is not None:
+        limiter.backoff(delay)
+    else:
+        # 한도가 설정되지 않은 호스트는 호출한 스레드만 기다림
+        time.sleep(delay)
+
+
+def is_rate_limited(response) -> bool:
+    """
+    True if the server asked us to slow down or failed transiently
+    """
+    if response.status_code in RETRY_STATUS_CODES:
+        return True
+    # OpenDART 는 한도 초과 시에도 200 과 status 020 을 반환
+    head = response.content[:200]
+    return b'"status":"020"' in head.replace(b' ', b'') or b'<status>020</status>' in head
+
+
+def retry_delay(response, attempt: int) -> float:
+    retry_after = response.headers.get('Retry-After')
+    if retry_after is not None:
+        try:
+            return min(BACKOFF_MAX, float(retry_after))
+        except ValueError:
+            pass
+    return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)
+
+
+def stats() -> Dict[str, Dict]:
+    with _registry_lock:
+        return {key: limiter.stats.as_dict() for key, limiter in _limiters.items()}
+
+
+def format_stats() -> str:
+    lines = []
+    for key, s in stats().items():
+        lines.append(f"{key}: {s['acquired']} requests, waited {s['wait_seconds']:.1f}s, "
+                     f"in flight {s['inflight_seconds']:.1f}s, "
+                     f"{s['backoffs']} backoffs ({s['backoff_seconds']:.1f}s)")
+    return '\n'.join(lines)
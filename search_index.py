@@ -0,0 +1,510 @@
+import os
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import argparse
+
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from sinks import iter_records
+
+
+DATASET_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'datasets')
+
+with open('config.json') as fin:
+    config = json.load(fin).get('search', {})
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS docs (
+        doc_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        filename TEXT, item TEXT, corp_code TEXT, company TEXT, rcept_no TEXT, filing_date TEXT,
+        text_hash TEXT, live INTEGER, length INTEGER
+    );
+    CREATE INDEX IF NOT EXISTS docs_filename ON docs (filename, item);
+    CREATE TABLE IF NOT EXISTS chunks (
+        doc_id INTEGER, chunk INTEGER, text BLOB,
+        PRIMARY KEY (doc_id, chunk)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS postings (
+        gram TEXT, segment INTEGER, blob BLOB,
+        PRIMARY KEY (gram, segment)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS segments (
+        segment INTEGER PRIMARY KEY, docs INTEGER, created REAL
+    );
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY, value TEXT
+    );
+'''
+
+# 코드 포인트 두 개를 하나의 uint64 로 묶어 정렬 (유니코드는 21비트)
+CODE_BITS = 21
+
+# 문서 끝을 나타내는 글자; (마지막 글자, PAD) bigram 으로 색인됨
+PAD = '\x00'
+
+# PAD 없이 만든 색인은 다시 만들어야 함
+INDEX_VERSION = 2
+
+# snippet 용 원문은 이 글자 수 단위로 나눠 압축 (snippet 마다 문서 전체를 풀지 않도록)
+CHUNK_CHARS = 4096
+
+
+def normalize(text: str) -> str:
+    """
+    Text as indexed and shown in snippets: whitespace runs (new lines
+    included) collapsed to one space, PAD removed
+    """
+    return ' '.join((text or '').replace(PAD, ' ').split())
+
+
+def _fold(text: str) -> str:
+    # 위치가 어긋나지 않도록 길이가 같을 때만 소문자로 바꿈
+    lower = text.lower()
+    return lower if len(lower) == len(text) else text
+
+
+def _sha256(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _rcept_no(filename: str) -> Optional[str]:
+    # {stock_code}_{filing_type}_{year}_{rcept_no}_{rcept_dt}.html
+    parts = filename.split('.')[0].split('_')
+    return parts[3] if len(parts) == 5 else None
+
+
+def encode_postings(doc_ids: np.ndarray, positions: np.ndarray) -> bytes:
+    """
+    Postings of one bigram in one segment: doc ids (ascending), number of
+    positions per doc and the positions, delta encoded within each doc
+
+    :param doc_ids: doc id of every occurrence, grouped by doc
+    :param positions: character offset of every occurrence, ascending within a doc
+    """
+    starts = np.concatenate(([0], np.flatnonzero(doc_ids[1:] != doc_ids[:-1]) + 1))
+    counts = np.diff(np.append(starts, len(doc_ids))).astype(np.uint32)
+    deltas = np.diff(positions, prepend=np.uint32(0)).astype(np.uint32)
+    deltas[starts] = positions[starts]
+    header = np.array([len(starts)], dtype=np.uint32)
+    return zlib.compress(header.tobytes() + doc_ids[starts].astype(np.uint32).tobytes()
+                         + counts.tobytes() + deltas.tobytes(), 1)
+
+
+def decode_postings(blob: bytes):
+    """
+    :return: (doc id of every occurrence, its position), the inverse of encode_postings
+    """
+    data = np.frombuffer(zlib.decompress(blob), dtype=np.uint32)
+    n = int(data[0])
+    doc_ids, counts, deltas = data[1:n + 1], data[n + 1:2 * n + 1], data[2 * n + 1:]
+    cumulative = np.cumsum(deltas, dtype=np.uint64)
+    ends = np.cumsum(counts, dtype=np.int64)
+    before = np.concatenate(([0], cumulative[ends[:-1] - 1])).astype(np.uint64)
+    return np.repeat(doc_ids, counts), (cumulative - np.repeat(before, counts)).astype(np.uint32)
+
+
+def segment_postings(docs: List) -> Iterable:
+    """
+    Character bigram postings of a batch of documents (no tokenizer or
+    morpheme analysis, which suits Korean); bigrams across a space are
+    indexed too so phrases with spaces can be matched
+
+    :param docs: (doc_id, indexed text) in ascending doc_id order
+    :return: generator of (bigram, encoded postings)
+    """
+    codes, doc_ids, positions = [], [], []
+    for doc_id, text in docs:
+        # 마지막 글자도 bigram 을 시작하도록 끝에 PAD 를 붙임 (한 글자 검색용)
+        points = np.append(np.frombuffer(_fold(text).encode('utf-32-le'), dtype=np.uint32), np.uint32(ord(PAD)))
+        if len(points) < 2:
+            continue
+        codes.append((points[:-1].astype(np.uint64) << CODE_BITS) | points[1:])
+        doc_ids.append(np.full(len(points) - 1, doc_id, dtype=np.uint32))
+        positions.append(np.arange(len(points) - 1, dtype=np.uint32))
+    if not codes:
+        return
+
+    codes = np.concatenate(codes)
+    # stable sort 이므로 같은 bigram 안에서는 doc_id, 위치 순서가 유지됨
+    order = np.argsort(codes, kind='stable')
+    codes, doc_ids, positions = codes[order], np.concatenate(doc_ids)[order], np.concatenate(positions)[order]
+    bounds = np.flatnonzero(codes[1:] != codes[:-1]) + 1
+    for start, end in zip(np.concatenate(([0], bounds)), np.append(bounds, len(codes))):
+        code = int(codes[start])
+        gram = chr(code >> CODE_BITS) + chr(code & ((1 << CODE_BITS) - 1))
+        yield gram, encode_postings(doc_ids[start:end], positions[start:end])
+
+
+class SearchIndex:
+    """
+    On-disk inverted index of the extracted items (one document per filing x
+    item) in SQLite. Documents are indexed in segments; a filing whose item
+    text changed gets a new document in a new segment and its old document is
+    marked dead, and segments are merged once there are more than
+    `max_segments`.
+
+        index = SearchIndex('datasets/SEARCH_INDEX/index.sqlite')
+        index.update(iter_records('datasets/EXTRACTED_FILINGS'))
+        index.search('이차전지 수주', items=['II'])
+    """
+
+    def __init__(self, path: str, segment_chars: int = 5_000_000, max_segments: int = 16):
+        self.path = path
+        self.segment_chars = segment_chars
+        self.max_segments = max_segments
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.executescript(SCHEMA)
+        self.db.commit()
+        self._dead = None
+        version = self.get_meta('version')
+        if version is None and self.db.execute('SELECT 1 FROM docs LIMIT 1').fetchone() is None:
+            self.set_meta('version', INDEX_VERSION)
+        elif version != str(INDEX_VERSION):
+            self.close()
+            raise ValueError(f'{path} was built by an older version, run "search_index.py update --rebuild"')
+
+    def close(self) -> None:
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def get_meta(self, key: str) -> Optional[str]:
+        row = self.db.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value) -> None:
+        self.db.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', (key, str(value)))
+        self.db.commit()
+
+    @property
+    def dead(self) -> np.ndarray:
+        if self._dead is None:
+            rows = self.db.execute('SELECT doc_id FROM docs WHERE live = 0').fetchall()
+            self._dead = np.array(sorted(row[0] for row in rows), dtype=np.uint32)
+        return self._dead
+
+    def update(self, records: Iterable[Dict]) -> Dict:
+        """
+        Indexes extracted filings (as returned by sinks.iter_records); items
+        whose text is unchanged, by the '_extraction' text hash, are skipped
+
+        :return: counts of added / replaced / unchanged items
+        """
+        live = {(filename, item): (doc_id, text_hash) for doc_id, filename, item, text_hash in self.db.execute(
+            'SELECT doc_id, filename, item, text_hash FROM docs WHERE live = 1')}
+        counts = {'added': 0, 'replaced': 0, 'unchanged': 0}
+        pending = []
+        pending_chars = 0
+
+        for record in records:
+            filename = record['filename']
+            hashes = record.get('_extraction', {}).get('items', {})
+            for key, text in record.items():
+                if not key.startswith('item_'):
+                    continue
+                text = text or ''
+                text_hash = hashes.get(key, {}).get('text') or _sha256(text)
+                previous = live.get((filename, key[5:]))
+                if previous is not None and previous[1] == text_hash:
+                    counts['unchanged'] += 1
+                    continue
+                if previous is not None:
+                    # 바뀐 항목은 새 문서로 추가하고 이전 문서는 검색에서 제외
+                    self.db.execute('UPDATE docs SET live = 0 WHERE doc_id = ?', (previous[0],))
+                    self.db.execute('DELETE FROM chunks WHERE doc_id = ?', (previous[0],))
+                    counts['replaced'] += 1
+                else:
+                    counts['added'] += 1
+                indexed = normalize(text)
+                cursor = self.db.execute(
+                    'INSERT INTO docs (filename, item, corp_code, company, rcept_no, filing_date, text_hash, live, length)'
+                    ' VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?)',
+                    (filename, key[5:], record.get('corp_code'), record.get('company'), _rcept_no(filename),
+                     record.get('filing_date'), text_hash, len(indexed)))
+                self.db.executemany('INSERT INTO chunks VALUES (?, ?, ?)', (
+                    (cursor.lastrowid, i // CHUNK_CHARS, zlib.compress(indexed[i:i + CHUNK_CHARS].encode('utf-8'), 6))
+                    for i in range(0, len(indexed), CHUNK_CHARS)))
+                live[(filename, key[5:])] = (cursor.lastrowid, text_hash)
+                pending.append((cursor.lastrowid, indexed))
+                pending_chars += len(indexed)
+                if pending_chars >= self.segment_chars:
+                    self._write_segment(pending)
+                    pending, pending_chars = [], 0
+
+        # 문서와 postings 는 같은 transaction 으로 commit 되므로 중간에 멈춰도 색인이 어긋나지 않음
+        self._write_segment(pending)
+        self._dead = None
+        if self.db.execute('SELECT COUNT(*) FROM segments').fetchone()[0] > self.max_segments:
+            self.merge()
+        return counts
+
+    def _write_segment(self, docs: List) -> None:
+        if docs:
+            segment = (self.db.execute('SELECT MAX(segment) FROM segments').fetchone()[0] or 0) + 1
+            self.db.executemany('INSERT INTO postings VALUES (?, ?, ?)',
+                                ((gram, segment, blob) for gram, blob in segment_postings(docs)))
+            self.db.execute('INSERT INTO segments VALUES (?, ?, ?)', (segment, len(docs), time.time()))
+        self.db.commit()
+
+    def merge(self) -> None:
+        """
+        Merges all segments into one, dropping dead documents
+        """
+        dead = self.dead
+        segment = (self.db.execute('SELECT MAX(segment) FROM segments').fetchone()[0] or 0) + 1
+        old = [row[0] for row in self.db.execute('SELECT segment FROM segments')]
+
+        def merged():
+            gram, parts = None, []
+            rows = self.db.execute('SELECT gram, blob FROM postings ORDER BY gram, segment')
+            for row_gram, blob in rows:
+                if row_gram != gram and parts:
+                    yield gram, parts
+                    parts = []
+                gram = row_gram
+                parts.append(decode_postings(blob))
+            if parts:
+                yield gram, parts
+
+        rows = []
+        for gram, parts in merged():
+            # 이후 segment 의 doc_id 가 더 크므로 이어 붙여도 doc_id 순서가 유지됨
+            doc_ids = np.concatenate([doc_ids for doc_ids, _ in parts])
+            positions = np.concatenate([positions for _, positions in parts])
+            keep = ~np.isin(doc_ids, dead)
+            if keep.any():
+                rows.append((gram, segment, encode_postings(doc_ids[keep], positions[keep])))
+
+        self.db.execute(f'DELETE FROM postings WHERE segment IN ({", ".join("?" * len(old))})', old)
+        self.db.executemany('INSERT INTO postings VALUES (?, ?, ?)', rows)
+        self.db.execute('DELETE FROM segments')
+        n_docs = self.db.execute('SELECT COUNT(*) FROM docs WHERE live = 1').fetchone()[0]
+        self.db.execute('INSERT INTO segments VALUES (?, ?, ?)', (segment, n_docs, time.time()))
+        self.db.execute('DELETE FROM docs WHERE live = 0')
+        self.db.commit()
+        self._dead = None
+
+    def _term_matches(self, term: str) -> np.ndarray:
+        """
+        Occurrences of one term as sorted uint64 keys doc_id << 32 | start offset
+        """
+        folded = _fold(term)
+        if len(folded) == 1:
+            # 한 글자는 그 글자로 시작하는 bigram 들의 위치
+            rows = self.db.execute('SELECT blob FROM postings WHERE gram >= ? AND gram < ?',
+                                   (folded, chr(ord(folded) + 1))).fetchall()
+            keys = [doc_ids.astype(np.uint64) << np.uint64(32) | positions
+                    for doc_ids, positions in (decode_postings(blob) for blob, in rows)]
+            return np.unique(np.concatenate(keys)) if keys else np.array([], dtype=np.uint64)
+
+        grams = [folded[i:i + 2] for i in range(len(folded) - 1)]
+        by_segment = {}
+        for gram, segment, blob in self.db.execute(
+                f'SELECT gram, segment, blob FROM postings WHERE gram IN ({", ".join("?" * len(set(grams)))})',
+                sorted(set(grams))):
+            by_segment.setdefault(segment, {})[gram] = blob
+
+        matches = []
+        for blobs in by_segment.values():
+            if len(blobs) < len(set(grams)):
+                continue
+            decoded = {gram: decode_postings(blob) for gram, blob in blobs.items()}
+            # 드문 bigram 부터 교집합을 구함
+            offsets = sorted(enumerate(grams), key=lambda offset: len(decoded[offset[1]][0]))
+            keys = None
+            for i, gram in offsets:
+                doc_ids, positions = decoded[gram]
+                valid = positions >= i
+                start = doc_ids[valid].astype(np.uint64) << np.uint64(32) | (positions[valid] - i)
+                keys = start if keys is None else np.intersect1d(keys, start, assume_unique=True)
+                if len(keys) == 0:
+                    break
+            matches.append(keys)
+        return np.unique(np.concatenate(matches)) if matches else np.array([], dtype=np.uint64)
+
+    def search(self, query: str, items: Optional[List[str]] = None, corp_codes: Optional[List[str]] = None,
+               limit: int = 20, snippets: int = 3, window: int = 40, mark=('[', ']')) -> List[Dict]:
+        """
+        Documents containing every whitespace separated term of `query`
+        (a term in double quotes may contain spaces), by number of matches
+        then latest filing first
+
+        :param items: roman item numbers to search, e.g. ['II'], default all
+        :param corp_codes: companies to search, default all
+        :param snippets: snippets per document, `window` characters around a match
+        :return: dicts with corp_code, company, rcept_no, filename, item,
+                 filing_date, matches and snippets
+        """
+        terms = [normalize(term) for term in _split_query(query)]
+        terms = [term for term in terms if term]
+        if not terms:
+            return []
+
+        occurrences = {}
+        docs = None
+        for term in terms:
+            keys = self._term_matches(term)
+            doc_ids = (keys >> np.uint64(32)).astype(np.uint32)
+            docs = np.unique(doc_ids) if docs is None else np.intersect1d(docs, doc_ids)
+            occurrences[term] = (doc_ids, (keys & np.uint64(0xFFFFFFFF)).astype(np.uint32))
+        docs = docs[~np.isin(docs, self.dead)]
+        if len(docs) == 0:
+            return []
+
+        counts = np.zeros(len(docs), dtype=np.int64)
+        for doc_ids, _ in occurrences.values():
+            found = np.isin(doc_ids, docs)
+            counts += np.bincount(np.searchsorted(docs, doc_ids[found]), minlength=len(docs))
+
+        results = []
+        for chunk in range(0, len(docs), 500):
+            ids = [int(doc_id) for doc_id in docs[chunk:chunk + 500]]
+            sql = ('SELECT doc_id, corp_code, company, rcept_no, filename, item, filing_date FROM docs'
+                   f' WHERE live = 1 AND doc_id IN ({", ".join("?" * len(ids))})')
+            params = list(ids)
+            if items is not None:
+                sql += f' AND item IN ({", ".join("?" * len(items))})'
+                params += list(items)
+            if corp_codes is not None:
+                sql += f' AND corp_code IN ({", ".join("?" * len(corp_codes))})'
+                params += list(corp_codes)
+            for doc_id, corp_code, company, rcept_no, filename, item, filing_date in self.db.execute(sql, params):
+                results.append({
+                    'doc_id': doc_id, 'corp_code': corp_code, 'company': company, 'rcept_no': rcept_no,
+                    'filename': filename, 'item': item, 'filing_date': filing_date,
+                    'matches': int(counts[np.searchsorted(docs, doc_id)]),
+                })
+        results.sort(key=lambda r: (-r['matches'], -int(r['filing_date'] or 0)))
+        results = results[:limit]
+
+        for result in results:
+            starts = []
+            for term, (doc_ids, positions) in occurrences.items():
+                starts.extend((int(p), len(term)) for p in positions[doc_ids == result['doc_id']])
+            result['snippets'] = self.snippets(result.pop('doc_id'), sorted(starts), snippets, window, mark)
+        return results
+
+    def snippets(self, doc_id: int, matches: List, n: int, window: int, mark) -> List[str]:
+        row = self.db.execute('SELECT length FROM docs WHERE doc_id = ?', (doc_id,)).fetchone()
+        if row is None:
+            return []
+        size = row[0]
+        out = []
+        end = -1
+        for start, length in matches:
+            if start < end:  # 앞 snippet 에 이미 포함된 위치
+                continue
+            begin = max(0, start - window)
+            end = min(size, start + length + window)
+            text = self._text(doc_id, begin, end)
+            start, stop = start - begin, start - begin + length
+            out.append(('…' if begin > 0 else '') + text[:start] + mark[0] + text[start:stop]
+                       + mark[1] + text[stop:] + ('…' if end < size else ''))
+            if len(out) >= n:
+                break
+        return out
+
+    def _text(self, doc_id: int, begin: int, end: int) -> str:
+        """
+        Characters begin:end of an indexed document, from the chunks they are in
+        """
+        first = begin // CHUNK_CHARS
+        rows = self.db.execute('SELECT text FROM chunks WHERE doc_id = ? AND chunk BETWEEN ? AND ? ORDER BY chunk',
+                               (doc_id, first, (end - 1) // CHUNK_CHARS)).fetchall()
+        text = ''.join(zlib.decompress(blob).decode('utf-8') for blob, in rows)
+        return text[begin - first * CHUNK_CHARS:end - first * CHUNK_CHARS]
+
+    def stats(self) -> Dict:
+        return {
+            'docs': self.db.execute('SELECT COUNT(*) FROM docs WHERE live = 1').fetchone()[0],
+            'dead_docs': len(self.dead),
+            'segments': self.db.execute('SELECT COUNT(*) FROM segments').fetchone()[0],
+            'postings': self.db.execute('SELECT COUNT(*) FROM postings').fetchone()[0],
+            'size_mb': os.path.getsize(self.path) / 1e6,
+        }
+
+
+def _split_query(query: str) -> List[str]:
+    """
+    '이차전지 "양극재 공장"' -> ['이차전지', '양극재 공장']
+    """
+    terms = []
+    for i, part in enumerate(query.split('"')):
+        terms.extend([part] if i % 2 else part.split())
+    return terms
+
+
+def index_path() -> str:
+    return os.path.join(DATASET_DIR, config.get('index_folder', 'SEARCH_INDEX'), 'index.sqlite')
+
+
+def open_index(path: Optional[str] = None) -> SearchIndex:
+    path = path or index_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return SearchIndex(path, config.get('segment_chars', 5_000_000), config.get('max_segments', 16))
+
+
+def update_index(extracted_filings_folder: str, path: Optional[str] = None) -> Dict:
+    """
+    Adds the filings extracted since the last update to the search index
+    """
+    started = time.time()
+    with open_index(path) as index:
+        since = index.get_meta('updated')
+        counts = index.update(iter_records(extracted_filings_folder, since=float(since) if since else None))
+        index.set_meta('updated', started)
+        print(f"Search index: {counts['added']} items added, {counts['replaced']} replaced, "
+              f"{counts['unchanged']} unchanged in {time.time() - started:.1f}s")
+    return counts
+
+
+def main():
+    with open('config.json') as fin:
+        extract_config = json.load(fin)['extract_items']
+
+    parser = argparse.ArgumentParser(description='Full-text search over the extracted items')
+    commands = parser.add_subparsers(dest='command', required=True)
+    update = commands.add_parser('update', help='index the filings extracted since the last update')
+    update.add_argument('--rebuild', action='store_true', help='index every extracted filing again')
+    query = commands.add_parser('query', help='search the index')
+    query.add_argument('query', help='terms to find, "double quotes" for a phrase with spaces')
+    query.add_argument('--item', action='append', help='roman item number, e.g. II (repeatable)')
+    query.add_argument('--corp', action='append', help='corp_code (repeatable)')
+    query.add_argument('--limit', type=int, default=20)
+    commands.add_parser('stats', help='size of the index')
+    args = parser.parse_args()
+
+    if args.command == 'update':
+        if args.rebuild and os.path.exists(index_path()):
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(index_path() + suffix):
+                    os.remove(index_path() + suffix)
+        update_index(os.path.join(DATASET_DIR, extract_config['extracted_filings_folder']))
+    elif args.command == 'query':
+        with open_index() as index:
+            start = time.perf_counter()
+            results = index.search(args.query, items=args.item, corp_codes=args.corp, limit=args.limit)
+            elapsed = time.perf_counter() - start
+        for result in results:
+            print(f"\n{result['company']} ({result['corp_code']}) {result['filing_date']} "
+                  f"{result['rcept_no']} item {result['item']}: {result['matches']} matches")
+            for snippet in result['snippets']:
+                print(f'    {snippet}')
+        print(f'\n{len(results)} results in {elapsed * 1000:.1f} ms')
+    else:
+        with open_index() as index:
+            print(json.dumps(index.stats(), indent=4))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,328 @@
+import os
+import re
+import json
+import mmap
+import codecs
+from contextlib import contextmanager
+
+from urllib.parse import urlparse, parse_qs
+
+from typing import Dict, List, Optional
+
+import roman
+
+import metadata_store
+from compression import COMPRESSION_SUFFIXES, compression_of, decompress, iter_frames
+from utils import check_roman_numerals
+
+
+# <meta charset="utf-8"> / <meta content="text/html; charset=euc-kr" ...>
+META_CHARSET_RE = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?([\w-]+)', re.IGNORECASE)
+
+delimiter = "<!-- File:"
+DELIMITER = delimiter.encode()
+
+INDEX_SUFFIX = '.idx.json'
+
+
+@contextmanager
+def mmap_file(file):
+    """
+    Read-only mmap of an open binary file (empty files can't be mapped)
+    """
+    if os.fstat(file.fileno()).st_size == 0:
+        yield b''
+        return
+    buf = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        yield buf
+    finally:
+        buf.close()
+
+
+def _line_bounds(buf, pos):
+    """
+    Start and end (after the line break) of the line containing `pos`,
+    with the same \\n / \\r / \\r\\n line breaks as universal newlines mode
+    """
+    # '\r' 은 인접한 '\n' 사이에서만 찾아 파일 전체를 다시 훑지 않도록 함
+    start = buf.rfind(b'\n', 0, pos) + 1
+    start = buf.rfind(b'\r', start, pos) + 1 or start
+    end = buf.find(b'\n', pos)
+    cr = buf.find(b'\r', pos, len(buf) if end == -1 else end)
+    if cr != -1:
+        return start, cr + 2 if buf[cr:cr + 2] == b'\r\n' else cr + 1
+    return start, len(buf) if end == -1 else end + 1
+
+
+def iter_sections(buf):
+    """
+    Lazily splits a concatenated filing on its `<!-- File: ... -->` lines
+
+    :param buf: bytes-like (bytes or mmap) of the raw filing
+    :return: generator of (section title, start, end) byte ranges; the
+             delimiter line itself is not part of any section
+    """
+    title = None
+    content_start = 0
+    pos = buf.find(DELIMITER)
+    while pos != -1:
+        line_start, line_end = _line_bounds(buf, pos)
+        if title is not None:
+            yield title, content_start, line_start
+        line = decode_section(buf[line_start:line_end])
+        title = line.split(delimiter)[1].strip().rstrip("-->")
+        content_start = line_end
+        pos = buf.find(DELIMITER, line_end)
+    if title is not None:
+        yield title, content_start, len(buf)
+
+
+def declared_charset(data) -> Optional[str]:
+    """
+    Charset of the <meta> tag near the start of a sub-document, if any
+    """
+    match = META_CHARSET_RE.search(data[:4096])
+    return match.group(1).decode('ascii').lower() if match else None
+
+
+def is_utf8(encoding: Optional[str]) -> bool:
+    try:
+        return codecs.lookup(encoding or 'utf-8').name == 'utf-8'
+    except LookupError:
+        return True
+
+
+def decode_section(data, encoding=None):
+    """
+    :param encoding: charset the sub-document was served in (see the sidecar
+                     index of filings assembled before sections were
+                     transcoded). Without it the section must be utf-8 or
+                     declare its charset in a <meta> tag; anything else raises
+                     ValueError instead of being decoded with a guess
+    """
+    if encoding is not None and not is_utf8(encoding):
+        text = data.decode(encoding, errors='backslashreplace')
+    else:
+        try:
+            text = codecs.decode(data, 'utf-8')
+        except UnicodeDecodeError:
+            charset = declared_charset(data)
+            if charset is None or is_utf8(charset):
+                raise ValueError('Section is not utf-8 and declares no other charset; '
+                                 'download the filing again to rebuild it')
+            text = data.decode(charset, errors='backslashreplace')
+    return text.replace('\r\n', '\n').replace('\r', '\n')
+
+
+def raw_filepath(raw_filings_folder: str, filename: str) -> str:
+    """
+    Path of a raw filing as stored: `filename` (as recorded in the metadata
+    store) or its compressed .gz / .zst version
+    """
+    path = os.path.join(raw_filings_folder, filename)
+    for suffix in COMPRESSION_SUFFIXES.values():
+        if os.path.exists(path + suffix):
+            return path + suffix
+    return path
+
+
+def read_raw(buf, compression=None):
+    """
+    Whole decompressed filing (the concatenated sub-documents)
+    """
+    return decompress(buf, compression) if compression else buf
+
+
+def section_bytes(read, section: Dict, compression: Optional[str] = None) -> bytes:
+    """
+    Raw bytes of one indexed section
+
+    :param read: read(offset, length) -> bytes of the stored file
+    """
+    if compression is None:
+        return read(section['offset'], section['length'])
+    # 압축된 파일은 섹션이 든 frame 만 풀어서 읽음
+    data = decompress(read(section['frame_offset'], section['frame_length']), compression)
+    return data[section['frame_start']:section['frame_start'] + section['length']]
+
+
+def _frame_ranges(buf, compression):
+    """
+    Decompressed filing and, per frame, (compressed start, end, decompressed start, end)
+    """
+    parts = []
+    frames = []
+    position = 0
+    for start, end, data in iter_frames(buf, compression):
+        frames.append((start, end, position, position + len(data)))
+        parts.append(data)
+        position += len(data)
+    return b''.join(parts), frames
+
+
+def item_number(title: str) -> Optional[str]:
+    """
+    Roman item number of a section title ('II. 사업의 내용' -> 'II')
+    """
+    return title.strip().split('.')[0] if check_roman_numerals(title) else None
+
+
+def section_ids(url: str) -> Dict:
+    """
+    dcmNo / eleId of a viewer.do sub-document url
+    """
+    query = parse_qs(urlparse(url).query)
+    return {'dcm_no': query.get('dcmNo', [None])[0], 'ele_id': query.get('eleId', [None])[0]}
+
+
+def index_path(raw_filepath: str) -> str:
+    return raw_filepath + INDEX_SUFFIX
+
+
+def build_index(raw_filepath: str, sections: Optional[List[Dict]] = None) -> Dict:
+    """
+    Builds and writes the sidecar index of a raw filing: every section's
+    title, roman item number, dcmNo/eleId and byte offset/length
+
+    :param raw_filepath: path of the concatenated raw filing
+    :param sections: sub-documents in file order (dicts with dcm_no and
+                     ele_id), e.g. from sub_docs() or the metadata store
+    """
+    compression = compression_of(raw_filepath)
+    entries = []
+    with open(raw_filepath, 'rb') as file, mmap_file(file) as buf:
+        if compression is None:
+            data, frames = buf, []
+        else:
+            data, frames = _frame_ranges(buf, compression)
+        for seq, (title, start, end) in enumerate(iter_sections(data)):
+            section = sections[seq] if sections is not None and seq < len(sections) else {}
+            entry = {
+                'title': title.strip(),
+                'item': item_number(title),
+                'dcm_no': section.get('dcm_no'),
+                'ele_id': section.get('ele_id'),
+                'encoding': section.get('encoding'),
+                'offset': start,
+                'length': end - start,
+            }
+            if frames:
+                # 섹션이 걸쳐 있는 frame 들의 압축된 범위
+                covering = [f for f in frames if f[3] > start and f[2] < end] or [frames[-1]]
+                entry['frame_offset'] = covering[0][0]
+                entry['frame_length'] = covering[-1][1] - covering[0][0]
+                entry['frame_start'] = start - covering[0][2]
+            entries.append(entry)
+        stat = os.fstat(file.fileno())
+
+    index = {
+        'filename': os.path.basename(raw_filepath),
+        'compression': compression,
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'sections': entries,
+    }
+    tmp = index_path(raw_filepath) + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False)
+    os.replace(tmp, index_path(raw_filepath))
+    return index
+
+
+def load_index(raw_filepath: str) -> Optional[Dict]:
+    """
+    Returns the sidecar index, or None if it is missing or stale
+    """
+    try:
+        with open(index_path(raw_filepath), encoding='utf-8') as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    stat = os.stat(raw_filepath)
+    if index.get('size') != stat.st_size or index.get('mtime') != stat.st_mtime:
+        return None
+    return index
+
+
+class RawFiling:
+    """
+    Random access to the sections of a raw filing through its sidecar index
+    (built on first use if missing); in a compressed filing only the frame
+    holding the section is decompressed
+
+        with RawFiling(path) as filing:
+            html = filing.read_item('II')
+    """
+
+    def __init__(self, raw_filepath: str):
+        self.path = raw_filepath
+        self.index = load_index(raw_filepath) or build_index(raw_filepath)
+        self.compression = compression_of(raw_filepath)
+        self.file = open(raw_filepath, 'rb')
+
+    @property
+    def sections(self) -> List[Dict]:
+        return self.index['sections']
+
+    def _read(self, offset: int, length: int) -> bytes:
+        self.file.seek(offset)
+        return self.file.read(length)
+
+    def read_bytes(self, section: Dict) -> bytes:
+        return section_bytes(self._read, section, self.compression)
+
+    def read_section(self, section: Dict) -> str:
+        return decode_section(self.read_bytes(section), section.get('encoding'))
+
+    def read_item(self, item: str) -> Optional[str]:
+        """
+        HTML of an item ('II' or 2); when several sections share the item
+        number the last one is returned, as in ExtractItems
+        """
+        if isinstance(item, int) or item.isdigit():
+            item = roman.toRoman(int(item))
+        matches = [s for s in self.sections if s['item'] == item]
+        return self.read_section(matches[-1]) if matches else None
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def main():
+    """
+    Backfills the sidecar index of every raw filing that has none
+    """
+    with open('config.json') as fin:
+        config = json.load(fin)['extract_items']
+    dataset_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'datasets')
+    raw_filings_folder = os.path.join(dataset_dir, config['raw_filings_folder'])
+
+    store = metadata_store.open_store(dataset_dir, config['metadata_db_file'], config['filings_metadata_file'])
+    filings = store.filings().set_index('filename')
+
+    built = 0
+    for filename in sorted(os.listdir(raw_filings_folder)):
+        raw_filepath = os.path.join(raw_filings_folder, filename)
+        compression = compression_of(filename)
+        if compression is not None:
+            filename = filename[:-len(COMPRESSION_SUFFIXES[compression])]
+        if not filename.endswith('.html') or load_index(raw_filepath) is not None:
+            continue
+        sections = None
+        if filename in filings.index:
+            sections = store.get_sections(filings.loc[filename, 'rcept_no']).to_dict('records')
+        build_index(raw_filepath, sections)
+        built += 1
+    store.close()
+    print(f'Built {built} section indices in {raw_filings_folder}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,345 @@
+import os
+import glob
+import gzip
+import json
+import time
+
+from typing import Dict, Iterator, List, Optional
+
+import roman
+import pandas as pd
+
+from compression import COMPRESSION_SUFFIXES, compression_of
+
+
+METADATA_COLUMNS = [
+    'corp_code', 'company', 'stock_code', 'filing_type', 'filing_date',
+    'ceo_name', 'address', 'induty_code', 'establish_date',
+]
+OUTPUT_FORMATS = ('json', 'jsonl', 'parquet')
+MANIFEST_SUFFIX = '.manifest.json'
+
+
+def open_text(path: str, mode: str, compression: Optional[str] = None):
+    """
+    Text file, gzip or zstd compressed depending on `compression`
+    """
+    if compression == 'zstd':
+        import zstandard
+        return zstandard.open(path, mode, encoding='utf-8')
+    if compression == 'gzip':
+        return gzip.open(path, mode, encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def _item_key(item) -> str:
+    """
+    'II', 2, '2' or 'item_II' -> 'item_II'
+    """
+    item = str(item)
+    if item.startswith('item_'):
+        return item
+    return f'item_{roman.toRoman(int(item))}' if item.isdigit() else f'item_{item}'
+
+
+class OutputSink:
+    """
+    Where process_filing writes extracted filings. `previous` returns what
+    was written for a filing before (at least its '_extraction' record) so
+    ExtractItems.plan can skip up to date filings
+    """
+
+    def __init__(self, folder: str):
+        self.folder = folder
+
+    def write(self, filename: str, record: Dict) -> None:
+        raise NotImplementedError
+
+    def previous(self, filename: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class JsonSink(OutputSink):
+    """
+    One indented JSON file per filing (the original output format)
+    """
+
+    def path(self, filename: str) -> str:
+        return os.path.join(self.folder, f'{filename.split(".")[0]}.json')
+
+    def write(self, filename, record):
+        with open(self.path(filename), 'w') as filepath:
+            json.dump(record, filepath, indent=4, ensure_ascii=False)
+
+    def previous(self, filename):
+        try:
+            with open(self.path(filename), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+
+class ShardedSink(OutputSink):
+    """
+    Streams filings into shard files of `shard_size` filings. Every process
+    writes its own shards; a shard's manifest (filename -> '_extraction'
+    record) is written once the shard is complete, so readers ignore
+    shards that were not closed. A filing written again later supersedes
+    its older copies
+    """
+
+    suffix = ''
+
+    def __init__(self, folder: str, shard_size: int = 1000):
+        super().__init__(folder)
+        self.shard_size = shard_size
+        self.shard = None
+        self.entries = {}
+        self.count = 0
+        self._manifest = None
+
+    def _new_shard_path(self) -> str:
+        name = f'part-{int(time.time() * 1000)}-{os.getpid()}-{self.count:05d}{self.suffix}'
+        self.count += 1
+        return os.path.join(self.folder, name)
+
+    def _open_shard(self, path: str) -> None:
+        raise NotImplementedError
+
+    def _write_record(self, filename: str, record: Dict) -> None:
+        raise NotImplementedError
+
+    def _close_shard(self) -> None:
+        raise NotImplementedError
+
+    def write(self, filename, record):
+        if self.shard is None:
+            self.shard = self._new_shard_path()
+            self._open_shard(self.shard)
+        self._write_record(filename, record)
+        self.entries[filename] = record.get('_extraction')
+        if len(self.entries) >= self.shard_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Closes the current shard and publishes its manifest
+        """
+        if self.shard is None:
+            return
+        self._close_shard()
+        manifest = {'shard': os.path.basename(self.shard), 'closed': time.time(), 'filings': self.entries}
+        tmp = self.shard + MANIFEST_SUFFIX + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp, self.shard + MANIFEST_SUFFIX)
+        if self._manifest is not None:
+            self._manifest.update({filename: (manifest['shard'], extraction)
+                                   for filename, extraction in self.entries.items()})
+        self.shard = None
+        self.entries = {}
+
+    def previous(self, filename):
+        if self._manifest is None:
+            self._manifest = read_manifest(self.folder)
+        entry = self._manifest.get(filename)
+        return {'_extraction': entry[1]} if entry is not None else None
+
+    def close(self):
+        self.flush()
+
+
+class JsonlSink(ShardedSink):
+    """
+    One JSON line per filing, optionally gzip / zstd compressed
+    """
+
+    def __init__(self, folder: str, shard_size: int = 1000, compression: Optional[str] = None):
+        super().__init__(folder, shard_size)
+        self.compression = compression
+        self.suffix = '.jsonl' + COMPRESSION_SUFFIXES[compression]
+        self.file = None
+
+    def _open_shard(self, path):
+        self.file = open_text(path, 'wt', self.compression)
+
+    def _write_record(self, filename, record):
+        self.file.write(json.dumps({'filename': filename, **record}, ensure_ascii=False))
+        self.file.write('\n')
+
+    def _close_shard(self):
+        self.file.close()
+        self.file = None
+
+
+class ParquetSink(ShardedSink):
+    """
+    One row per filing x item: filename, the filing metadata, item ('II') and text
+    """
+
+    suffix = '.parquet'
+
+    def __init__(self, folder: str, shard_size: int = 1000):
+        super().__init__(folder, shard_size)
+        self.rows = []
+
+    def _open_shard(self, path):
+        self.rows = []
+
+    def _write_record(self, filename, record):
+        metadata = [record.get(column) for column in METADATA_COLUMNS]
+        for key, text in record.items():
+            if key.startswith('item_'):
+                self.rows.append([filename] + metadata + [key[5:], text])
+
+    def _close_shard(self):
+        df = pd.DataFrame(self.rows, columns=['filename'] + METADATA_COLUMNS + ['item', 'text'], dtype='string')
+        tmp = self.shard + '.tmp'
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, self.shard)
+        self.rows = []
+
+
+def open_sink(folder: str, output_format: str = 'json', compression: Optional[str] = None,
+              shard_size: int = 1000) -> OutputSink:
+    if output_format == 'json':
+        return JsonSink(folder)
+    if output_format == 'jsonl':
+        return JsonlSink(folder, shard_size, compression)
+    if output_format == 'parquet':
+        return ParquetSink(folder, shard_size)
+    raise ValueError(f'Unknown output format "{output_format}", expected one of {OUTPUT_FORMATS}')
+
+
+def read_manifest(folder: str) -> Dict:
+    """
+    filename -> (shard, '_extraction' record) of the latest copy of every
+    filing in the complete shards of `folder`
+    """
+    manifests = []
+    for path in glob.glob(os.path.join(folder, '*' + MANIFEST_SUFFIX)):
+        try:
+            with open(path, encoding='utf-8') as f:
+                manifests.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+
+    latest = {}
+    for manifest in sorted(manifests, key=lambda m: m['closed']):
+        for filename, extraction in manifest['filings'].items():
+            latest[filename] = (manifest['shard'], extraction)
+    return latest
+
+
+def _select(record: Dict, item_keys: Optional[set], columns: Optional[List[str]]) -> Dict:
+    return {key: value for key, value in record.items()
+            if key == 'filename'
+            or (key.startswith('item_') and (item_keys is None or key in item_keys))
+            or (not key.startswith('item_') and (columns is None or key in columns))}
+
+
+def _current_shards(folder: str) -> Dict[str, set]:
+    """
+    shard -> filings whose latest copy is in that shard
+    """
+    shards = {}
+    for filename, (shard, _) in read_manifest(folder).items():
+        shards.setdefault(shard, set()).add(filename)
+    return shards
+
+
+def _modified_since(path: str, since: Optional[float]) -> bool:
+    return since is None or os.path.getmtime(path) >= since
+
+
+def _text_records(folder: str, item_keys: Optional[set], columns: Optional[List[str]],
+                  since: Optional[float] = None) -> Iterator[Dict]:
+    """
+    Filings of the JSON files and JSONL shards of `folder`
+    """
+    for path in sorted(glob.glob(os.path.join(folder, '*.json'))):
+        if path.endswith(MANIFEST_SUFFIX) or not _modified_since(path, since):
+            continue
+        with open(path, encoding='utf-8') as f:
+            record = json.load(f)
+        record['filename'] = os.path.basename(path)[:-len('.json')] + '.html'
+        yield _select(record, item_keys, columns)
+
+    for shard, filenames in sorted(_current_shards(folder).items()):
+        path = os.path.join(folder, shard)
+        if '.jsonl' not in shard or not _modified_since(path, since):
+            continue
+        with open_text(path, 'rt', compression_of(path)) as f:
+            for line in f:
+                record = json.loads(line)
+                if record['filename'] in filenames:
+                    yield _select(record, item_keys, columns)
+
+
+def _parquet_items(folder: str, item_names: Optional[List[str]], columns: List[str],
+                   since: Optional[float] = None) -> List[pd.DataFrame]:
+    frames = []
+    for shard, filenames in sorted(_current_shards(folder).items()):
+        if not shard.endswith('.parquet') or not _modified_since(os.path.join(folder, shard), since):
+            continue
+        df = pd.read_parquet(os.path.join(folder, shard), columns=['filename'] + columns + ['item', 'text'])
+        keep = df['filename'].isin(filenames)
+        if item_names is not None:
+            keep &= df['item'].isin(item_names)
+        frames.append(df[keep])
+    return frames
+
+
+def iter_records(folder: str, items: Optional[List] = None, columns: Optional[List[str]] = None,
+                 since: Optional[float] = None) -> Iterator[Dict]:
+    """
+    Extracted filings of `folder`, whatever the output format
+
+    :param items: items to load ('II', 2 or 'item_II'), default all
+    :param columns: other fields to load (e.g. ['corp_code', 'filing_date']), default all
+    :param since: only the files / shards written at or after this time.time()
+                  (a shard also holds filings written before)
+    :return: one dict per filing
+    """
+    item_keys = {_item_key(item) for item in items} if items is not None else None
+    yield from _text_records(folder, item_keys, columns, since)
+
+    metadata_columns = METADATA_COLUMNS if columns is None else [c for c in columns if c in METADATA_COLUMNS]
+    item_names = sorted(key[5:] for key in item_keys) if item_keys is not None else None
+    for df in _parquet_items(folder, item_names, metadata_columns, since):
+        for filename, rows in df.groupby('filename', sort=False):
+            record = {'filename': filename}
+            record.update({column: rows[column].iloc[0] for column in metadata_columns})
+            record.update({f'item_{item}': text for item, text in zip(rows['item'], rows['text'])})
+            yield record
+
+
+def load_items(folder: str, items: Optional[List] = None, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Extracted items as a DataFrame with one row per filing x item:
+    filename, `columns` (filing metadata, default all), item ('II') and text.
+    Parquet shards are read only for the requested columns
+    """
+    columns = METADATA_COLUMNS if columns is None else [c for c in columns if c in METADATA_COLUMNS]
+    item_keys = {_item_key(item) for item in items} if items is not None else None
+    item_names = sorted(key[5:] for key in item_keys) if item_keys is not None else None
+
+    frames = _parquet_items(folder, item_names, columns)
+    rows = []
+    for record in _text_records(folder, item_keys, columns):
+        metadata = [record.get(column) for column in columns]
+        for key, text in record.items():
+            if key.startswith('item_'):
+                rows.append([record['filename']] + metadata + [key[5:], text])
+    if rows or not frames:
+        frames.append(pd.DataFrame(rows, columns=['filename'] + columns + ['item', 'text']))
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,169 @@
+import json
+import time
+import random
+import argparse
+import threading
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from typing import Dict
+
+from fixtures import FixtureStore
+
+
+# 요청 제한 초과 시 OpenDART 응답 (HTTP 200)
+OPENDART_LIMIT_BODY = json.dumps({'status': '020', 'message': '요청 제한을 초과하였습니다.'}).encode()
+
+
+class StubOptions:
+    """
+    :param latency: seconds before every response, plus uniform(0, jitter)
+    :param error_rate: share of requests answered with a 503
+    :param rate_limit: requests / second accepted over any 1 second window
+                       (None: unlimited); beyond that /api/ requests get
+                       OpenDART status 020, the others a 429 with Retry-After
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 rate_limit: float = None, retry_after: int = 1, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.window = deque()
+        self.started = time.monotonic()
+        self.counts = Counter()
+
+    def draw(self):
+        """
+        :return: (delay, fail) for the next request, drawn from the seeded generator
+        """
+        with self.lock:
+            return self.latency + self.rng.uniform(0, self.jitter), self.rng.random() < self.error_rate
+
+    def admit(self) -> bool:
+        if self.rate_limit is None:
+            return True
+        now = time.monotonic()
+        with self.lock:
+            while self.window and self.window[0] <= now - 1.0:
+                self.window.popleft()
+            if len(self.window) >= self.rate_limit:
+                return False
+            self.window.append(now)
+            return True
+
+    def count(self, path: str, outcome: str) -> None:
+        with self.lock:
+            self.counts[(path, outcome)] += 1
+
+    def stats(self) -> Dict:
+        with self.lock:
+            elapsed = time.monotonic() - self.started
+            paths = {}
+            for (path, outcome), n in self.counts.items():
+                paths.setdefault(path, {})[outcome] = n
+            total = sum(self.counts.values())
+            return {'elapsed': elapsed, 'requests': total,
+                    'requests_per_sec': total / elapsed if elapsed > 0 else 0.0, 'paths': paths}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Answers GETs from the recorded fixtures; status 404 when nothing was
+    recorded for the request. GET /_stats returns the request counters
+    """
+
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real servers
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        options = self.server.options
+        if path == '/_stats':
+            return self._send(200, json.dumps(options.stats()).encode(), {'Content-Type': 'application/json'})
+
+        if not options.admit():
+            options.count(path, 'rate_limited')
+            if path.startswith('/api/'):
+                return self._send(200, OPENDART_LIMIT_BODY, {'Content-Type': 'application/json;charset=UTF-8'})
+            return self._send(429, b'', {'Retry-After': str(options.retry_after)})
+
+        delay, fail = options.draw()
+        time.sleep(delay)
+        if fail:
+            options.count(path, 'error')
+            return self._send(503, b'', {})
+
+        recorded = self.server.fixtures.get(self.path)
+        if recorded is None:
+            options.count(path, 'missing')
+            return self._send(404, b'', {})
+        meta, body = recorded
+        headers = dict(meta['headers'])
+        # 기록할 때 requests 가 쓴 인코딩을 그대로 알려줌
+        for key, value in headers.items():
+            if key.lower() == 'content-type' and meta['encoding'] and 'charset' not in value:
+                headers[key] = f"{value}; charset={meta['encoding']}"
+        options.count(path, str(meta['status_code']))
+        self._send(meta['status_code'], body, headers)
+
+    def _send(self, status_code: int, body: bytes, headers: Dict) -> None:
+        self.send_response(status_code)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(fixtures_dir: str, host: str = '127.0.0.1', port: int = 8765, options: StubOptions = None) -> ThreadingHTTPServer:
+    """
+    Starts the stub server in a background thread; stop it with shutdown()
+
+        server = serve('docs_cache/fixtures', options=StubOptions(latency=0.05, rate_limit=5))
+        utils.configure_base_urls({'opendart.fss.or.kr': 'http://127.0.0.1:8765',
+                                   'dart.fss.or.kr': 'http://127.0.0.1:8765'})
+    """
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.fixtures = FixtureStore(fixtures_dir)
+    server.options = options or StubOptions()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Local stand-in for opendart.fss.or.kr / dart.fss.or.kr serving recorded responses '
+                    '(record them with "record_fixtures" in config.json, point the crawler here with "base_urls")')
+    parser.add_argument('fixtures', help='folder of recorded responses')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds before every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='random extra latency, up to this many seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests failing with 503')
+    parser.add_argument('--rate-limit', type=float, default=None, help='requests / second before rate limit responses')
+    parser.add_argument('--retry-after', type=int, default=1, help='Retry-After of the 429 responses')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    options = StubOptions(args.latency, args.jitter, args.error_rate, args.rate_limit, args.retry_after, args.seed)
+    server = serve(args.fixtures, args.host, args.port, options)
+    print(f'Serving {args.fixtures} on http://{args.host}:{args.port}')
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+    print(json.dumps(options.stats(), indent=4))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+import os
+import random
+
+from typing import List
+
+from section_index import delimiter
+
+
+# 사업보고서(A001) 목차
+A001_OUTLINE = [
+    '사 업 보 고 서', '【 대표이사 등의 확인 】',
+    'I. 회사의 개요', '1. 회사의 개요', '2. 회사의 연혁', '3. 자본금 변동사항', '4. 주식의 총수 등', '5. 정관에 관한 사항',
+    'II. 사업의 내용', '1. 사업의 개요', '2. 주요 제품 및 서비스', '3. 원재료 및 생산설비', '4. 매출 및 수주상황',
+    '5. 위험관리 및 파생거래', '6. 주요계약 및 연구개발활동', '7. 기타 참고사항',
+    'III. 재무에 관한 사항', '1. 요약재무정보', '2. 연결재무제표', '3. 연결재무제표 주석', '4. 재무제표', '5. 재무제표 주석',
+    '6. 배당에 관한 사항', '7. 증권의 발행을 통한 자금조달에 관한 사항', '8. 기타 재무에 관한 사항',
+    'IV. 이사의 경영진단 및 분석의견',
+    'V. 회계감사인의 감사의견 등', '1. 외부감사에 관한 사항', '2. 내부통제에 관한 사항',
+    'VI. 이사회 등 회사의 기관에 관한 사항', '1. 이사회에 관한 사항', '2. 감사제도에 관한 사항', '3. 주주총회 등에 관한 사항',
+    'VII. 주주에 관한 사항',
+    'VIII. 임원 및 직원 등에 관한 사항', '1. 임원 및 직원 등의 현황', '2. 임원의 보수 등',
+    'IX. 계열회사 등에 관한 사항', 'X. 대주주 등과의 거래내용', 'XI. 그 밖에 투자자 보호를 위하여 필요한 사항',
+]
+
+# 실제 공시에서 섹션 크기의 대략적인 비중 (재무 주석이 가장 큼)
+SECTION_WEIGHTS = {'3. 연결재무제표 주석': 12, '5. 재무제표 주석': 10, 'IX. 계열회사 등에 관한 사항': 5,
+                   'II. 사업의 내용': 3, 'VI. 이사회 등 회사의 기관에 관한 사항': 3}
+
+WORDS = [
+    '당사는', '연결회사는', '매출액은', '전기', '대비', '증가하였습니다', '감소하였습니다', '반도체', '디스플레이',
+    '바이오의약품', '이차전지', '생산능력', '연구개발', '투자', '계약', '종속회사', '지배회사', '주요', '제품',
+    '서비스', '시장', '점유율', '경쟁', '원재료', '가격', '변동', '위험', '관리', '환율', '이자율', '유동성',
+    '자산', '부채', '자본', '영업이익', '당기순이익', '현금흐름', '배당', '주식', '발행', '이사회', '감사위원회',
+    '및', '등', '의', '에', '를', '으로', '있습니다', '하였습니다', '(주)', 'CDMO', 'DRAM', 'NAND', '2022년', '제12기',
+]
+
+HEADER = '''<!DOCTYPE HTML PUBLIC "-//W3C//DTD HTML 4.01 Transitional//EN" "http://www.w3.org/TR/html4/loose.dtd">
+<html style="border:0">
+<head>
+<title></title>
+<meta content="text/html; charset=utf-8" http-equiv="Content-Type"/>
+<link href="/css/report_xml.css" rel="stylesheet" type="text/css"/>
+</head>
+<body bgcolor="#FFFFFF">
+'''
+
+
+def _number(rng: random.Random) -> str:
+    value = rng.randint(0, 10 ** rng.randint(1, 9))
+    kind = rng.random()
+    if kind < 0.1:
+        return '-'
+    if kind < 0.2:
+        return f'({value:,})'
+    if kind < 0.3:
+        return f'{rng.random() * 100:.1f}%'
+    return f'{value:,}'
+
+
+def _paragraph(rng: random.Random, n_words: int) -> str:
+    text = ' '.join(rng.choices(WORDS, k=n_words))
+    return f'<p>{text}.</p>\n'
+
+
+def _table(rng: random.Random, n_rows: int, n_cols: int) -> str:
+    unit = rng.choice(['백만원', '천원', '원', '주', '%'])
+    rows = [
+        '<table class="nb" width="601">\n<tbody>\n<tr>\n'
+        f'<td align="RIGHT" height="20" valign="BOTTOM" width="601">(단위 : {unit})</td>\n'
+        '</tr>\n</tbody>\n</table>\n',
+        '<table border="1" width="601">\n<thead>\n<tr>\n'
+        '<th align="CENTER" height="50" rowspan="2" width="101">구분</th>\n'
+        f'<th align="CENTER" colspan="{n_cols - 1}" height="20" width="400">제12기</th>\n'
+        '</tr>\n<tr>\n',
+    ]
+    rows.extend(f'<th align="CENTER" height="30" width="100">{c}분기</th>\n' for c in range(1, n_cols))
+    rows.append('</tr>\n</thead>\n<tbody>\n')
+    for _ in range(n_rows):
+        label = ' '.join(rng.choices(WORDS, k=2))
+        cells = ''.join(f'<td align="RIGHT" height="20" width="100">{_number(rng)}</td>\n' for _ in range(n_cols - 1))
+        rows.append(f'<tr>\n<td align="CENTER" height="20" width="101">{label}</td>\n{cells}</tr>\n')
+    rows.append('</tbody>\n</table>\n')
+    return ''.join(rows)
+
+
+def generate_section(rng: random.Random, title: str, size: int, table_ratio: float = 0.5) -> str:
+    """
+    HTML of one sub-document of about `size` bytes; roughly `table_ratio`
+    of it in tables
+    """
+    parts = [HEADER, f'<p class="section-2"><a name="toc1">{title}</a></p>\n<p><br/></p>\n']
+    written = sum(len(part.encode()) for part in parts)
+    while written < size:
+        if rng.random() < table_ratio:
+            part = _table(rng, rng.randint(3, 15), rng.randint(3, 7))
+        else:
+            part = _paragraph(rng, rng.randint(20, 120))
+        parts.append(part)
+        written += len(part.encode())
+    parts.append('</body>\n')
+    return ''.join(parts)
+
+
+def section_titles(n_sections: int) -> List[str]:
+    titles = list(A001_OUTLINE[:n_sections])
+    while len(titles) < n_sections:
+        titles.append(f'{len(titles) - len(A001_OUTLINE) + 9}. 기타 재무에 관한 사항')
+    return titles
+
+
+def generate_filing(size: int = 3_500_000, n_sections: int = 40, table_ratio: float = 0.5, seed: int = 0) -> str:
+    """
+    DART style concatenated filing as written by dart_crawler.crawl: every
+    sub-document starts with a `<!-- File: title -->` line, which follows the
+    closing </html> of the previous sub-document
+
+    :param size: approximate size in bytes
+    :param n_sections: number of sub-documents (the A001 outline, then filler sections)
+    :param table_ratio: share of the content in tables
+    """
+    rng = random.Random(seed)
+    titles = section_titles(n_sections)
+    weights = [SECTION_WEIGHTS.get(title, 1) for title in titles]
+    total = sum(weights)
+
+    parts = []
+    for i, (title, weight) in enumerate(zip(titles, weights)):
+        prefix = '' if i == 0 else '</html>'
+        parts.append(f'{prefix}{delimiter} {title} -->\n')
+        parts.append(generate_section(rng, title, size * weight // total, table_ratio))
+    parts.append('</html>\n')
+    return ''.join(parts)
+
+
+def write_filings(folder: str, n_filings: int, **kwargs) -> List[str]:
+    """
+    Writes `n_filings` synthetic filings (see generate_filing) named like
+    crawled ones
+
+    :return: the filenames
+    """
+    filenames = []
+    for i in range(n_filings):
+        filename = f'{i:06d}_A001_2023_2023{i:010d}_20230315.html'
+        with open(os.path.join(folder, filename), 'w', encoding='utf-8') as f:
+            f.write(generate_filing(seed=i, **kwargs))
+        filenames.append(filename)
+    return filenames
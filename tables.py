@@ -0,0 +1,188 @@
+import os
+import re
+import importlib.util
+
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+# '(단위 : 백만원)', '단위: 천원, 천USD' 처럼 표 위나 표 안에 적힌 단위
+UNIT_RE = re.compile(r'단위\s*[:：]\s*([^\s,)]+)')
+UNIT_MYRIADS = {'조': 1e12, '억': 1e8, '만': 1e4}
+UNIT_DIGITS = {'십': 10, '백': 100, '천': 1000}
+# '천만원' = 천 x 만, '백억원' = 백 x 억. 십 / 백 은 만 / 억 / 조 앞에서만 ('백분율' 은 단위 그대로)
+UNIT_PREFIX_RE = re.compile(r'(?:([십백천]?)([조억만])|(천))(?=.)')
+
+# '1,234', '(1,234)', '△1,234', '-12.5', '22.1%'. 괄호 / △ / ▲ / ▽ 는 음수
+NUMBER_RE = re.compile(r'([(△▲▽-]?)\s*(\d{1,3}(?:,\d{3})+|\d+)(\.\d+)?\s*(\)?)\s*(%?)')
+
+# 값이 없는 셀 ('-' 는 0 또는 해당 없음)
+EMPTY_CELLS = {'', '-', '–', '—'}
+
+TABLE_COLUMNS = ['rcept_no', 'item', 'table', 'row', 'col', 'header', 'text', 'value', 'unit', 'scale']
+
+
+def parse_unit(unit: Optional[str]):
+    """
+    '백만원' -> ('백만원', 1e6), '천만원' -> ('천만원', 1e7), '주' -> ('주', 1.0)
+
+    :return: (unit, scale) where value * scale is in the base unit
+    """
+    if not unit:
+        return None, 1.0
+    match = UNIT_PREFIX_RE.match(unit)
+    if match is None:
+        return unit, 1.0
+    digit, myriad, thousand = match.groups()
+    if thousand:
+        return unit, 1e3
+    return unit, UNIT_DIGITS.get(digit, 1) * UNIT_MYRIADS[myriad]
+
+
+def parse_number(text: str):
+    """
+    Number written in a table cell, as written (not scaled by the unit)
+
+    :return: (value, is_percent); value is NaN if the cell is not a number
+    """
+    match = NUMBER_RE.fullmatch(text)
+    if match is None:
+        return np.nan, False
+    sign, integer, fraction, close, percent = match.groups()
+    if (sign == '(') != (close == ')'):
+        return np.nan, False
+    value = float(integer.replace(',', '') + (fraction or ''))
+    return (-value if sign else value), bool(percent)
+
+
+def expand_spans(rows: List[List[Dict]]) -> List[List[Dict]]:
+    """
+    Lays the cells of a table out on a grid, repeating rowspan/colspan cells
+    in every position they cover
+
+    :param rows: cells per <tr>, dicts with text, header, rowspan, colspan
+    :return: rectangular grid, missing cells are None
+    """
+    grid = []
+    pending = {}  # col -> [cell, rows left] for cells spanning down
+    for row in rows:
+        out = []
+        cells = iter(row)
+        cell = next(cells, None)
+        col = 0
+        while cell is not None or any(c >= col for c in pending):
+            if col in pending:
+                spanned, left = pending[col]
+                out.append(spanned)
+                if left == 1:
+                    del pending[col]
+                else:
+                    pending[col][1] -= 1
+                col += 1
+                continue
+            if cell is None:
+                out.append(None)
+                col += 1
+                continue
+            for _ in range(cell['colspan']):
+                if cell['rowspan'] > 1:
+                    pending[col] = [cell, cell['rowspan'] - 1]
+                out.append(cell)
+                col += 1
+            cell = next(cells, None)
+        grid.append(out)
+
+    width = max((len(row) for row in grid), default=0)
+    return [row + [None] * (width - len(row)) for row in grid]
+
+
+def tables_frame(tables: List[Dict], rcept_no: str, item: str) -> pd.DataFrame:
+    """
+    Long format (one row per grid cell) DataFrame of the tables of one item
+
+    :param tables: tables collected by dart_parser.HtmlTextExtractor
+    """
+    records = []
+    for index, table in enumerate(tables):
+        unit, scale = parse_unit(table['unit'])
+        for r, row in enumerate(expand_spans(table['rows'])):
+            for c, cell in enumerate(row):
+                if cell is None:
+                    continue
+                text = ' '.join(''.join(cell['text']).split())
+                value, percent = parse_number(text)
+                records.append((
+                    rcept_no, item, index, r, c, cell['header'], text, value,
+                    '%' if percent else unit, 1.0 if percent else scale,
+                ))
+
+    df = pd.DataFrame.from_records(records, columns=TABLE_COLUMNS)
+    return df.astype({
+        'rcept_no': 'string', 'item': 'string', 'table': 'int32', 'row': 'int32', 'col': 'int32',
+        'header': 'bool', 'text': 'string', 'value': 'float64', 'unit': 'string', 'scale': 'float64',
+    })
+
+
+def parquet_available() -> bool:
+    return any(importlib.util.find_spec(engine) is not None for engine in ('pyarrow', 'fastparquet'))
+
+
+def write_tables(df: pd.DataFrame, path: str) -> None:
+    tmp = path + '.tmp'
+    df.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+
+
+def load_tables(path: str, items: Optional[List[str]] = None, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Reads the tables of one filing (or a folder of filings)
+
+    :param items: roman item numbers to keep, e.g. ['II']
+    :param columns: subset of TABLE_COLUMNS to read
+    """
+    if columns is not None and items is not None and 'item' not in columns:
+        df = pd.read_parquet(path, columns=columns + ['item'])
+        return df[df['item'].isin(items)].drop(columns='item').reset_index(drop=True)
+    df = pd.read_parquet(path, columns=columns)
+    if items is not None:
+        df = df[df['item'].isin(items)].reset_index(drop=True)
+    return df
+
+
+def table_frame(df: pd.DataFrame, item: str, table: int) -> pd.DataFrame:
+    """
+    One table in wide format: header rows (<th> / <thead> cells, or the first
+    row if there are none) become the column names, and columns whose cells
+    are all numbers (or '-') are returned as float
+
+    :param df: long format tables from load_tables()
+    """
+    cells = df[(df['item'] == item) & (df['table'] == table)]
+    text = cells.pivot(index='row', columns='col', values='text')
+    values = cells.pivot(index='row', columns='col', values='value')
+    header_rows = cells.groupby('row')['header'].all()
+    n_header = 0
+    while n_header < len(header_rows) and header_rows.iloc[n_header]:
+        n_header += 1
+    n_header = n_header or 1
+
+    names = []
+    for col in text.columns:
+        parts = []
+        for part in text[col].iloc[:n_header]:
+            if isinstance(part, str) and part and part not in parts:
+                parts.append(part)
+        names.append(' '.join(parts) or str(col))
+
+    body = text.iloc[n_header:]
+    out = {}
+    for col, name in zip(text.columns, names):
+        if name in out:
+            name = f'{name}_{col}'
+        column = body[col]
+        filled = column.notna() & ~column.isin(EMPTY_CELLS)
+        numeric = values[col].iloc[n_header:]
+        out[name] = numeric.astype('float64') if filled.any() and numeric[filled].notna().all() else column
+    return pd.DataFrame(out).reset_index(drop=True)
@@ -0,0 +1,44 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT)
+# 모듈들이 import 시점에 ./config.json 을 읽음
+os.chdir(ROOT)
+
+import metadata_store  # noqa: E402
+
+DATASET_DIR = os.path.join(ROOT, 'datasets')
+RAW_FILINGS = os.path.join(DATASET_DIR, 'RAW_FILINGS')
+EXTRACTED_FILINGS = os.path.join(DATASET_DIR, 'EXTRACTED_FILINGS')
+
+
+@pytest.fixture
+def store(tmp_path):
+    """
+    Metadata store of the sample datasets/ files, in a temporary folder
+    """
+    store = metadata_store.MetadataStore(str(tmp_path / 'METADATA.sqlite'))
+    store.import_legacy(os.path.join(DATASET_DIR, 'FILINGS_METADATA.csv'),
+                        os.path.join(DATASET_DIR, 'companies_info.json'))
+    yield store
+    store.close()
+
+
+def sample_filings():
+    """
+    Sample filings with both a raw file and an extracted json, as metadata rows
+    """
+    store = metadata_store.MetadataStore(':memory:')
+    store.import_legacy(os.path.join(DATASET_DIR, 'FILINGS_METADATA.csv'),
+                        os.path.join(DATASET_DIR, 'companies_info.json'))
+    filings = store.filings().drop_duplicates(subset=['filename']).replace({np.nan: None})
+    store.close()
+    return [
+        filing for _, filing in filings.iterrows()
+        if os.path.exists(os.path.join(RAW_FILINGS, filing['filename']))
+        and os.path.exists(os.path.join(EXTRACTED_FILINGS, filing['filename'].split('.')[0] + '.json'))
+    ]
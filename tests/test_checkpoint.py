@@ -0,0 +1,148 @@
+import os
+
+import pandas as pd
+import pytest
+import requests
+from requests.structures import CaseInsensitiveDict
+
+import dart_api
+import dart_crawler
+import section_index
+from checkpoint import SectionCheckpoint, response_encoding, to_utf8
+from compression import compression_available, iter_frames
+
+RCEPT_NO = '20230315000001'
+SECTIONS = [(f'{title}', f'http://dart.fss.or.kr/report/viewer.do?rcpNo={RCEPT_NO}&dcmNo=9&eleId={i}')
+            for i, title in enumerate(['I. 회사의 개요', 'II. 사업의 내용', 'III. 재무에 관한 사항'])]
+
+
+def html(title):
+    return f'<html>\n<body>\n<p>{title} 본문</p>\n</body>\n</html>'.encode()
+
+
+def response(content, content_type='text/html; charset=utf-8'):
+    r = requests.Response()
+    r.status_code = 200
+    r._content = content
+    r.encoding = content_type.split('charset=')[1] if 'charset=' in content_type else 'ISO-8859-1'
+    r.headers = CaseInsensitiveDict({'Content-Type': content_type})
+    return r
+
+
+def test_saved_sections_survive_a_restart(tmp_path):
+    checkpoint = SectionCheckpoint(str(tmp_path), RCEPT_NO)
+    for title, url in SECTIONS[:2]:
+        checkpoint.save(url, title, html(title))
+
+    # 중단 후 다시 시작: manifest 에서 상태를 읽음
+    resumed = SectionCheckpoint(str(tmp_path), RCEPT_NO)
+    assert [resumed.is_done(url) for _, url in SECTIONS] == [True, True, False]
+    # manifest 에는 있지만 파일이 없는 섹션은 다시 받음
+    os.remove(os.path.join(resumed.partial_dir, resumed.manifest['sections']['9/0']['file']))
+    assert not resumed.is_done(SECTIONS[0][1])
+
+
+def test_assemble(tmp_path):
+    checkpoint = SectionCheckpoint(str(tmp_path), RCEPT_NO)
+    # 받은 순서와 상관없이 주어진 순서대로 이어 붙임
+    for title, url in reversed(SECTIONS):
+        checkpoint.save(url, title, html(title))
+    path = checkpoint.assemble(SECTIONS, 'filing.html')
+
+    assert path == str(tmp_path / 'filing.html')
+    assert not os.path.exists(checkpoint.partial_dir)
+    with open(path, 'rb') as f:
+        data = f.read()
+    assert [title.strip() for title, _, _ in section_index.iter_sections(data)] == [title for title, _ in SECTIONS]
+    assert data.startswith(f'<!-- File: {SECTIONS[0][0]} -->\n'.encode() + html(SECTIONS[0][0]))
+
+
+@pytest.mark.parametrize('compression, suffix', [
+    ('gzip', '.gz'),
+    pytest.param('zstd', '.zst', marks=pytest.mark.skipif(not compression_available('zstd'), reason='needs zstandard')),
+])
+def test_assemble_compressed_replaces_other_variants(tmp_path, compression, suffix):
+    for stale in ('filing.html', 'filing.html.idx.json', 'filing.html.gz'):
+        (tmp_path / stale).write_text('old')
+    checkpoint = SectionCheckpoint(str(tmp_path), RCEPT_NO)
+    for title, url in SECTIONS:
+        checkpoint.save(url, title, html(title))
+    path = checkpoint.assemble(SECTIONS, 'filing.html', compression)
+
+    assert sorted(os.listdir(tmp_path)) == ['.partial', 'filing.html' + suffix]
+    with open(path, 'rb') as f:
+        frames = list(iter_frames(f.read(), compression))
+    # 섹션마다 gzip member / zstd frame 하나
+    assert [data for _, _, data in frames] == [
+        f'<!-- File: {title} -->\n'.encode() + html(title) for title, _ in SECTIONS]
+
+
+def test_sections_in_another_charset_are_stored_as_utf8(tmp_path):
+    content = '<html>\n<head><meta content="text/html; charset=euc-kr" http-equiv="Content-Type"/></head>\n' \
+              '<body>II. 사업의 내용</body>\n</html>'
+    checkpoint = SectionCheckpoint(str(tmp_path), RCEPT_NO)
+    title, url = SECTIONS[1]
+    checkpoint.save(url, title, content.encode('euc-kr'), response_encoding(response(content.encode('euc-kr'), 'text/html')))
+    path = checkpoint.assemble([(title, url)], 'filing.html')
+
+    with open(path, 'rb') as f:
+        data = f.read()
+    (_, start, end), = section_index.iter_sections(data)
+    assert section_index.decode_section(data[start:end]) == content.replace('charset=euc-kr', 'charset=utf-8')
+
+
+def test_response_encoding():
+    assert response_encoding(response(b'<html/>', 'text/html; charset=euc-kr')) == 'euc-kr'
+    assert response_encoding(response(b'<meta charset="EUC-KR">', 'text/html')) == 'euc-kr'
+    # requests 의 text/* 기본값(ISO-8859-1) 대신 utf-8
+    assert response_encoding(response(b'<html/>', 'text/html')) == 'utf-8'
+    assert to_utf8(b'abc', 'utf-8') == b'abc'
+
+
+def test_undeclared_charset_is_not_guessed():
+    with pytest.raises(ValueError):
+        section_index.decode_section('<p>사업의 내용</p>'.encode('euc-kr'))
+
+
+class FlakyDownloader:
+    """
+    Fails the urls in `failing` once, answers everything else
+    """
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.requested = []
+
+    def fetch_iter(self, urls):
+        for i, url in enumerate(urls):
+            self.requested.append(url)
+            if url in self.failing:
+                self.failing.discard(url)
+                yield i, requests.ConnectionError(url)
+            else:
+                title = next(title for title, u in SECTIONS if u == url)
+                yield i, response(html(title))
+
+
+def test_crawl_resumes_after_a_failed_section(tmp_path, store, monkeypatch):
+    monkeypatch.setattr(dart_api, 'sub_docs', lambda rcp_no: pd.DataFrame(SECTIONS, columns=['title', 'url']))
+    store.upsert_company('00000001', {'company_name': '테스트'})
+    series = pd.Series({'rcept_no': RCEPT_NO, 'corp_code': '00000001', 'corp_name': '테스트', 'stock_code': '000001',
+                        'rcept_dt': '20230315', 'year': '2023'})
+    raw = tmp_path / 'raw'
+    raw.mkdir()
+
+    downloader = FlakyDownloader(failing=[SECTIONS[1][1]])
+    assert dart_crawler.crawl(series, 'A001', str(raw), '', '', store, downloader) is None
+    assert downloader.requested == [url for _, url in SECTIONS]
+    assert os.listdir(raw) == ['.partial']
+
+    downloader.requested = []
+    df = dart_crawler.crawl(series, 'A001', str(raw), '', '', store, downloader)
+    # 두 번째에는 실패한 섹션만 받음
+    assert downloader.requested == [SECTIONS[1][1]]
+    filename = df['filename'].iloc[0]
+    assert sorted(os.listdir(raw)) == ['.partial', filename, filename + '.idx.json']
+    with section_index.RawFiling(str(raw / filename)) as filing:
+        # 섹션의 마지막 줄(</html>)은 다음 섹션의 구분 줄에 포함됨
+        assert filing.read_item('II') == html(SECTIONS[1][0]).decode()[:-len('</html>')]
@@ -0,0 +1,68 @@
+"""
+CorpCodeIndex: resolving corp codes, stock codes and company names
+"""
+import pandas as pd
+import pytest
+
+from corp_index import CorpCodeIndex, normalize_name
+
+CORP_CODES = pd.DataFrame([
+    ('00126380', '삼성전자', '005930', '20230102'),
+    ('00126371', '삼성전기', '009150', '20230102'),
+    ('00164779', '에스케이하이닉스', '000660', '20230102'),
+    ('01515323', 'LG에너지솔루션', '373220', '20230102'),
+    ('00401731', 'LG전자', '066570', '20230102'),
+    # 같은 이름의 비상장사: 상장사가 우선
+    ('00999999', '삼성전자(주)', None, '20230301'),
+    ('00888888', '삼성물산 주식회사', None, '20230102'),
+], columns=['corp_code', 'corp_name', 'stock_code', 'modify_date'])
+
+
+@pytest.fixture(scope='module')
+def index():
+    return CorpCodeIndex(CORP_CODES)
+
+
+def test_normalize_name():
+    assert normalize_name('㈜ 삼성 전자') == '삼성전자'
+    assert normalize_name('삼성전자 주식회사') == '삼성전자'
+    assert normalize_name('LG에너지솔루션') == 'lg에너지솔루션'
+
+
+def test_resolve(index):
+    assert index.resolve('00126380') == '00126380'
+    assert index.resolve('005930') == '00126380'
+    assert index.resolve(' 삼성전자 ') == '00126380'
+    assert index.resolve('㈜삼성물산') == '00888888'
+    assert index.resolve('lg에너지솔루션') == '01515323'
+    assert index.resolve('없는회사') is None
+
+
+def test_resolve_many(index):
+    keys = ['005930', '00164779', 'LG전자', '삼성전기 주식회사', '없는회사']
+    assert index.resolve_many(keys) == {
+        '005930': '00126380',
+        '00164779': '00164779',
+        'LG전자': '00401731',
+        '삼성전기 주식회사': '00126371',
+        '없는회사': None,
+    }
+
+
+def test_resolve_many_fuzzy(index):
+    assert index.resolve_many(['에스케이하이닉스반도체'], fuzzy=0.5) == {'에스케이하이닉스반도체': '00164779'}
+    assert index.resolve_many(['에스케이하이닉스반도체']) == {'에스케이하이닉스반도체': None}
+
+
+def test_prefix(index):
+    assert [code for code, _ in index.prefix('삼성')] == ['00888888', '00126371', '00126380']
+    assert index.prefix('삼성', limit=1) == [('00888888', '삼성물산 주식회사')]
+    assert [code for code, _ in index.prefix('lg')] == ['01515323', '00401731']
+    assert index.prefix('현대') == []
+
+
+def test_fuzzy(index):
+    matches = index.fuzzy('삼성전자우', limit=2)
+    assert matches[0][:2] == ('00126380', '삼성전자')
+    assert all(a[2] >= b[2] for a, b in zip(matches, matches[1:]))
+    assert index.fuzzy('현대자동차') == []
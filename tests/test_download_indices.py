@@ -0,0 +1,140 @@
+import os
+import json
+from datetime import datetime
+
+import pandas as pd
+import pytest
+import requests
+
+import dart_api
+import dart_crawler
+
+
+class Today(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return cls(2023, 5, 10)
+
+
+def filings(*rcept_nos):
+    return pd.DataFrame({
+        'rcept_no': list(rcept_nos),
+        'rcept_dt': [rcept_no[:8] for rcept_no in rcept_nos],
+        'report_nm': '사업보고서 (2022.12)',
+    })
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """
+    download_corp_document answering from `api.responses` by bgn_de; the
+    requested params are kept in `api.calls`
+    """
+    monkeypatch.setattr(dart_crawler, 'datetime', Today)
+
+    class Api:
+        responses = {}
+        calls = []
+
+    def download_corp_document(params, max_workers=4):
+        Api.calls.append(params)
+        return Api.responses.get(params['bgn_de'], pd.DataFrame())
+
+    monkeypatch.setattr(dart_api, 'download_corp_document', download_corp_document)
+    return Api
+
+
+def download(folder, **kwargs):
+    dart_crawler.download_indices(2023, 2023, [1, 2, 3, 4], str(folder), 'A001', 'key', retries=0, **kwargs)
+
+
+def test_quarter_in_progress_without_filings_is_not_written(tmp_path, api):
+    download(tmp_path, incremental=True)
+    # 1분기는 끝났으므로 비어 있어도 저장, 진행 중인 2분기는 저장하지 않음
+    assert sorted(os.listdir(tmp_path)) == ['2023_QTR1.csv']
+    assert [params['bgn_de'] for params in api.calls] == ['20230101', '20230401']
+
+
+def test_incremental_without_store_uses_the_index_file(tmp_path, api):
+    api.responses = {'20230401': filings('20230402000001', '20230405000002')}
+    download(tmp_path, incremental=True)
+    index = pd.read_csv(tmp_path / '2023_QTR2.csv', index_col=0, dtype=str)
+    assert list(index['rcept_no']) == ['20230402000001', '20230405000002']
+
+    # 다음 실행은 마지막 접수일부터 다시 조회 (1분기는 완료되어 건너뜀)
+    api.calls.clear()
+    api.responses = {'20230405': filings('20230405000002', '20230409000003')}
+    download(tmp_path, incremental=True)
+    assert [params['bgn_de'] for params in api.calls] == ['20230405']
+    index = pd.read_csv(tmp_path / '2023_QTR2.csv', index_col=0, dtype=str)
+    assert list(index['rcept_no']) == ['20230402000001', '20230405000002', '20230409000003']
+
+
+def test_incremental_with_store_records_watermarks(tmp_path, api, store):
+    api.responses = {'20230401': filings('20230402000001')}
+    download(tmp_path, incremental=True, store=store)
+    assert store.get_watermark('2023_QTR1.csv')['complete']
+    watermark = store.get_watermark('2023_QTR2.csv')
+    assert watermark == {'rcept_no': '20230402000001', 'rcept_dt': '20230402', 'complete': False}
+
+
+def test_not_incremental_skips_the_quarter_in_progress(tmp_path, api):
+    download(tmp_path)
+    assert [params['bgn_de'] for params in api.calls] == ['20230101']
+    api.calls.clear()
+    download(tmp_path)
+    assert api.calls == []
+
+
+def json_response(payload):
+    r = requests.Response()
+    r.status_code = 200
+    r._content = json.dumps(payload).encode()
+    return r
+
+
+@pytest.mark.parametrize('status', ['800', '020', '100'])
+def test_error_status_is_raised(monkeypatch, status):
+    monkeypatch.setattr(dart_api, 'make_api_call', lambda url, params=None: json_response(
+        {'status': status, 'message': 'error'}))
+    with pytest.raises(ValueError):
+        dart_api.download_corp_document({'page_no': 1})
+
+
+def test_no_data_is_empty(monkeypatch):
+    monkeypatch.setattr(dart_api, 'make_api_call', lambda url, params=None: json_response(
+        {'status': '013', 'message': '조회된 데이타가 없습니다.'}))
+    assert dart_api.download_corp_document({'page_no': 1}).empty
+
+
+@pytest.mark.parametrize('incremental', [False, True])
+def test_quarter_with_an_error_is_retried_later(tmp_path, monkeypatch, store, incremental):
+    monkeypatch.setattr(dart_crawler, 'datetime', Today)
+    responses = {'20230101': {'status': '800', 'message': '시스템 점검'}}
+    monkeypatch.setattr(dart_api, 'make_api_call', lambda url, params=None: json_response(
+        responses.get(params['bgn_de'], {'status': '013', 'message': 'no data'})))
+
+    download(tmp_path, incremental=incremental, store=store)
+    # 오류가 난 1분기는 저장하지 않음 (watermark 도 남기지 않음)
+    assert not (tmp_path / '2023_QTR1.csv').exists()
+    assert store.get_watermark('2023_QTR1.csv') is None
+
+    responses['20230101'] = {'status': '000', 'total_page': 1, 'list': [
+        {'corp_code': '00000001', 'corp_name': 'a', 'stock_code': '000001', 'corp_cls': 'Y',
+         'report_nm': '사업보고서 (2022.12)', 'rcept_no': '20230310000001', 'flr_nm': 'a',
+         'rcept_dt': '20230310', 'rm': ''}]}
+    download(tmp_path, incremental=incremental, store=store)
+    index = pd.read_csv(tmp_path / '2023_QTR1.csv', index_col=0, dtype=str)
+    assert list(index['rcept_no']) == ['20230310000001']
+
+
+def test_get_specific_indices_skips_empty_quarters(tmp_path):
+    (tmp_path / 'legacy.csv').write_text('""\n')
+    pd.DataFrame(columns=dart_crawler.INDEX_COLUMNS).to_csv(tmp_path / 'empty.csv')
+    paths = [str(tmp_path / 'legacy.csv'), str(tmp_path / 'empty.csv')]
+    df = dart_crawler.get_specific_indices(paths, 'A001')
+    assert df.empty and 'rcept_no' in df.columns
+
+    filings('20230310000001').assign(corp_code='00000001', stock_code='000001').to_csv(tmp_path / 'q1.csv')
+    df = dart_crawler.get_specific_indices(paths + [str(tmp_path / 'q1.csv')], 'A001')
+    assert list(df['rcept_no']) == ['20230310000001']
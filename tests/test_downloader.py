@@ -0,0 +1,82 @@
+"""
+SubDocDownloader: concurrent sub-document downloads and their stats
+"""
+import pandas as pd
+import pytest
+import requests
+
+import dart_api
+import dart_crawler
+import downloader
+from downloader import SubDocDownloader
+
+URLS = [f'http://dart.fss.or.kr/report/viewer.do?eleId={i}' for i in range(6)]
+
+
+def response(url, status_code=200):
+    r = requests.Response()
+    r.status_code = status_code
+    r._content = url.encode()
+    return r
+
+
+def fake_api_call(url):
+    # eleId 3 은 연결 오류, eleId 4 는 500 응답
+    if url.endswith('=3'):
+        raise requests.ConnectionError(url)
+    return response(url, 500 if url.endswith('=4') else 200)
+
+
+@pytest.fixture
+def subdoc(monkeypatch):
+    monkeypatch.setattr(downloader, 'make_api_call', fake_api_call)
+    d = SubDocDownloader(max_workers=3)
+    yield d
+    d.shutdown()
+
+
+def test_fetch_all_keeps_the_order(subdoc):
+    urls = [url for url in URLS if not url.endswith('=3')]
+    assert [r.content.decode() for r in subdoc.fetch_all(urls)] == urls
+
+
+def test_fetch_iter_yields_the_errors(subdoc):
+    results = dict(subdoc.fetch_iter(URLS))
+    assert sorted(results) == list(range(len(URLS)))
+    assert isinstance(results[3], requests.ConnectionError)
+    assert results[4].status_code == 500
+    assert results[0].content.decode() == URLS[0]
+
+
+def test_failed_requests_are_counted(subdoc):
+    list(subdoc.fetch_iter(URLS))
+    s = subdoc.stats.summary()
+    assert s['requests'] == len(URLS)
+    # 예외로 끝난 요청과 200 이 아닌 응답 모두 오류
+    assert s['errors'] == 2
+    assert s['bytes'] == sum(len(url) for url in URLS if not url.endswith('=3'))
+
+
+def test_crawl_shuts_down_its_own_downloader(tmp_path, store, monkeypatch):
+    created = []
+
+    class Tracked(SubDocDownloader):
+        def __init__(self, max_workers=8):
+            super().__init__(max_workers)
+            self.closed = False
+            created.append(self)
+
+        def shutdown(self):
+            self.closed = True
+            super().shutdown()
+
+    monkeypatch.setattr(downloader, 'make_api_call', fake_api_call)
+    monkeypatch.setattr(dart_crawler, 'SubDocDownloader', Tracked)
+    monkeypatch.setattr(dart_api, 'sub_docs', lambda rcp_no: pd.DataFrame({'title': ['I. 회사의 개요'], 'url': [URLS[3]]}))
+    store.upsert_company('00000001', {'company_name': '테스트'})
+    series = pd.Series({'rcept_no': '20230315000001', 'corp_code': '00000001', 'corp_name': '테스트',
+                        'stock_code': '000001', 'rcept_dt': '20230315', 'year': '2023'})
+
+    assert dart_crawler.crawl(series, 'A001', str(tmp_path), '', '', store) is None
+    assert len(created) == 1 and created[0].closed
+    assert created[0].stats.summary()['errors'] == 1
@@ -0,0 +1,158 @@
+"""
+ExtractItems.plan: when an extracted filing is up to date, and what makes it
+stale
+"""
+import os
+import json
+import shutil
+
+import pandas as pd
+import pytest
+
+import dart_parser
+from conftest import RAW_FILINGS, sample_filings
+from metrics import metrics
+from tables import load_tables, parquet_available
+
+FILING = sample_filings()[0]
+
+
+@pytest.fixture
+def folders(tmp_path):
+    raw = tmp_path / 'raw'
+    raw.mkdir()
+    shutil.copyfile(os.path.join(RAW_FILINGS, FILING['filename']), raw / FILING['filename'])
+    out = tmp_path / 'out'
+    out.mkdir()
+    return raw, out
+
+
+def extraction(folders, store, **kwargs):
+    raw, out = folders
+    settings = dict(remove_tables=True, items_to_extract=['1', '2'], raw_files_folder=str(raw),
+                    extracted_files_folder=str(out), skip_extracted_filings=True, metadata_db_path=store.path)
+    settings.update(kwargs)
+    return dart_parser.ExtractItems(**settings)
+
+
+def output_path(folders):
+    return os.path.join(folders[1], FILING['filename'].split('.')[0] + '.json')
+
+
+def test_nothing_extracted_yet(folders, store):
+    assert extraction(folders, store).plan(FILING) == {}
+
+
+def test_skip_extracted_filings_off(folders, store):
+    extraction(folders, store).process_filing(FILING)
+    assert extraction(folders, store, skip_extracted_filings=False).plan(FILING) == {}
+
+
+def test_up_to_date_after_extraction(folders, store):
+    assert extraction(folders, store).process_filing(FILING) == 1
+    assert extraction(folders, store).plan(FILING) is None
+    assert extraction(folders, store).process_filing(FILING) == 0
+
+
+def test_touched_raw_file_is_still_up_to_date(folders, store):
+    extraction(folders, store).process_filing(FILING)
+    path = os.path.join(folders[0], FILING['filename'])
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+    assert extraction(folders, store).plan(FILING) is None
+
+
+def test_changed_raw_file_reuses_unchanged_items(folders, store):
+    extraction(folders, store).process_filing(FILING)
+    with open(os.path.join(folders[0], FILING['filename']), 'ab') as f:
+        f.write('\n<p>추가된 내용</p>\n'.encode())
+    previous = extraction(folders, store).plan(FILING)
+    assert previous and previous['_extraction']['items'].keys() == {'item_I', 'item_II'}
+
+    metrics.reset()
+    with open(output_path(folders), encoding='utf-8') as f:
+        before = json.load(f)
+    extraction(folders, store).process_filing(FILING)
+    # 마지막 섹션만 바뀌었으므로 I, II 항목은 예전 결과를 그대로 씀
+    assert metrics.snapshot()['counters'].get('items_reused') == 2
+    with open(output_path(folders), encoding='utf-8') as f:
+        after = json.load(f)
+    assert after['item_II'] == before['item_II']
+    assert after['_extraction']['raw_sha256'] != before['_extraction']['raw_sha256']
+
+
+def test_changed_settings_extract_everything(folders, store):
+    extraction(folders, store).process_filing(FILING)
+    assert extraction(folders, store, remove_tables=False).plan(FILING) == {}
+
+
+def test_new_extractor_version_extracts_everything(folders, store, monkeypatch):
+    extraction(folders, store).process_filing(FILING)
+    monkeypatch.setattr(dart_parser, 'EXTRACTOR_VERSION', dart_parser.EXTRACTOR_VERSION + 1)
+    assert extraction(folders, store).plan(FILING) == {}
+
+
+def test_added_item_keeps_the_extracted_ones(folders, store):
+    extraction(folders, store).process_filing(FILING)
+    previous = extraction(folders, store, items_to_extract=['1', '2', '4']).plan(FILING)
+    assert previous and 'item_II' in previous
+
+
+def test_legacy_json_is_extracted_again(folders, store):
+    extraction(folders, store).process_filing(FILING)
+    with open(output_path(folders), encoding='utf-8') as f:
+        content = json.load(f)
+    del content['_extraction']
+    with open(output_path(folders), 'w', encoding='utf-8') as f:
+        json.dump(content, f)
+    assert extraction(folders, store).plan(FILING) == {}
+
+
+def test_missing_tables_file(folders, store, tmp_path):
+    tables = str(tmp_path / 'tables')
+    extraction(folders, store).process_filing(FILING)
+    assert extraction(folders, store, extract_tables=True, extracted_tables_folder=tables).plan(FILING) == {}
+
+
+def test_missing_raw_file_is_left_alone(folders, store):
+    extraction(folders, store).process_filing(FILING)
+    os.remove(os.path.join(folders[0], FILING['filename']))
+    assert extraction(folders, store).plan(FILING) is None
+    df = pd.DataFrame([FILING])
+    assert dart_parser.plan_extraction(df, extraction(folders, store)).empty
+
+
+def test_planned_filings_are_not_planned_again(folders, store, monkeypatch):
+    df = pd.DataFrame([FILING])
+    planned = dart_parser.plan_extraction(df, extraction(folders, store))
+    assert list(planned['reuse']) == [False]
+
+    def plan(self, filing_metadata):
+        raise AssertionError('planned twice')
+
+    monkeypatch.setattr(dart_parser.ExtractItems, 'plan', plan)
+    raw, out = folders
+    kwargs = dict(remove_tables=True, items_to_extract=['1', '2'], raw_files_folder=str(raw),
+                  extracted_files_folder=str(out), skip_extracted_filings=True, metadata_db_path=store.path)
+    assert dart_parser.extract_filings(planned, kwargs, workers=1) == [1]
+    assert os.path.exists(output_path(folders))
+
+
+@pytest.mark.skipif(not parquet_available(), reason='needs pyarrow or fastparquet')
+def test_tables_are_kept_for_reused_items(folders, store, tmp_path):
+    tables = str(tmp_path / 'tables')
+    os.mkdir(tables)
+    kwargs = dict(extract_tables=True, extracted_tables_folder=tables)
+    assert extraction(folders, store, **kwargs).process_filing(FILING) == 1
+    assert extraction(folders, store, **kwargs).plan(FILING) is None
+    path = extraction(folders, store, **kwargs).tables_filepath(FILING)
+    before = load_tables(path)
+    assert len(before)
+
+    with open(os.path.join(folders[0], FILING['filename']), 'ab') as f:
+        f.write('\n<p>추가된 내용</p>\n'.encode())
+    assert extraction(folders, store, **kwargs).process_filing(FILING) == 1
+    # I, II 항목은 다시 추출하지 않았지만 표는 그대로 남음
+    after = load_tables(path)
+    assert sorted(after['item'].unique()) == sorted(before['item'].unique())
+    assert len(after) == len(before)
@@ -0,0 +1,67 @@
+"""
+Extraction output of the sample RAW_FILINGS must stay identical to the
+stored EXTRACTED_FILINGS json files
+"""
+import os
+import json
+import shutil
+
+import pytest
+import roman
+
+import dart_parser
+import section_index
+from compression import COMPRESSION_SUFFIXES, compress, compression_available
+from conftest import EXTRACTED_FILINGS, RAW_FILINGS, sample_filings
+
+FILINGS = sample_filings()
+
+
+def expected_json(filing):
+    with open(os.path.join(EXTRACTED_FILINGS, filing['filename'].split('.')[0] + '.json'), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def extract(filing, raw_files_folder, tmp_path, store):
+    expected = expected_json(filing)
+    extraction = dart_parser.ExtractItems(
+        remove_tables=True,
+        items_to_extract=[roman.fromRoman(key[5:]) for key in expected if key.startswith('item_')],
+        raw_files_folder=raw_files_folder,
+        extracted_files_folder=str(tmp_path / 'out'),
+        skip_extracted_filings=False,
+        metadata_db_path=store.path,
+    )
+    json_content = extraction.extract_items(filing)
+    return expected, {key: value for key, value in json_content.items() if not key.startswith('_')}
+
+
+def test_samples_found():
+    assert FILINGS
+
+
+@pytest.mark.parametrize('filing', FILINGS, ids=lambda filing: filing['filename'])
+@pytest.mark.parametrize('storage', [
+    'plain', 'indexed', 'gzip', 'gzip_indexed',
+    *[pytest.param(storage, marks=pytest.mark.skipif(not compression_available('zstd'), reason='needs zstandard'))
+      for storage in ('zstd', 'zstd_indexed')],
+])
+def test_extraction_is_unchanged(filing, storage, tmp_path, store):
+    raw_files_folder = tmp_path / 'raw'
+    raw_files_folder.mkdir()
+    source = os.path.join(RAW_FILINGS, filing['filename'])
+    compression = storage.split('_')[0]
+    if compression in COMPRESSION_SUFFIXES:
+        path = str(raw_files_folder / (filing['filename'] + COMPRESSION_SUFFIXES[compression]))
+        with open(source, 'rb') as fin, open(path, 'wb') as fout:
+            fout.write(compress(fin.read(), compression))
+    else:
+        path = str(raw_files_folder / filing['filename'])
+        shutil.copyfile(source, path)
+    if storage.endswith('indexed'):
+        section_index.build_index(path)
+
+    expected, extracted = extract(filing, str(raw_files_folder), tmp_path, store)
+    assert list(extracted) == list(expected)
+    for key in expected:
+        assert extracted[key] == expected[key], key
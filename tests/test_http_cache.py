@@ -0,0 +1,148 @@
+import os
+import zlib
+
+import pytest
+import requests
+from requests.structures import CaseInsensitiveDict
+
+import http_cache
+import utils
+from http_cache import ResponseCache, is_cacheable
+
+VIEWER = 'http://dart.fss.or.kr/report/viewer.do'
+LIST = 'https://opendart.fss.or.kr/api/list.json'
+CORP_CODE = 'https://opendart.fss.or.kr/api/corpCode.xml'
+
+
+def response(content: bytes, status_code: int = 200, content_type: str = 'text/html; charset=utf-8'):
+    r = requests.Response()
+    r.status_code = status_code
+    r._content = content
+    r.encoding = 'utf-8'
+    r.headers = CaseInsensitiveDict({'Content-Type': content_type, 'Set-Cookie': 'x'})
+    return r
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(http_cache.time, 'time', lambda: now[0])
+    return now
+
+
+@pytest.mark.parametrize('content, status_code, cacheable', [
+    (b'<html>section</html>', 200, True),
+    (b'<html>error</html>', 500, False),
+    (b'', 404, False),
+    (b'{"status":"000","message":"OK","list":[]}', 200, True),
+    (b'{"status": "013", "message": "no data"}', 200, True),
+    (b'{"status":"020","message":"rate limited"}', 200, False),
+    (b'{"status":"010","message":"unregistered key"}', 200, False),
+])
+def test_is_cacheable(content, status_code, cacheable):
+    assert is_cacheable(response(content, status_code)) is cacheable
+
+
+def test_round_trip(tmp_path):
+    cache = ResponseCache(str(tmp_path), 1 << 20)
+    cache.put(VIEWER, {'rcpNo': '1', 'eleId': 2}, response('<p>한글</p>'.encode()))
+    cached = cache.get(VIEWER, {'eleId': '2', 'rcpNo': 1})
+    assert cached.status_code == 200 and cached.text == '<p>한글</p>'
+    assert cached.headers['content-type'] == 'text/html; charset=utf-8'
+    # 저장하지 않는 헤더
+    assert 'Set-Cookie' not in cached.headers
+    assert cache.get(VIEWER, {'rcpNo': '1', 'eleId': '3'}) is None
+
+
+def test_api_key_is_not_part_of_the_key(tmp_path):
+    cache = ResponseCache(str(tmp_path), 1 << 20)
+    cache.put(LIST, {'crtfc_key': 'a', 'page_no': 1}, response(b'{"status":"000"}'))
+    assert cache.get(LIST, {'crtfc_key': 'b', 'page_no': 1}) is not None
+
+
+def test_ttl(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path), 1 << 20)
+    cache.put(LIST, {'page_no': 1}, response(b'{"status":"000"}'))
+    cache.put(VIEWER, {'rcpNo': '1'}, response(b'<html/>'))
+    clock[0] += 24 * 60 * 60 - 1
+    assert cache.get(LIST, {'page_no': 1}) is not None
+    clock[0] += 2
+    assert cache.get(LIST, {'page_no': 1}) is None
+    # viewer.do 는 만료되지 않음
+    clock[0] += 365 * 24 * 60 * 60
+    assert cache.get(VIEWER, {'rcpNo': '1'}) is not None
+
+
+def test_ttl_zero_is_not_cached(tmp_path):
+    cache = ResponseCache(str(tmp_path), 1 << 20)
+    cache.put(CORP_CODE, None, response(b'PK...'))
+    assert cache.get(CORP_CODE) is None
+    assert cache.total_bytes == 0
+
+
+def test_custom_ttl(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path), 1 << 20, ttl={r'/report/viewer\.do': 10})
+    cache.put(VIEWER, None, response(b'<html/>'))
+    clock[0] += 11
+    assert cache.get(VIEWER) is None
+    # 설정에 없는 엔드포인트는 캐시하지 않음
+    cache.put(LIST, None, response(b'{"status":"000"}'))
+    assert cache.get(LIST) is None
+
+
+def test_identical_bodies_are_stored_once(tmp_path):
+    cache = ResponseCache(str(tmp_path), 1 << 20)
+    for ele_id in range(3):
+        cache.put(VIEWER, {'eleId': ele_id}, response(b'<html>same</html>'))
+    assert cache.db.execute('SELECT COUNT(*) FROM bodies').fetchone()[0] == 1
+    assert cache.total_bytes == len(zlib.compress(b'<html>same</html>', 6))
+
+
+def test_least_recently_used_are_evicted(tmp_path, clock):
+    body = lambda i: os.urandom(2000) + bytes([i])
+    size = len(zlib.compress(body(0), 6))
+    cache = ResponseCache(str(tmp_path), 3 * size + 10)
+    for ele_id in range(3):
+        clock[0] += 1
+        cache.put(VIEWER, {'eleId': ele_id}, response(body(ele_id)))
+    clock[0] += 1
+    assert cache.get(VIEWER, {'eleId': 0}) is not None  # 0 을 최근에 사용
+    clock[0] += 1
+    cache.put(VIEWER, {'eleId': 3}, response(body(3)))
+
+    assert cache.get(VIEWER, {'eleId': 1}) is None
+    assert all(cache.get(VIEWER, {'eleId': ele_id}) is not None for ele_id in (0, 2, 3))
+    assert cache.total_bytes <= cache.max_bytes
+    assert sum(len(files) for _, _, files in os.walk(tmp_path / 'bodies')) == 3
+
+
+def test_cache_is_persistent(tmp_path):
+    ResponseCache(str(tmp_path), 1 << 20).put(VIEWER, None, response(b'<html/>'))
+    cache = ResponseCache(str(tmp_path), 1 << 20)
+    assert cache.get(VIEWER).content == b'<html/>'
+    assert cache.total_bytes > 0
+
+
+def test_cache_is_opened_on_first_use(tmp_path):
+    cache_dir = tmp_path / 'http'
+    try:
+        utils.configure_cache(cache_dir=str(cache_dir))
+        assert not cache_dir.exists()
+        assert utils.get_cache() is utils.get_cache()
+        assert (cache_dir / 'index.sqlite').exists()
+        utils.configure_cache(enabled=False)
+        assert utils.get_cache() is None
+    finally:
+        utils.configure_cache(enabled=False)
+
+
+def test_open_ended_period_is_not_cached(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path), 1 << 20)
+    today = http_cache.time.strftime('%Y%m%d')
+    params = {'bgn_de': '20230401', 'end_de': today, 'page_no': 1}
+    cache.put(LIST, params, response(b'{"status":"000"}'))
+    assert cache.get(LIST, params) is None
+    # 끝난 기간은 그대로 캐시
+    params['end_de'] = '20230701'
+    cache.put(LIST, params, response(b'{"status":"000"}'))
+    assert cache.get(LIST, params) is not None
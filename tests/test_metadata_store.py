@@ -0,0 +1,63 @@
+import pandas as pd
+
+import metadata_store
+from conftest import RAW_FILINGS
+
+
+def filing_rows(rcept_no, filename, n_sections=2):
+    return pd.DataFrame({
+        'title': [f'{i}. 섹션' for i in range(n_sections)],
+        'url': [f'http://dart.fss.or.kr/report/viewer.do?rcpNo={rcept_no}&dcmNo=1&eleId={i}' for i in range(n_sections)],
+        'rcept_no': rcept_no, 'corp_code': '00000001', 'corp_name': '테스트', 'stock_code': '000001',
+        'rcept_dt': rcept_no[:8], 'filing_types': 'A001', 'filename': filename,
+    })
+
+
+def test_downloaded_rcept_nos(tmp_path, store):
+    raw = tmp_path / 'raw'
+    raw.mkdir()
+    store.upsert_filing(filing_rows('20230101000001', 'a.html'))
+    store.upsert_filing(filing_rows('20230101000002', 'b.html'))
+    store.upsert_filing(filing_rows('20230101000003', 'c.html'))
+    (raw / 'a.html').write_text('a')
+    # 압축해 저장한 공시도 받은 것으로 봄
+    (raw / 'b.html.gz').write_bytes(b'')
+    (raw / 'unrelated.html').write_text('x')
+    assert store.downloaded_rcept_nos(str(raw)) == {'20230101000001', '20230101000002'}
+
+
+def test_plan_downloads(tmp_path, store):
+    raw = tmp_path / 'raw'
+    raw.mkdir()
+    store.upsert_filing(filing_rows('20230101000001', 'a.html'))
+    store.upsert_filing(filing_rows('20230101000002', 'b.html'))
+    (raw / 'a.html').write_text('a')
+    indices = pd.DataFrame({'rcept_no': ['20230101000001', '20230101000002', '20230101000003'],
+                            'corp_name': ['a', 'b', 'c']})
+    planned = metadata_store.plan_downloads(indices, store, str(raw))
+    # b 는 store 에는 있지만 파일이 없고, c 는 store 에 없음
+    assert list(planned['rcept_no']) == ['20230101000002', '20230101000003']
+    assert list(planned.columns) == list(indices.columns)
+
+
+def test_plan_downloads_of_sample_filings(store):
+    filings = store.filings()
+    planned = metadata_store.plan_downloads(filings, store, RAW_FILINGS)
+    downloaded = set(filings['rcept_no']) - set(planned['rcept_no'])
+    assert downloaded == store.downloaded_rcept_nos(RAW_FILINGS)
+    assert len(downloaded) == 4
+
+
+def test_upsert_filing_replaces_sections(store):
+    store.upsert_filing(filing_rows('20230101000001', 'a.html', n_sections=3))
+    store.upsert_filing(filing_rows('20230101000001', 'a.html', n_sections=2))
+    sections = store.get_sections('20230101000001')
+    assert list(sections['seq']) == [0, 1]
+    assert list(sections['ele_id']) == ['0', '1']
+
+
+def test_watermarks(store):
+    assert store.get_watermark('2023_QTR1.csv') is None
+    store.set_watermark('2023_QTR1.csv', '20230101000002', '20230101', complete=False)
+    watermark = store.get_watermark('2023_QTR1.csv')
+    assert watermark['rcept_dt'] == '20230101' and not watermark['complete']
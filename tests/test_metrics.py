@@ -0,0 +1,36 @@
+"""
+Metrics of the extraction workers, added up in the parent
+"""
+import os
+import sys
+import subprocess
+
+import pandas as pd
+
+import dart_parser
+from conftest import ROOT, sample_filings
+from metrics import metrics
+
+
+def test_worker_metrics_are_counted_once(tmp_path, store):
+    filings = pd.DataFrame(sample_filings()[:4])
+    kwargs = dict(remove_tables=True, items_to_extract=['1', '2'], raw_files_folder=os.path.join(ROOT, 'datasets', 'RAW_FILINGS'),
+                  extracted_files_folder=str(tmp_path), skip_extracted_filings=False, metadata_db_path=store.path)
+    metrics.reset()
+    metrics.incr('before_extraction', 5)
+    processed = dart_parser.extract_filings(filings, kwargs, workers=2, chunksize=1)
+
+    counters = metrics.snapshot()['counters']
+    # 부모의 값이 worker 마다 다시 더해지지 않아야 함
+    assert counters['before_extraction'] == 5
+    assert counters['filings_extracted'] == sum(processed) == len(filings)
+    assert metrics.snapshot()['timers']['process_filing']['calls'] == len(filings)
+    metrics.reset()
+
+
+def test_import_outside_the_repository(tmp_path):
+    code = 'import metrics; metrics.metrics.incr("x"); print(metrics.get_config())'
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    out = subprocess.run([sys.executable, '-c', code], cwd=str(tmp_path), env=env,
+                         capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == '{}'
@@ -0,0 +1,133 @@
+import time
+import threading
+import multiprocessing
+
+import pytest
+import requests
+from requests.structures import CaseInsensitiveDict
+
+import rate_limiter
+import utils
+from fixtures import FixtureStore
+from rate_limiter import SharedLimiter, SlidingWindow, TokenBucket
+from stub_server import StubOptions, serve
+
+
+def acquire_from_threads(limiter, n_threads, per_thread):
+    """
+    :return: sorted times at which the requests were allowed
+    """
+    times = []
+    lock = threading.Lock()
+
+    def worker():
+        for _ in range(per_thread):
+            limiter.acquire()
+            with lock:
+                times.append(time.monotonic())
+
+    threads = [threading.Thread(target=worker) for _ in range(n_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sorted(times)
+
+
+def max_in_window(times, window):
+    return max(sum(1 for t in times[i:] if t - start < window) for i, start in enumerate(times))
+
+
+def test_token_bucket_rate(monkeypatch):
+    limiter = TokenBucket(rate=20, burst=2)
+    times = acquire_from_threads(limiter, n_threads=8, per_thread=5)
+    # burst 2 개 이후 초당 20 회
+    assert times[-1] - times[0] == pytest.approx((40 - 2) / 20, rel=0.15)
+    assert max_in_window(times, 0.5) <= 0.5 * 20 + 2
+    assert limiter.stats.as_dict()['acquired'] == 40
+
+
+def test_sliding_window_limit():
+    limiter = SlidingWindow(limit=5, window=0.25)
+    times = acquire_from_threads(limiter, n_threads=4, per_thread=5)
+    assert max_in_window(times, 0.25) <= 5
+    assert times[-1] - times[0] >= 3 * 0.25 * 0.9
+
+
+def test_backoff_pauses_every_caller():
+    limiter = TokenBucket(rate=1000, burst=10)
+    limiter.backoff(0.3)
+    start = time.monotonic()
+    acquire_from_threads(limiter, n_threads=3, per_thread=1)
+    assert time.monotonic() - start >= 0.28
+    assert limiter.stats.as_dict()['backoffs'] == 1
+
+
+def _acquire_shared(lock_dir, key, rate, n, queue):
+    rate_limiter.LOCK_DIR = lock_dir
+    limiter = SharedLimiter(key, rate)
+    for _ in range(n):
+        limiter.acquire()
+        queue.put(time.time())
+
+
+@pytest.mark.skipif(rate_limiter.fcntl is None, reason='needs fcntl')
+def test_shared_limiter_spaces_requests_across_processes(tmp_path):
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    processes = [context.Process(target=_acquire_shared, args=(str(tmp_path), 'test', 20, 8, queue))
+                 for _ in range(3)]
+    for process in processes:
+        process.start()
+    times = sorted(queue.get(timeout=60) for _ in range(24))
+    for process in processes:
+        process.join()
+    # 세 프로세스를 합쳐 초당 20 회, 요청 사이 간격은 1 / rate
+    # (sleep 에서 깨어나는 시각의 오차만큼 여유를 둠)
+    assert times[-1] - times[0] == pytest.approx(23 / 20, rel=0.1)
+    assert min(b - a for a, b in zip(times, times[1:])) >= 0.6 / 20
+
+
+def response(content, status_code=200, headers=None):
+    r = requests.Response()
+    r.status_code = status_code
+    r._content = content
+    r.headers = CaseInsensitiveDict(headers or {})
+    return r
+
+
+def test_is_rate_limited():
+    assert rate_limiter.is_rate_limited(response(b'', 429))
+    assert rate_limiter.is_rate_limited(response(b'', 503))
+    assert rate_limiter.is_rate_limited(response(b'{"status": "020", "message": "limit"}'))
+    assert rate_limiter.is_rate_limited(response(b'<result><status>020</status></result>'))
+    assert not rate_limiter.is_rate_limited(response(b'{"status":"000"}'))
+    assert not rate_limiter.is_rate_limited(response(b'', 404))
+
+
+def test_retry_delay():
+    assert rate_limiter.retry_delay(response(b'', 429, {'Retry-After': '3'}), 0) == 3
+    assert rate_limiter.retry_delay(response(b'', 429, {'Retry-After': '600'}), 0) == rate_limiter.BACKOFF_MAX
+    assert rate_limiter.retry_delay(response(b'', 503), 2) == rate_limiter.BACKOFF_BASE * 4
+
+
+def test_make_api_call_retries_rate_limited_requests(tmp_path, monkeypatch):
+    url = 'https://opendart.fss.or.kr/api/list.json'
+    FixtureStore(str(tmp_path)).put(url, {'page_no': 1}, response(
+        b'{"status":"000","list":[]}', headers={'Content-Type': 'application/json;charset=UTF-8'}))
+    monkeypatch.setattr(rate_limiter, 'BACKOFF_BASE', 0.05)
+    # 서버는 초당 3 회만 받고, 클라이언트는 그보다 빠르게 보냄
+    options = StubOptions(rate_limit=3)
+    server = serve(str(tmp_path), port=0, options=options)
+    try:
+        utils.configure_base_urls({'opendart.fss.or.kr': f'http://127.0.0.1:{server.server_address[1]}'})
+        utils.configure_cache(enabled=False)
+        rate_limiter.configure({'opendart.fss.or.kr': {'rate': 100.0, 'burst': 10}})
+        responses = [utils.make_api_call(url, {'page_no': 1, 'crtfc_key': 'k'}) for _ in range(6)]
+    finally:
+        server.shutdown()
+        utils.configure_base_urls({})
+        rate_limiter.configure(rate_limiter.DEFAULT_LIMITS)
+    assert all(r.json()['status'] == '000' for r in responses)
+    stats = options.stats()['paths']['/api/list.json']
+    assert stats['200'] == 6 and stats.get('rate_limited', 0) > 0
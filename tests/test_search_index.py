@@ -0,0 +1,97 @@
+"""
+Search hits over the sample EXTRACTED_FILINGS must agree with counting the
+occurrences in the item texts directly
+"""
+import random
+
+import pytest
+
+import search_index
+from conftest import EXTRACTED_FILINGS
+from sinks import iter_records
+
+QUERIES = ['양극재', '바이오', '위탁생산 CDMO', '"주요 제품"', '삼성', '의', '매출액', 'zzz', 'LG에너지솔루션']
+
+
+def occurrences(text: str, term: str) -> int:
+    # str.count 와 달리 겹치는 위치도 셈 (색인도 모든 시작 위치를 찾음)
+    count, pos = 0, text.find(term)
+    while pos != -1:
+        count += 1
+        pos = text.find(term, pos + 1)
+    return count
+
+
+@pytest.fixture(scope='module')
+def texts():
+    return {(record['filename'], key[5:]): search_index.normalize(value).lower()
+            for record in iter_records(EXTRACTED_FILINGS) for key, value in record.items() if key.startswith('item_')}
+
+
+@pytest.fixture(scope='module')
+def index(tmp_path_factory, texts):
+    # 작은 segment 로 여러 번 merge 되도록 함
+    path = str(tmp_path_factory.mktemp('search') / 'index.sqlite')
+    with search_index.SearchIndex(path, segment_chars=300_000, max_segments=3) as index:
+        index.update(iter_records(EXTRACTED_FILINGS))
+        yield index
+
+
+def expected_hits(texts, query):
+    terms = [search_index.normalize(term).lower() for term in search_index._split_query(query)]
+    return {key: sum(occurrences(text, term) for term in terms)
+            for key, text in texts.items() if all(term in text for term in terms)}
+
+
+def search_hits(index, query):
+    return {(result['filename'], result['item']): result['matches'] for result in index.search(query, limit=1000)}
+
+
+def random_queries(texts, n=300, seed=0):
+    rng = random.Random(seed)
+    keys = sorted(key for key, text in texts.items() if text)
+    queries = []
+    while len(queries) < n:
+        text = texts[rng.choice(keys)]
+        length = rng.randint(1, 4)
+        start = rng.randrange(max(1, len(text) - length))
+        # 앞뒤 공백은 검색어에서 지워지므로 뺌
+        term = text[start:start + length].strip()
+        if term and '"' not in term:
+            queries.append(f'"{term}"')
+    return queries
+
+
+@pytest.mark.parametrize('query', QUERIES)
+def test_search_matches_brute_force(index, texts, query):
+    assert search_hits(index, query) == expected_hits(texts, query)
+
+
+def test_last_character_of_an_item_is_found(index, texts):
+    for text in texts.values():
+        if text.strip():
+            query = f'"{text[-1]}"'
+            assert search_hits(index, query) == expected_hits(texts, query), query
+
+
+def test_random_substrings(index, texts):
+    mismatched = [query for query in random_queries(texts) if search_hits(index, query) != expected_hits(texts, query)]
+    assert not mismatched
+
+
+def test_snippets_mark_the_match(index):
+    results = index.search('양극재', limit=1)
+    assert results and all('[양극재]' in snippet for snippet in results[0]['snippets'])
+
+
+def test_changed_item_replaces_the_old_document(index, texts):
+    record = next(iter(iter_records(EXTRACTED_FILINGS)))
+    record = {key: value for key, value in record.items() if key != '_extraction'}
+    item = next(key for key in record if key.startswith('item_'))
+    record[item] = record[item] + ' 완전히새로운단어'
+    assert index.update([record])['replaced'] == 1
+    assert [(result['filename'], result['item']) for result in index.search('완전히새로운단어')] == \
+           [(record['filename'], item[5:])]
+    # 예전 문서는 검색되지 않음
+    assert sum(hits for key, hits in search_hits(index, '양극재').items()) == \
+           sum(hits for hits in expected_hits(texts, '양극재').values())
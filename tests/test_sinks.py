@@ -0,0 +1,107 @@
+import os
+import json
+import time
+
+import pytest
+
+from compression import compression_available
+from sinks import MANIFEST_SUFFIX, iter_records, load_items, open_sink, read_manifest
+from tables import parquet_available
+
+FORMATS = [
+    ('json', None),
+    ('jsonl', None),
+    ('jsonl', 'gzip'),
+    pytest.param('jsonl', 'zstd', marks=pytest.mark.skipif(not compression_available('zstd'), reason='needs zstandard')),
+    pytest.param('parquet', None, marks=pytest.mark.skipif(not parquet_available(), reason='needs pyarrow or fastparquet')),
+]
+
+
+def record(i, text='본문'):
+    return {
+        'corp_code': f'{i:08d}', 'company': f'회사{i}', 'stock_code': f'{i:06d}', 'filing_type': 'A001',
+        'filing_date': '20230315', 'ceo_name': None, 'address': None, 'induty_code': None, 'establish_date': None,
+        'item_I': f'{text} I {i}', 'item_II': f'{text} II {i}',
+        '_extraction': {'version': 1, 'items': {'item_I': {'text': str(i)}}},
+    }
+
+
+def filename(i):
+    return f'{i:06d}_A001_2023_2023{i:010d}_20230315.html'
+
+
+def items_by_filing(folder, **kwargs):
+    return {r['filename']: {k: v for k, v in r.items() if k.startswith('item_')} for r in iter_records(folder, **kwargs)}
+
+
+@pytest.mark.parametrize('output_format, compression', FORMATS)
+def test_round_trip(tmp_path, output_format, compression):
+    with open_sink(str(tmp_path), output_format, compression, shard_size=2) as sink:
+        for i in range(5):
+            sink.write(filename(i), record(i))
+
+    assert items_by_filing(str(tmp_path)) == {
+        filename(i): {'item_I': f'본문 I {i}', 'item_II': f'본문 II {i}'} for i in range(5)}
+    assert items_by_filing(str(tmp_path), items=['II']) == {filename(i): {'item_II': f'본문 II {i}'} for i in range(5)}
+    df = load_items(str(tmp_path), items=[1], columns=['corp_code'])
+    assert sorted(df.columns) == ['corp_code', 'filename', 'item', 'text']
+    assert sorted(df['text']) == [f'본문 I {i}' for i in range(5)]
+
+
+@pytest.mark.parametrize('output_format, compression', FORMATS)
+def test_previous_returns_the_extraction_record(tmp_path, output_format, compression):
+    with open_sink(str(tmp_path), output_format, compression) as sink:
+        sink.write(filename(1), record(1))
+    sink = open_sink(str(tmp_path), output_format, compression)
+    assert sink.previous(filename(1))['_extraction'] == record(1)['_extraction']
+    assert sink.previous(filename(2)) is None
+
+
+@pytest.mark.parametrize('output_format, compression', FORMATS[1:])
+def test_rewritten_filing_supersedes_older_copy(tmp_path, output_format, compression):
+    with open_sink(str(tmp_path), output_format, compression, shard_size=2) as sink:
+        sink.write(filename(1), record(1))
+        sink.write(filename(2), record(2))
+    time.sleep(0.01)
+    with open_sink(str(tmp_path), output_format, compression) as sink:
+        sink.write(filename(1), record(1, text='새 본문'))
+
+    records = list(iter_records(str(tmp_path)))
+    assert sorted(r['filename'] for r in records) == [filename(1), filename(2)]
+    assert items_by_filing(str(tmp_path))[filename(1)]['item_I'] == '새 본문 I 1'
+    assert read_manifest(str(tmp_path))[filename(1)][1] == record(1)['_extraction']
+
+
+@pytest.mark.parametrize('output_format, compression', FORMATS[1:])
+def test_unclosed_shard_is_ignored(tmp_path, output_format, compression):
+    with open_sink(str(tmp_path), output_format, compression) as sink:
+        sink.write(filename(1), record(1))
+    for path in tmp_path.glob('*' + MANIFEST_SUFFIX):
+        path.unlink()
+    assert list(iter_records(str(tmp_path))) == []
+
+
+def test_since(tmp_path):
+    with open_sink(str(tmp_path), 'json') as sink:
+        sink.write(filename(1), record(1))
+    old = time.time() - 100
+    os.utime(tmp_path / (filename(1).split('.')[0] + '.json'), (old, old))
+    since = time.time()
+    with open_sink(str(tmp_path), 'json') as sink:
+        sink.write(filename(2), record(2))
+    assert [r['filename'] for r in iter_records(str(tmp_path), since=since)] == [filename(2)]
+    assert len(list(iter_records(str(tmp_path)))) == 2
+
+
+def test_json_output_is_the_original_format(tmp_path):
+    with open_sink(str(tmp_path), 'json') as sink:
+        sink.write(filename(1), record(1))
+    with open(tmp_path / (filename(1).split('.')[0] + '.json'), encoding='utf-8') as f:
+        text = f.read()
+    assert json.loads(text) == record(1)
+    assert text.startswith('{\n    "corp_code"') and '회사1' in text
+
+
+def test_unknown_format(tmp_path):
+    with pytest.raises(ValueError):
+        open_sink(str(tmp_path), 'csv')
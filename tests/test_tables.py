@@ -0,0 +1,111 @@
+"""
+Units, numbers and spanned cells of the tables in a filing
+"""
+import math
+
+import pandas as pd
+import pytest
+
+from tables import (expand_spans, load_tables, parquet_available, parse_number, parse_unit, tables_frame,
+                    write_tables)
+
+
+@pytest.mark.parametrize('unit, scale', [
+    ('원', 1.0),
+    ('주', 1.0),
+    ('천원', 1e3),
+    ('천USD', 1e3),
+    ('만주', 1e4),
+    ('십만원', 1e5),
+    ('백만원', 1e6),
+    ('천만원', 1e7),
+    ('억원', 1e8),
+    ('십억원', 1e9),
+    ('백억원', 1e10),
+    ('천억원', 1e11),
+    ('조원', 1e12),
+    ('백분율', 1.0),
+    ('천', 1.0),
+])
+def test_parse_unit(unit, scale):
+    assert parse_unit(unit) == (unit, scale)
+
+
+def test_no_unit():
+    assert parse_unit(None) == (None, 1.0)
+    assert parse_unit('') == (None, 1.0)
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('1,234', (1234.0, False)),
+    ('1234', (1234.0, False)),
+    ('12.5', (12.5, False)),
+    ('(1,234)', (-1234.0, False)),
+    ('△5', (-5.0, False)),
+    ('▲1,000', (-1000.0, False)),
+    ('-12.5', (-12.5, False)),
+    ('22.1%', (22.1, True)),
+    ('(3.5)%', (-3.5, True)),
+])
+def test_parse_number(text, expected):
+    assert parse_number(text) == expected
+
+
+@pytest.mark.parametrize('text', ['', '-', '합계', '(1,234', '1,234)', '12,34', '1.2.3'])
+def test_not_a_number(text):
+    value, percent = parse_number(text)
+    assert math.isnan(value) and not percent
+
+
+def cell(text, rowspan=1, colspan=1):
+    return {'text': [text], 'header': False, 'rowspan': rowspan, 'colspan': colspan}
+
+
+def texts(grid):
+    return [[c['text'][0] if c else None for c in row] for row in grid]
+
+
+def test_expand_rowspan():
+    rows = [
+        [cell('a', rowspan=2), cell('b'), cell('c')],
+        [cell('d'), cell('e')],
+    ]
+    assert texts(expand_spans(rows)) == [['a', 'b', 'c'], ['a', 'd', 'e']]
+
+
+def test_expand_colspan():
+    rows = [
+        [cell('a', colspan=2), cell('b')],
+        [cell('c'), cell('d'), cell('e')],
+    ]
+    assert texts(expand_spans(rows)) == [['a', 'a', 'b'], ['c', 'd', 'e']]
+
+
+def test_expand_rowspan_and_colspan():
+    rows = [
+        [cell('a', rowspan=2, colspan=2), cell('b')],
+        [cell('c')],
+        [cell('d'), cell('e'), cell('f')],
+    ]
+    assert texts(expand_spans(rows)) == [['a', 'a', 'b'], ['a', 'a', 'c'], ['d', 'e', 'f']]
+
+
+def test_short_rows_are_padded():
+    rows = [[cell('a'), cell('b')], [cell('c')]]
+    assert texts(expand_spans(rows)) == [['a', 'b'], ['c', None]]
+    assert expand_spans([]) == []
+
+
+@pytest.mark.skipif(not parquet_available(), reason='needs pyarrow or fastparquet')
+def test_tables_parquet_round_trip(tmp_path):
+    table = {'unit': '백만원', 'rows': [[cell('구분'), cell('매출')], [cell('2023'), cell('(1,234)')]]}
+    df = pd.concat([tables_frame([table], '20230315000001', 'II'), tables_frame([table], '20230315000001', 'III')],
+                   ignore_index=True)
+    path = str(tmp_path / 'tables.parquet')
+    write_tables(df, path)
+
+    assert load_tables(path).equals(df)
+    item_ii = load_tables(path, items=['II'], columns=['text', 'value', 'scale'])
+    assert list(item_ii.columns) == ['text', 'value', 'scale']
+    assert list(item_ii['text']) == ['구분', '매출', '2023', '(1,234)']
+    assert item_ii['value'].iloc[3] * item_ii['scale'].iloc[3] == -1234e6
@@ -3,8 +3,17 @@ from datetime import datetime
 from pykrx import stock
 
 import time
-from functools import wraps
+import threading
+from urllib.parse import urlparse, urlunparse
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import rate_limiter
+from fixtures import FixtureStore
+from metrics import incr, metrics
+from http_cache import ResponseCache, is_cacheable
 
 USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/113.0.0.0 Safari/537.36"
 
@@ -27,40 +36,203 @@ def parsing_date(string):
     return year+1
 
 
-def tps_limited(tps_limit):
-    def decorator(func):
-        last_call_time = None
-        call_count = 0
-
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            nonlocal last_call_time, call_count
-
-            if last_call_time and time.time() - last_call_time < 1:
-                time.sleep(1)
-
-            response = func(*args, **kwargs)
-
-            if response.status_code == 200:
-                call_count += 1
-                if call_count >= tps_limit:
-                    last_call_time = time.time()
-                    call_count = 0
-                else:
-                    last_call_time = None
-
-            while last_call_time and time.time() - last_call_time < 1:
-                time.sleep(0.1)
-
+# 연결 재사용을 위한 공유 세션 설정
+SESSION_OPTIONS = {
+    'pool_size': 16,
+    'timeout': (5, 60),  # (connect, read)
+    'retries': 3,  # 연결 실패 / read timeout 재시도 횟수
+    'backoff': 0.5,
+    'jitter': 0.5,
+}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def configure_session(**options) -> None:
+    """
+    Updates SESSION_OPTIONS, e.g. config['http']; the shared session is
+    rebuilt on next use
+    """
+    global _session
+    with _session_lock:
+        SESSION_OPTIONS.update({k: tuple(v) if isinstance(v, list) else v for k, v in options.items()})
+        _session = None
+
+
+def get_session() -> requests.Session:
+    """
+    Keep-alive session shared by every make_api_call. Connection errors and
+    read timeouts of the (idempotent) GETs are retried with jittered backoff;
+    HTTP status based retries are handled by make_api_call
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry_options = dict(
+                total=SESSION_OPTIONS['retries'],
+                status=0,
+                allowed_methods=frozenset(['GET']),
+                backoff_factor=SESSION_OPTIONS['backoff'],
+                raise_on_status=False,
+            )
+            try:
+                retry = Retry(backoff_jitter=SESSION_OPTIONS['jitter'], **retry_options)
+            except TypeError:  # urllib3 < 2.0
+                retry = Retry(**retry_options)
+            adapter = HTTPAdapter(
+                pool_connections=4,
+                pool_maxsize=SESSION_OPTIONS['pool_size'],
+                max_retries=retry,
+            )
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers.update({
+                'User-agent': USER_AGENT,
+                'Accept-Encoding': 'gzip, deflate',
+                'Connection': 'keep-alive',
+            })
+            _session = session
+        return _session
+
+
+class CallTimings:
+    """
+    Per-endpoint request timings: `elapsed` is the time until the response
+    headers arrived (requests' Response.elapsed), `total` also includes
+    reading the body
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+
+    def record(self, url: str, elapsed: float, total: float) -> None:
+        parsed = urlparse(url)
+        endpoint = (parsed.hostname or '') + parsed.path
+        with self.lock:
+            t = self.endpoints.setdefault(endpoint, {'calls': 0, 'elapsed': 0.0, 'total': 0.0, 'max': 0.0})
+            t['calls'] += 1
+            t['elapsed'] += elapsed
+            t['total'] += total
+            t['max'] = max(t['max'], total)
+
+    def summary(self):
+        with self.lock:
+            return {endpoint: dict(t) for endpoint, t in self.endpoints.items()}
+
+    def __str__(self):
+        lines = []
+        for endpoint, t in self.summary().items():
+            lines.append(f"{endpoint}: {t['calls']} calls, avg {t['total'] / t['calls']:.3f}s "
+                         f"(headers {t['elapsed'] / t['calls']:.3f}s), max {t['max']:.3f}s")
+        return '\n'.join(lines)
+
+
+call_timings = CallTimings()
+
+# 캐시 디렉터리는 첫 요청 때 만듦 (import 만으로 파일이 생기지 않도록)
+_cache_options = None
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def configure_cache(enabled: bool = True, cache_dir: str = 'docs_cache/http', max_size_mb: int = 2048, ttl=None) -> None:
+    """
+    Enables the on-disk response cache for make_api_call, e.g. config['cache'];
+    the cache is opened on first use
+    """
+    global _cache_options, _cache
+    with _cache_lock:
+        _cache_options = (cache_dir, max_size_mb * 1024 * 1024, ttl) if enabled else None
+        _cache = None
+
+
+def get_cache():
+    """
+    :return: the ResponseCache configured by configure_cache, or None when disabled
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None and _cache_options is not None:
+            _cache = ResponseCache(*_cache_options)
+        return _cache
+
+
+# 호스트 -> 대신 요청할 base url, e.g. {"opendart.fss.or.kr": "http://127.0.0.1:8765"} (stub_server)
+BASE_URLS = {}
+
+
+def configure_base_urls(base_urls=None) -> None:
+    """
+    Sends the requests for a host to another server, e.g. config['base_urls'].
+    Rate limits, call timings and cache keys still use the original url
+    """
+    BASE_URLS.clear()
+    BASE_URLS.update({host: base_url.rstrip('/') for host, base_url in (base_urls or {}).items()})
+
+
+def resolve_url(url: str) -> str:
+    parsed = urlparse(url)
+    base_url = BASE_URLS.get(parsed.hostname)
+    if base_url is None:
+        return url
+    base = urlparse(base_url)
+    return urlunparse(parsed._replace(scheme=base.scheme, netloc=base.netloc, path=base.path + parsed.path))
+
+
+_recorder = None
+
+
+def configure_recorder(fixtures_dir=None) -> None:
+    """
+    Record mode: every response returned by make_api_call is also saved to
+    `fixtures_dir` (see fixtures.FixtureStore) for stub_server to replay.
+    None turns recording off
+    """
+    global _recorder
+    _recorder = FixtureStore(fixtures_dir) if fixtures_dir else None
+
+
+def make_api_call(url, params=None, headers=None):
+    """
+    GET request behind the per-host rate limiter. Retries with exponential
+    backoff (or the server's Retry-After) on 429/5xx and OpenDART status 020;
+    the backoff pauses every caller of the same host/endpoint.
+    Responses are served from / stored to the response cache when enabled
+    """
+    cache = get_cache()
+    if cache is not None:
+        cached = cache.get(url, params)
+        if cached is not None:
+            incr('http_cache_hits', endpoint=urlparse(url).path)
+            if _recorder is not None:
+                _recorder.put(url, params, cached)
+            return cached
+
+    session = get_session()
+    target = resolve_url(url)
+    endpoint = urlparse(url).path
+    for attempt in range(rate_limiter.MAX_RETRIES + 1):
+        metrics.observe('rate_limit_wait', rate_limiter.acquire(url), endpoint=endpoint)
+        start = time.time()
+        response = session.get(target, params= params, headers=headers, timeout=SESSION_OPTIONS['timeout'])
+        total = time.time() - start
+        rate_limiter.record_inflight(url, total)
+        call_timings.record(url, response.elapsed.total_seconds(), total)
+        metrics.observe('make_api_call', total, endpoint=endpoint)
+        incr('http_responses', endpoint=endpoint, status=response.status_code)
+
+        if not rate_limiter.is_rate_limited(response) or attempt == rate_limiter.MAX_RETRIES:
+            if cache is not None and is_cacheable(response):
+                cache.put(url, params, response)
+            if _recorder is not None:
+                _recorder.put(url, params, response)
             return response
+        incr('http_retries', endpoint=endpoint)
+        rate_limiter.backoff(url, rate_limiter.retry_delay(response, attempt))
 
-        return wrapper
-
-    return decorator
-
-@tps_limited(tps_limit=1)
-def make_api_call(url, params=None):
-    return requests.get(url, params= params, headers={'User-agent': USER_AGENT})
 
 def check_roman_numerals(string):
     pattern = r'\b(I{1,3}|IV|V|IX|X{1,3}|VI{0,3}|XI{0,3}|XII{0,3})\b'